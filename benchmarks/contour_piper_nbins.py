@@ -0,0 +1,58 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Sat Nov 13 09:48:26 2021
+
+@author: Jing
+
+Time the contour-filled Piper diagram against the resolution of the
+density grid. Run from the root directory of the repository:
+
+    python -m benchmarks.contour_piper_nbins
+"""
+import io
+import time
+
+import numpy as np
+import pandas as pd
+import matplotlib
+matplotlib.use('Agg')
+
+from wqchartpy import contour_piper
+
+
+def synthetic(n, seed=0):
+    """Random major-ion concentrations in mg/L."""
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({ion: rng.lognormal(mean, 0.8, n) for ion, mean in
+                       [('Ca', 4), ('Mg', 3), ('Na', 3.5), ('K', 1),
+                        ('HCO3', 5), ('Cl', 3.5), ('SO4', 4)]})
+    df['CO3'] = 0.0
+    df['Sample'] = ['sample%d' % i for i in range(n)]
+    df['Label'] = ''
+    df['Color'] = 'red'
+    df['Marker'] = 'o'
+    df['Size'] = 30
+    df['Alpha'] = 0.6
+    return df
+
+
+def timeit(df, repeat=3, **kwargs):
+    """Best time of rendering the diagram into memory."""
+    best = np.inf
+    for i in range(repeat):
+        start = time.perf_counter()
+        contour_piper.plot(df, buffer=io.BytesIO(), figformat='png', **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+if __name__ == '__main__':
+    print('%8s %8s %8s %10s' % ('samples', 'dpi', 'nbins', 'time (s)'))
+    for n in [100, 10000]:
+        df = synthetic(n)
+        for dpi in [72, 300]:
+            for nbins in [100, 250, 500, 1000, 'auto']:
+                label = nbins if nbins != 'auto' else \
+                    'auto(%d)' % contour_piper.auto_nbins(n, dpi=dpi)
+                print('%8d %8d %8s %10.2f' %
+                      (n, dpi, label, timeit(df, nbins=nbins, dpi=dpi)))
@@ -30,23 +30,26 @@ MAINTAINER = 'Jing Yang'
 MAINTAINER_EMAIL = 'jingyang@cug.edu.cn'
 LICENSE = 'GNU General Public License v3.0'
 VERSION = '0.1.9'
-PYTHON_REQUIRES = ">=3.7"
+PYTHON_REQUIRES = ">=3.9"
 
 INSTALL_REQUIRES = [
     'numpy>=1.19.2',
-    'pandas>=1.0.3',
+    'pandas>=1.5.0',
     'matplotlib>=3.3.4',
     'scipy>=1.6.2',
-    'scikit-learn>=0.23.1',
     ]
 
+EXTRAS_REQUIRE = {
+    'arrow': ['pyarrow>=7.0'],
+    }
+
 if __name__ == "__main__":
 
     from setuptools import setup, find_packages
 
     import sys
-    if sys.version_info[:2] < (3, 7):
-        raise RuntimeError("wqchartpy requires python >= 3.7.")
+    if sys.version_info[:2] < (3, 9):
+        raise RuntimeError("wqchartpy requires python >= 3.9.")
 
     setup(
         name=DISTNAME,
@@ -63,4 +66,5 @@ if __name__ == "__main__":
         include_package_data=True,
         python_requires=PYTHON_REQUIRES,
         install_requires=INSTALL_REQUIRES,
+        extras_require=EXTRAS_REQUIRE,
     )
@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 24 10:05:31 2021
+
+@author: Jing
+"""
+import io
+import os
+import asyncio
+import importlib
+import multiprocessing
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+
+from .report import DIAGRAMS
+
+# The executors the diagrams can be rendered in
+EXECUTORS = ['process', 'thread']
+
+
+def _plot(name, df, kwargs):
+    """Render a diagram, used as the task of the thread executor."""
+    module = importlib.import_module('.' + name, __package__)
+    return module.plot(df, **kwargs)
+
+
+def _plot_in_process(name, df, kwargs):
+    """Render a diagram, used as the task of the process executor.
+
+    A buffer of the caller cannot be written from another process, so the
+    figure is encoded into an empty buffer sent instead, and its bytes are
+    returned.
+    """
+    result = _plot(name, df, kwargs)
+    buffer = kwargs.get('buffer')
+    if isinstance(buffer, dict):
+        data = {sample: b.getvalue() for sample, b in buffer.items()}
+    else:
+        data = None if buffer is None else buffer.getvalue()
+    return result, data
+
+
+class AsyncRenderer(object):
+    """Render diagrams from asyncio code without blocking the event loop.
+
+    The conversion of the ions and the rendering run in an executor owned
+    by the renderer, while the event loop keeps serving other requests.
+    At most max_concurrency diagrams are rendered at a time, the other
+    requests wait for their turn. A request cancelled while waiting is
+    never rendered; a diagram already being rendered runs to completion
+    and its result is discarded.
+
+    With the default process executor, the diagrams are rendered in
+    parallel in spawned worker processes, and the data are pickled to
+    them. The thread executor avoids the copies, but the diagrams are
+    then rendered one at a time, including their encoding, see
+    `wqchartpy.rendering.style`.
+
+    Use it as an asynchronous context manager:
+
+        async with AsyncRenderer(max_concurrency=4) as renderer:
+            buffer = io.BytesIO()
+            await renderer.plot('triangle_piper', df, buffer=buffer,
+                                figformat='png')
+
+    Parameters
+    ----------
+    max_concurrency : class:`int`
+        Number of diagrams rendered at the same time. Defaults to the
+        number of CPUs.
+    executor : class:`string`
+        'process' or 'thread'.
+    """
+    def __init__(self, max_concurrency=None, executor='process'):
+        if executor not in EXECUTORS:
+            raise RuntimeError("""
+        Unknown executor: %s. Choose among %s.""" % (executor, ', '.join(EXECUTORS)))
+        self.max_concurrency = max_concurrency or os.cpu_count() or 1
+        self.executor = executor
+        self._executor = None
+        self._semaphore = None
+        self._loop = None
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc):
+        self.close()
+        return False
+
+    def _start(self):
+        if self._executor is None:
+            if self.executor == 'process':
+                context = multiprocessing.get_context('spawn')
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_concurrency, mp_context=context)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.max_concurrency,
+                    thread_name_prefix='wqchartpy')
+        # The semaphore belongs to the event loop it is used in
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            self._loop = loop
+        return loop
+
+    def close(self):
+        """Shut the executor down, cancelling the diagrams not started yet."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+            self._semaphore = None
+            self._loop = None
+
+    async def plot(self, diagram, df, **kwargs):
+        """Render a diagram.
+
+        Parameters
+        ----------
+        diagram : class:`string`
+            The name of the diagram, see `wqchartpy.report.DIAGRAMS`.
+        df : class:`pandas.DataFrame`
+            Geochemical data to draw the diagram.
+        kwargs :
+            Keyword arguments passed to the plot() function of the
+            diagram, e.g. unit, figname, buffer or return_fig.
+
+        Returns
+        -------
+        What the plot() function returns.
+        """
+        if diagram not in DIAGRAMS:
+            raise RuntimeError("""
+        Unknown diagram: %s.
+        Choose among %s.""" % (diagram, ', '.join(DIAGRAMS)))
+        loop = self._start()
+        async with self._semaphore:
+            if self.executor == 'thread':
+                return await loop.run_in_executor(
+                    self._executor, _plot, diagram, df, kwargs)
+
+            remote = dict(kwargs)
+            buffer = kwargs.get('buffer')
+            if buffer is not None:
+                remote['buffer'] = {} if isinstance(buffer, dict) else \
+                    io.BytesIO()
+            result, data = await loop.run_in_executor(
+                self._executor, _plot_in_process, diagram, df, remote)
+        # Copy the encoded figures into the buffer of the caller
+        buffer = kwargs.get('buffer')
+        if isinstance(buffer, dict):
+            for sample, value in data.items():
+                buffer[sample] = io.BytesIO(value)
+        elif buffer is not None:
+            buffer.write(data)
+        return result
+
+
+# The renderer shared by the module-level functions
+_renderer = None
+
+
+def renderer():
+    """Return the renderer shared by the module-level functions."""
+    global _renderer
+    if _renderer is None:
+        _renderer = AsyncRenderer()
+    return _renderer
+
+
+def _variant(name):
+    """Create the asynchronous variant of the plot() function of a diagram."""
+    async def plot(df, **kwargs):
+        return await renderer().plot(name, df, **kwargs)
+    plot.__name__ = plot.__qualname__ = name
+    plot.__doc__ = """Render the diagram of `wqchartpy.%s` asynchronously.
+
+    Takes the arguments of `wqchartpy.%s.plot`, see
+    `AsyncRenderer.plot`.
+    """ % (name, name)
+    return plot
+
+
+# One coroutine function per diagram, e.g. await aio.triangle_piper(df)
+for _name in DIAGRAMS:
+    globals()[_name] = _variant(_name)
@@ -0,0 +1,266 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 16 14:02:37 2021
+
+@author: Jing
+"""
+import os
+import json
+
+import numpy as np
+import pandas as pd
+
+from .chemistry import IonMatrix, IONS
+from .readers import ds, _encode, _decode
+from . import units
+
+# The columns of the archived array: the major ions in meq/L, TDS in mg/L
+# and pH
+FIELDS = IONS + ['TDS', 'pH']
+
+# The files of an archive directory
+_DATA = 'ions.f8'
+_INDEX = 'index'
+_META = 'meta.json'
+_VERSION = 2
+
+
+def _rows(df, unit):
+    """Convert the measurements of a DataFrame into archived rows.
+
+    Non-numeric cells, e.g. '<0.5' or 'n.d.', are archived as missing. TDS
+    is converted to mg/L, and must be given in a mass unit: the unit of
+    TDS in a dictionary of units, mg/L by default, or the unit of all the
+    measurements.
+    """
+    factors = units.factors(unit, IONS)
+    rows = np.full((len(df), len(FIELDS)), np.nan, dtype='<f8')
+    for i, field in enumerate(FIELDS):
+        if field in df.columns:
+            rows[:, i] = pd.to_numeric(df[field], errors='coerce').values
+    rows[:, 0:len(IONS)] *= factors
+    if 'TDS' in df.columns:
+        rows[:, len(IONS)] *= units.tds_factor(
+            unit.get('TDS', 'mg/L') if isinstance(unit, dict) else unit)
+    return rows
+
+
+def _index(df):
+    """The index of the samples: every column but the measurements."""
+    index = df[[c for c in df.columns if c not in FIELDS]].copy()
+    for column, default in [('Sample', ''), ('Site', '')]:
+        if column not in index.columns:
+            index[column] = default
+    index['Date'] = pd.to_datetime(index['Date']) if 'Date' in index.columns \
+        else pd.NaT
+    return index.reset_index(drop=True)
+
+
+def _save_index(path, index):
+    """Write the index of the samples and return its file name.
+
+    The index is stored as Parquet, or as a NumPy archive without pyarrow,
+    as the sheets cached by `wqchartpy.readers`. Neither format can execute
+    code when loaded, unlike a pickle.
+    """
+    tmp = os.path.join(path, _INDEX + '.tmp')
+    if ds is not None:
+        try:
+            index.to_parquet(tmp)
+            os.replace(tmp, os.path.join(path, _INDEX + '.parquet'))
+            return _INDEX + '.parquet'
+        except (ValueError, TypeError, NotImplementedError):
+            # e.g. numbers and text in the same column
+            pass
+    arrays = _encode(index)
+    if arrays is None:
+        raise RuntimeError("""
+        The index columns of the ion archive must hold numbers, text or dates.""")
+    with open(tmp, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(tmp, os.path.join(path, _INDEX + '.npz'))
+    return _INDEX + '.npz'
+
+
+def _load_index(path, name):
+    """Read the index of the samples written by `_save_index`."""
+    if name.endswith('.parquet'):
+        if ds is None:
+            raise RuntimeError("""
+        Reading the index of the ion archive %s requires pyarrow.
+        Install it with pip install pyarrow.""" % path)
+        return pd.read_parquet(os.path.join(path, name))
+    with np.load(os.path.join(path, name), allow_pickle=False) as archive:
+        return _decode(archive)
+
+
+class IonArchive(object):
+    """On-disk store of the major ions of a long monitoring record.
+
+    An archive is a directory holding a fixed-width float64 array of the
+    major ions in meq/L, TDS and pH, one row per sample, and an index of
+    the samples (Sample, Site, Date and the style columns). The array is
+    opened with memory mapping, so selecting a subset of the samples only
+    reads the rows it touches from disk. Use `create` to build an archive
+    and `IonArchive(path)` to open it.
+
+    A subset is returned as a DataFrame and the matching ion matrix,
+    which are passed together to the diagram functions:
+
+        archive = IonArchive('monitoring')
+        df, ions = archive.query(sites=['W1', 'W2'], start='1990-01-01')
+        triangle_piper.plot(df, unit='meq/L', ions=ions)
+
+    Parameters
+    ----------
+    path : class:`string`
+        The archive directory.
+    """
+    def __init__(self, path):
+        self.path = path
+        self._open()
+
+    def _open(self):
+        """Read the index and map the data of the archive."""
+        path = self.path
+        with open(os.path.join(path, _META)) as f:
+            meta = json.load(f)
+        if meta.get('version') != _VERSION or meta.get('fields') != FIELDS:
+            raise RuntimeError("""
+        %s is not a compatible ion archive.""" % path)
+        self.index = _load_index(path, meta['index'])
+        n = meta['rows']
+        if n > len(self.index):
+            raise RuntimeError("""
+        The index and the data of the ion archive do not match.""")
+        # Rows and index entries written after the last complete append
+        # are ignored
+        self.index = self.index.iloc[:n]
+        self.data = np.memmap(os.path.join(path, _DATA), dtype='<f8',
+                              mode='r', shape=(n, len(FIELDS))) if n else \
+            np.empty((0, len(FIELDS)), dtype='<f8')
+
+    @classmethod
+    def create(cls, path, df, unit='mg/L'):
+        """Create an archive from a DataFrame.
+
+        Parameters
+        ----------
+        path : class:`string`
+            The archive directory, which must not exist yet.
+        df : class:`pandas.DataFrame`
+            Geochemical data, in the format of the data templates with
+            optional Site and Date columns.
+        unit : class:`string` or class:`dict`
+            The unit used in df, see `wqchartpy.units`. TDS is converted
+            to mg/L and must be given in a mass unit, e.g. with
+            {'TDS': 'mg/L'} in a dictionary of units.
+        """
+        os.makedirs(path)
+        open(os.path.join(path, _DATA), 'wb').close()
+        cls._write_meta(path, 0, _save_index(
+            path, pd.DataFrame(columns=['Sample', 'Site', 'Date'])))
+        archive = cls(path)
+        archive.append(df, unit=unit)
+        return archive
+
+    @staticmethod
+    def _write_meta(path, rows, index):
+        tmp = os.path.join(path, _META + '.tmp')
+        with open(tmp, 'w') as f:
+            json.dump({'version': _VERSION, 'fields': FIELDS, 'rows': rows,
+                       'index': index}, f)
+        os.replace(tmp, os.path.join(path, _META))
+
+    def append(self, df, unit='mg/L'):
+        """Append samples to the archive.
+
+        The rows are written first and the sample count last, so an
+        interrupted append leaves the archive as it was.
+
+        Parameters
+        ----------
+        df : class:`pandas.DataFrame`
+            Geochemical data.
+        unit : class:`string` or class:`dict`
+            The unit used in df, see `wqchartpy.units`. TDS is converted
+            to mg/L and must be given in a mass unit, e.g. with
+            {'TDS': 'mg/L'} in a dictionary of units.
+        """
+        rows = _rows(df, unit)
+        index = pd.concat([self.index, _index(df)], ignore_index=True) \
+            if len(self.index) else _index(df)
+        n = len(self)
+
+        # Drop the rows of an interrupted append before writing
+        with open(os.path.join(self.path, _DATA), 'r+b') as f:
+            f.truncate(n * rows.itemsize * len(FIELDS))
+            f.seek(0, os.SEEK_END)
+            f.write(rows.tobytes())
+        name = _save_index(self.path, index)
+        self._write_meta(self.path, len(index), name)
+        # The index in the other format, if the format changed
+        for other in [_INDEX + '.parquet', _INDEX + '.npz']:
+            if other != name and os.path.exists(
+                    os.path.join(self.path, other)):
+                os.remove(os.path.join(self.path, other))
+        self._open()
+
+    def __len__(self):
+        return len(self.index)
+
+    def select(self, rows):
+        """Return the given samples as a DataFrame and an ion matrix.
+
+        Parameters
+        ----------
+        rows : class:`slice` or class:`numpy.ndarray`
+            A slice, boolean mask or integer indices of the samples.
+
+        Returns
+        -------
+        The DataFrame of the samples, with the ions in meq/L, and the
+        matching class:`wqchartpy.chemistry.IonMatrix`.
+        """
+        if not isinstance(rows, slice):
+            rows = np.asarray(rows)
+            if rows.dtype == bool:
+                rows = np.nonzero(rows)[0]
+            # Read a contiguous run of rows as a view of the mapped file
+            if len(rows) and rows[-1] - rows[0] + 1 == len(rows) and \
+                    np.all(np.diff(rows) == 1):
+                rows = slice(rows[0], rows[-1] + 1)
+        data = np.asarray(self.data[rows])
+
+        df = self.index.iloc[rows].reset_index(drop=True)
+        df = pd.concat([df, pd.DataFrame(data, columns=FIELDS)], axis=1)
+        ions = IonMatrix(data[:, 0:len(IONS)], tds=data[:, len(IONS)],
+                         ph=data[:, len(IONS) + 1])
+        return df, ions
+
+    def query(self, samples=None, sites=None, start=None, end=None):
+        """Return the samples matching all the given criteria.
+
+        Parameters
+        ----------
+        samples : class:`list`
+            Names of the samples.
+        sites : class:`list`
+            Names of the sites.
+        start, end : class:`string` or class:`datetime.datetime`
+            Bounds of the sampling dates, both included.
+
+        Returns
+        -------
+        See `select`.
+        """
+        mask = np.ones(len(self), dtype=bool)
+        if samples is not None:
+            mask &= self.index['Sample'].isin(samples).values
+        if sites is not None:
+            mask &= self.index['Site'].isin(sites).values
+        if start is not None:
+            mask &= (self.index['Date'] >= pd.Timestamp(start)).values
+        if end is not None:
+            mask &= (self.index['Date'] <= pd.Timestamp(end)).values
+        return self.select(mask)
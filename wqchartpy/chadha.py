@@ -5,30 +5,59 @@ Created on Thu Sep 16 11:36:50 2021
 @author: Jing
 """
 # Import modules
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import coordinates
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 10,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 10,
+    'figure.titlesize': 10,
+    }
 
 # Define the Chadha plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Chadha diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Chadha diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
     References
     ----------
@@ -44,23 +73,7 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed.
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        The unit used in df. Currently only mg/L and meq/L are supported. 
-        Convert the unit manually if needed.""")
-        
-    # Change default settings for figures
-    # -------------------------------------------------------------------------
-    plt.style.use('default')
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 10
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 10
-    plt.rcParams['figure.titlesize'] = 10
+    units.check(unit)
     
     # Plot background
     # -------------------------------------------------------------------------
@@ -69,8 +82,8 @@ def plot(df,
     ymin = -100
     ymax = +100
     
-    plt.figure(figsize=(8, 8))
-    ax = plt.subplot(111, aspect='equal')
+    fig = rendering.figure(figsize=(8, 8))
+    ax = fig.add_subplot(111, aspect='equal')
     
     ax.spines['left'].set_visible(False)
     ax.spines['bottom'].set_visible(False)
@@ -82,88 +95,55 @@ def plot(df,
     ax.spines['bottom'].set_position(('data', 0))
     
     # Plot the domain
-    plt.plot([xmin, xmax, xmax, xmin, xmin], [ymin, ymin, ymax, ymax, ymin],
-             linestyle='-', linewidth=1.5, color='k')
+    ax.plot([xmin, xmax, xmax, xmin, xmin], [ymin, ymin, ymax, ymax, ymin],
+            linestyle='-', linewidth=1.5, color='k')
     
-    plt.xticks([-80, -60, -40, -20, 20, 40, 60, 80],
-               ['-80', '-60', '-40', '-20', '+20', '+40', '+60', '+80'])
-    plt.yticks([-80, -60, -40, -20, 20, 40, 60, 80],
-               ['-80', '-60', '-40', '-20', '+20', '+40', '+60', '+80'])
+    ax.set_xticks([-80, -60, -40, -20, 20, 40, 60, 80],
+                  ['-80', '-60', '-40', '-20', '+20', '+40', '+60', '+80'])
+    ax.set_yticks([-80, -60, -40, -20, 20, 40, 60, 80],
+                  ['-80', '-60', '-40', '-20', '+20', '+40', '+60', '+80'])
     
     # The axis lines in the center
     ax.plot([xmin, xmax], [0, 0], linestyle='-', linewidth=1.0, color='k')
     ax.plot([0, 0], [ymin, ymax], linestyle='-', linewidth=1.0, color='k')
     
     # Labels
-    plt.text(0, ymin * 1.08, '$(Ca^{2+}+Mg^{2+})-(Na^++K^+)$' + '\nMilliequivalent percentage', 
-             ha='center', va='center', fontsize=12)
-    plt.arrow(xmin * 0.7, ymin * 1.05, 0.1 * (xmax- xmin), 0, fc='k', head_width=2, head_length=4)
-    plt.arrow(47, -105, 20, 0, fc='k', head_width=2, head_length=4)
+    ax.text(0, ymin * 1.08, '$(Ca^{2+}+Mg^{2+})-(Na^++K^+)$' + '\nMilliequivalent percentage', 
+            ha='center', va='center', fontsize=12)
+    ax.arrow(xmin * 0.7, ymin * 1.05, 0.1 * (xmax- xmin), 0, fc='k', head_width=2, head_length=4)
+    ax.arrow(47, -105, 20, 0, fc='k', head_width=2, head_length=4)
     
-    plt.text(-107.5, 0, 'Milliequivalent percentage\n' + '$(HCO_3^-+CO_3^{2-})-(Cl^-+SO_4^{2-})$', 
-             ha='center', va='center', fontsize=12, rotation=90)
-    plt.arrow(-105, -75, 0, 20, fc='k', head_width=2, head_length=4)
-    plt.arrow(-105, 50, 0, 20, fc='k', head_width=2, head_length=4)
+    ax.text(-107.5, 0, 'Milliequivalent percentage\n' + '$(HCO_3^-+CO_3^{2-})-(Cl^-+SO_4^{2-})$', 
+            ha='center', va='center', fontsize=12, rotation=90)
+    ax.arrow(-105, -75, 0, 20, fc='k', head_width=2, head_length=4)
+    ax.arrow(-105, 50, 0, 20, fc='k', head_width=2, head_length=4)
     
     # Mark the eight subfileds
-    plt.text(50, 0, '1', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(-50, 0, '2', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(0, 50, '3', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(0, -50, '4', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(50, 50, '5', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(50, -50, '6', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(-50, -50, '7', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(-50, 50, '8', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    
-    # Convert mg/L to meq/L
-    # -------------------------------------------------------------------------
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-    else:
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
-    
+    ax.text(50, 0, '1', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(-50, 0, '2', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(0, 50, '3', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(0, -50, '4', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(50, 50, '5', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(50, -50, '6', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(-50, -50, '7', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(-50, 50, '8', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'chadha')
+
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
     
-    # Calculate the percentages
-    # -------------------------------------------------------------------------
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
+    # Convert into cartesian coordinates
+    x, y = coordinates.chadha(ions=ions).values()
     
     # Plot the scatter
     # -------------------------------------------------------------------------
@@ -175,35 +155,30 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                cf = ax.scatter(100 * (cat[i, 0] +  cat[i, 1] - cat[i, 2]), 
-                           100 * (an[i, 0] - (an[i, 1] + an[i, 2])), 
-                           marker=df.at[i, 'Marker'],
-                           s=df.at[i, 'Size'], 
-                           c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                           alpha=df.at[i, 'Alpha'],
-                           label=TmpLabel, 
-                           edgecolors='black') 
-            
-            else:
-                ax.scatter(100 * (cat[i, 0] +  cat[i, 1] - cat[i, 2]), 
-                       100 * (an[i, 0] - (an[i, 1] + an[i, 2])), 
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+            vmin = np.min(df['Color'].values)
+            vmax = np.max(df['Color'].values)
+            cf = ax.scatter(x[i], y[i], 
                        marker=df.at[i, 'Marker'],
                        s=df.at[i, 'Size'], 
-                       color=df.at[i, 'Color'], 
+                       c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
                        alpha=df.at[i, 'Alpha'],
                        label=TmpLabel, 
                        edgecolors='black') 
-        except(ValueError):
-            pass
+
+        else:
+            ax.scatter(x[i], y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   label=TmpLabel, 
+                   edgecolors='black') 
             
     # Creat the legend
     if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
-        cb = plt.colorbar(cf, extend='both', spacing='uniform',
+        cb = fig.colorbar(cf, extend='both', spacing='uniform',
                           orientation='vertical', fraction=0.025, pad=0.05)
         cb.ax.set_ylabel('$TDS$' + ' ' + '$(mg/L)$', rotation=90, labelpad=-55, fontsize=14)
     
@@ -211,16 +186,11 @@ def plot(df,
               frameon=False, 
               labelspacing=0.25, handletextpad=0.25)
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Chadha plot created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Chadha plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
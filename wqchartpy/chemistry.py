@@ -0,0 +1,317 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov  8 10:12:31 2021
+
+@author: Jing
+"""
+import numpy as np
+import pandas as pd
+
+from .ions import ions_WEIGHT, ions_CHARGE, ions_GROUP, ions_CORNER, \
+    ions_FOLD, MAJOR, CATION_CORNERS, ANION_CORNERS
+from . import units
+
+# The major ions in the column order used by every diagram
+IONS = MAJOR
+CATIONS = [ion for ion in IONS if ions_CHARGE[ion] > 0]
+ANIONS = [ion for ion in IONS if ions_CHARGE[ion] < 0]
+
+# Conversion vectors and column indices, built once at import
+EQMOL = np.abs(np.array([ions_CHARGE[ion] for ion in IONS]))
+INDEX = {ion: i for i, ion in enumerate(IONS)}
+IS_CATION = np.array([ion in CATIONS for ion in IONS])
+CATION_INDEX = [INDEX[ion] for ion in CATIONS]
+ANION_INDEX = [INDEX[ion] for ion in ANIONS]
+CORNER_INDEX = {corner: [INDEX[ion] for ion in IONS
+                         if ions_CORNER[ion] == corner]
+                for corner in CATION_CORNERS + ANION_CORNERS}
+
+
+def _fold_matrix(fold):
+    """The minor species and the matrix adding them to the major ions."""
+    species = list(fold)
+    unknown = [s for s in species if s not in ions_WEIGHT or s in INDEX or
+               fold[s] not in INDEX]
+    if unknown:
+        raise RuntimeError("""
+        Cannot fold %s into the major ions.""" % ', '.join(unknown))
+    # A species adds its equivalents to a major ion of the same charge
+    mismatched = ['%s (%s) into %s (%s)' % (s, ions_GROUP[s], fold[s],
+                                            ions_GROUP[fold[s]])
+                  for s in species if ions_CHARGE[s] == 0 or
+                  ions_GROUP[s] != ions_GROUP[fold[s]]]
+    if mismatched:
+        raise RuntimeError("""
+        Cannot fold %s.
+        Only charged species are folded, cations into a cation and anions
+        into an anion.""" % ', '.join(mismatched))
+    matrix = np.zeros((len(species), len(IONS)))
+    matrix[np.arange(len(species)), [INDEX[fold[s]] for s in species]] = 1
+    return species, matrix
+
+
+# The default folding of the minor species, see wqchartpy.ions
+FOLD_SPECIES, FOLD_MATRIX = _fold_matrix(ions_FOLD)
+
+# How missing concentrations are handled: left missing, so that the
+# samples are dropped by the diagrams, set to zero, or imputed from the
+# charge balance
+MISSING_POLICIES = ['drop', 'zero', 'balance']
+
+
+class IonMatrix(object):
+    """Major-ion chemistry of a dataset, converted once and reused.
+
+    The concentrations are stored as a contiguous (n, 8) array in meq/L
+    with the columns ordered as `IONS`. The cation/anion sums and the
+    percentages used by the diagrams are computed on first access and
+    cached, so several diagrams drawn from the same dataset share a
+    single conversion.
+
+    Parameters
+    ----------
+    meqL : class:`numpy.ndarray`
+        Concentrations in meq/L, one row per sample and one column per
+        ion in `IONS`.
+    tds : class:`numpy.ndarray`
+        Total dissolved solids in mg/L, or None if not available.
+    ph : class:`numpy.ndarray`
+        pH values, or None if not available.
+    dtype : class:`numpy.dtype`
+        Floating point type of the stored arrays, float64 by default.
+        float32 halves the memory footprint of large datasets.
+        
+    Attributes
+    ----------
+    missing : class:`dict`
+        The accounting of the missing concentrations, see `fill_missing`.
+        None if the matrix was not built by `from_dataframe` or
+        `fill_missing`.
+    """
+    def __init__(self, meqL, tds=None, ph=None, dtype=np.float64):
+        self.dtype = np.dtype(dtype)
+        self.meqL = np.ascontiguousarray(meqL, dtype=self.dtype)
+        if self.meqL.ndim != 2 or self.meqL.shape[1] != len(IONS):
+            raise RuntimeError("""
+        The ion matrix must have one column for each of
+        Ca, Mg, Na, K, HCO3, CO3, Cl, and SO4.""")
+        self.tds = None if tds is None else \
+            np.ascontiguousarray(tds, dtype=self.dtype)
+        self.ph = None if ph is None else \
+            np.ascontiguousarray(ph, dtype=self.dtype)
+        self._cache = {}
+        self.missing = None
+
+    @classmethod
+    def from_dataframe(cls, df, unit='mg/L', dtype=np.float64, missing='drop',
+                       fold=None):
+        """Convert the major ions of a DataFrame into an ion matrix.
+
+        Parameters
+        ----------
+        df : class:`pandas.DataFrame`
+            Geochemical data. Ions missing from df and non-numeric cells
+            are missing concentrations.
+        unit : class:`string` or class:`dict`
+            The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+            or the unit of each ion, see `wqchartpy.units`.
+        dtype : class:`numpy.dtype`
+            Floating point type of the stored arrays.
+        missing : class:`string`
+            How the missing concentrations are handled, see `fill_missing`.
+        fold : class:`bool` or class:`dict`
+            Whether to add minor species to the major ions, e.g. NO3 to Cl,
+            as defined in `wqchartpy.ions.SPECIES` if True, or as given by
+            a dictionary, e.g. {'NO3': 'Cl', 'Fe': 'Mg'}. Minor species
+            missing from df or from a sample count as zero.
+        """
+        # Raises for unsupported units before reading the data
+        factors = units.factors(unit, IONS).astype(dtype)
+
+        dtype = np.dtype(dtype)
+        meqL = np.full((len(df), len(IONS)), np.nan, dtype=dtype)
+        for i, ion in enumerate(IONS):
+            if ion in df.columns:
+                column = df[ion]
+                if not pd.api.types.is_numeric_dtype(column):
+                    column = pd.to_numeric(column, errors='coerce')
+                meqL[:, i] = column.values
+        if np.any(factors != 1):
+            meqL *= factors
+
+        if fold:
+            species, matrix = (FOLD_SPECIES, FOLD_MATRIX) if fold is True \
+                else _fold_matrix(fold)
+            present = [i for i, name in enumerate(species)
+                       if name in df.columns]
+            if present:
+                names = [species[i] for i in present]
+                minor = np.column_stack(
+                    [pd.to_numeric(df[name], errors='coerce').values
+                     for name in names]) * units.factors(unit, names)
+                meqL += (np.nan_to_num(minor) @ matrix[present]).astype(dtype)
+
+        # Non-numeric cells are missing, as for the ions
+        tds, ph = [pd.to_numeric(df[name], errors='coerce').values
+                   if name in df.columns else None for name in ['TDS', 'pH']]
+
+        return cls(meqL, tds=tds, ph=ph, dtype=dtype).fill_missing(missing)
+
+    def __len__(self):
+        return self.meqL.shape[0]
+
+    def __getitem__(self, ion):
+        """Return the meq/L column of a single ion."""
+        return self.meqL[:, INDEX[ion]]
+
+    def _cached(self, key, func):
+        if key not in self._cache:
+            self._cache[key] = func()
+        return self._cache[key]
+
+    @property
+    def mmolL(self):
+        """Concentrations in mmol/L."""
+        return self._cached('mmolL',
+                            lambda: self.meqL / EQMOL.astype(self.dtype))
+
+    @property
+    def sumcat(self):
+        """Sum of the cations in meq/L."""
+        return self._cached('sumcat',
+                            lambda: np.sum(self.meqL[:, CATION_INDEX], axis=1))
+
+    @property
+    def suman(self):
+        """Sum of the anions in meq/L."""
+        return self._cached('suman',
+                            lambda: np.sum(self.meqL[:, ANION_INDEX], axis=1))
+
+    def _corners(self, corners, total):
+        fractions = np.empty((len(self), len(corners)), dtype=self.dtype)
+        for k, corner in enumerate(corners):
+            index = CORNER_INDEX[corner]
+            fractions[:, k] = self.meqL[:, index[0]]
+            for i in index[1:]:
+                fractions[:, k] += self.meqL[:, i]
+        fractions /= total[:, np.newaxis]
+        return fractions
+
+    @property
+    def cat(self):
+        """Cation fractions: Ca, Mg and Na+K."""
+        return self._cached('cat', lambda: self._corners(CATION_CORNERS,
+                                                         self.sumcat))
+
+    @property
+    def an(self):
+        """Anion fractions: HCO3+CO3, SO4 and Cl."""
+        return self._cached('an', lambda: self._corners(ANION_CORNERS,
+                                                        self.suman))
+
+    def select(self, names, unit='meq/L'):
+        """Return the columns of the given ions, in the given order.
+
+        Parameters
+        ----------
+        names : class:`list`
+            Names of the ions, e.g. ['Ca', 'Mg', 'Na', 'HCO3'].
+        unit : class:`string`
+            Either meq/L or mmol/L.
+        """
+        values = self.meqL if unit == 'meq/L' else self.mmolL
+        return values[:, [INDEX[name] for name in names]]
+
+    def fill_missing(self, policy='zero'):
+        """Return a new ion matrix with the missing concentrations handled.
+
+        The whole matrix is processed at once as a masked array. The
+        policies are:
+
+        * 'drop': the concentrations are left missing, so that the
+          samples are quarantined by the diagrams.
+        * 'zero': the missing concentrations are set to zero, e.g. for CO3
+          or K not analyzed because below the detection limit.
+        * 'balance': a single missing ion in a sample is imputed from the
+          charge balance, i.e. the difference between the anion and cation
+          sums, clipped at zero. Samples missing several ions are left
+          missing.
+
+        The accounting is stored in the `missing` attribute of the result:
+        the policy, the number of missing values per ion, the number of
+        values filled, the number of samples completed and the number of
+        samples still incomplete, which the diagrams drop.
+
+        Parameters
+        ----------
+        policy : class:`string`
+            One of `MISSING_POLICIES`.
+        """
+        if policy not in MISSING_POLICIES:
+            raise RuntimeError("""
+        The policy for missing concentrations must be drop, zero or balance.""")
+
+        mask = ~np.isfinite(self.meqL)
+        incomplete = mask.any(axis=1)
+        meqL = self.meqL if policy == 'drop' else self.meqL.copy()
+
+        if policy == 'zero':
+            fill = mask
+            meqL[fill] = 0
+        elif policy == 'balance':
+            # The sums of the known concentrations of each sample
+            masked = np.ma.MaskedArray(self.meqL, mask=mask, copy=False)
+            imbalance = masked[:, ANION_INDEX].sum(axis=1).filled(0) - \
+                masked[:, CATION_INDEX].sum(axis=1).filled(0)
+            fill = mask & (mask.sum(axis=1) == 1)[:, np.newaxis]
+            rows, cols = np.nonzero(fill)
+            # A missing cation makes up the excess of anions and vice versa
+            meqL[rows, cols] = np.maximum(
+                np.where(IS_CATION[cols], imbalance[rows], -imbalance[rows]),
+                0)
+        else:
+            fill = np.zeros(mask.shape, dtype=bool)
+
+        ions = IonMatrix(meqL, tds=self.tds, ph=self.ph, dtype=self.dtype)
+        completed = fill.any(axis=1)
+        ions.missing = {
+            'policy': policy,
+            'missing': dict(zip(IONS, mask.sum(axis=0).tolist())),
+            'filled': int(fill.sum()),
+            'completed': int(completed.sum()),
+            'incomplete': int((incomplete & ~completed).sum()),
+            }
+        return ions
+
+    def take(self, rows):
+        """Return a new ion matrix restricted to the given rows.
+
+        Parameters
+        ----------
+        rows : class:`numpy.ndarray`
+            Boolean mask or integer indices of the rows to keep.
+        """
+        return IonMatrix(self.meqL[rows],
+                         tds=None if self.tds is None else self.tds[rows],
+                         ph=None if self.ph is None else self.ph[rows],
+                         dtype=self.dtype)
+
+
+def ion_matrix(df, unit='mg/L', ions=None):
+    """Return ions if already converted, otherwise convert df.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`IonMatrix`
+        A previously converted ion matrix of df, or None.
+    """
+    if ions is None:
+        return IonMatrix.from_dataframe(df, unit=unit)
+    if len(ions) != len(df):
+        raise RuntimeError("""
+        The ion matrix and the DataFrame have different numbers of samples.""")
+    return ions
@@ -4,31 +4,47 @@ Created on Fri Sep 17 14:33:20 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from pylab import *
+import matplotlib.patches
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
 
 # Define the Chernoff face plotting function
+@rendering.styled(default=False)
 def plot(df, 
          unit='mg/L', 
          figname='Chernoff face', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Chernoff face.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : class:`dict`
+        If given, the figure of each sample is encoded into a 
+        class:`io.BytesIO` stored in this dictionary under the sample name, 
+        instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return a dictionary of the figures keyed by sample name. 
+        They are not saved to disk unless a buffer is given.
         
         
     References
@@ -48,47 +64,20 @@ def plot(df,
         Confirm that these parameters are provided.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'chernoff')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'],  
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4']].values
-        
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+    ions = ion_matrix(df, unit, ions)
+    meqL = ions.select(['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4'])
     
     # Calculate the percentages
     sumcat = np.sum(meqL[:, 0:4], axis=1)
     suman = np.sum(meqL[:, 4:], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
+    cat = np.zeros((meqL.shape[0], 3))
+    an = np.zeros((meqL.shape[0], 3))
     cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
     cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
     cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
@@ -98,6 +87,7 @@ def plot(df,
     
     # Plot the Chernoff faces for each sample
     # -------------------------------------------------------------------------
+    figs = {}
     Labels = []
     for i in range(len(df)):
         if (df.at[i, 'Label'] in Labels or df.at[i, 'Label'] == ''):
@@ -106,133 +96,128 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            x1 = 0.90       # height  of upper face
-            x2 = 0.40       # overlap of lower face
-            x3 = 0.53       # half of vertical size of face
-            
-            x4 = cat[i, 1]  # width of upper face, Mg
-            x5 = cat[i, 0]  # width of lower face, Ca
-            x6 = cat[i, 2]  # length of nose, Na+K
-            
-            x7 = 0.50       # vertical position of mouth
-            x8 = an[i, 2]   # curvature of mouth, SO4
-            x9 = an[i, 0]   # width of mouth, HCO3
-            
-            x10 = 0.73      # vertical position of eyes
-            x11 = 0.47      # separation of eyes
-            
-            x12 = 0.89      # slant of eyes 
-            x13 = 0.47      # eccentricity of eyes
-            x14 = an[i, 1]  # size of eyes Cl
-            x15 = 0.96      # position of pupils
-            x16 = 0.98      # vertical position of eyebrows
-            x17 = 0.22      # slant of eyebrows
-            x18 = 0.27      # size of eyebrows
-            
-            # 
-            fig = plt.figure(figsize=(3,3))
-            ax = fig.add_subplot(1,1,1,aspect='equal')
-            
-            # transform some values so that input between 0,1 yields variety of output
-            x3 = 1.9 * (x3 - 0.5)
-            x4 = x4 + 0.25
-            x5 = x5 + 0.25
-            x6 = 0.3 * (x6 + 0.01)
-            x8 = 5 * (x8 + 0.001)
-            x11 /= 5
-            x12 = 2 * (x12 - 0.5)
-            x13 += 0.05
-            x14 += 0.1
-            x15 = 0.5 * (x15 - 0.5)
-            x16 = 0.25 * x16
-            x17 = 0.5*(x17 - 0.5)
-            x18 = 0.5*(x18 + 0.1)
+        x1 = 0.90       # height  of upper face
+        x2 = 0.40       # overlap of lower face
+        x3 = 0.53       # half of vertical size of face
+
+        x4 = cat[i, 1]  # width of upper face, Mg
+        x5 = cat[i, 0]  # width of lower face, Ca
+        x6 = cat[i, 2]  # length of nose, Na+K
+
+        x7 = 0.50       # vertical position of mouth
+        x8 = an[i, 2]   # curvature of mouth, SO4
+        x9 = an[i, 0]   # width of mouth, HCO3
+
+        x10 = 0.73      # vertical position of eyes
+        x11 = 0.47      # separation of eyes
+
+        x12 = 0.89      # slant of eyes 
+        x13 = 0.47      # eccentricity of eyes
+        x14 = an[i, 1]  # size of eyes Cl
+        x15 = 0.96      # position of pupils
+        x16 = 0.98      # vertical position of eyebrows
+        x17 = 0.22      # slant of eyebrows
+        x18 = 0.27      # size of eyebrows
+
+        # 
+        fig = rendering.figure(figsize=(3,3))
+        ax = fig.add_subplot(1,1,1,aspect='equal')
+
+        # transform some values so that input between 0,1 yields variety of output
+        x3 = 1.9 * (x3 - 0.5)
+        x4 = x4 + 0.25
+        x5 = x5 + 0.25
+        x6 = 0.3 * (x6 + 0.01)
+        x8 = 5 * (x8 + 0.001)
+        x11 /= 5
+        x12 = 2 * (x12 - 0.5)
+        x13 += 0.05
+        x14 += 0.1
+        x15 = 0.5 * (x15 - 0.5)
+        x16 = 0.25 * x16
+        x17 = 0.5*(x17 - 0.5)
+        x18 = 0.5*(x18 + 0.1)
+
+        # Top of face, in box with l=-x4, r=x4, t=x1, b=x3
+        e = matplotlib.patches.Ellipse( (0,(x1+x3)/2), 2*x4, (x1-x3), 
+                                       fc='white', edgecolor='black', linewidth=2)
+        # e.set_clip_box(ax.bbox)
+        # e.set_facecolor([0,0,0])
+        ax.add_artist(e)
+
+        # Bottom of face, in box with l=-x5, r=x5, b=-x1, t=x2+x3
+        e = matplotlib.patches.Ellipse( (0,(-x1+x2+x3)/2), 2*x5, (x1+x2+x3), 
+                                       fc='white', edgecolor='black', linewidth=2)
+        ax.add_artist(e)
+
+        # Cover overlaps
+        e = matplotlib.patches.Ellipse( (0,(x1+x3)/2), 2*x4, (x1-x3), 
+                                       fc='white', edgecolor='black', ec='none')
+        ax.add_artist(e)
+        e = matplotlib.patches.Ellipse( (0,(-x1+x2+x3)/2), 2*x5, (x1+x2+x3), 
+                                       fc='white', edgecolor='black', ec='none')
+        ax.add_artist(e)
+
+        # Draw nose
+        ax.plot([0,0], [-x6/2, x6/2], 'k')
+
+        # Draw mouth
+        p = matplotlib.patches.Arc( (0,-x7+.5/x8), 1/x8, 1/x8, 
+                                   theta1=270-180/np.pi*np.arctan(x8*x9), 
+                                   theta2=270+180/np.pi*np.arctan(x8*x9))
+        ax.add_artist(p)
+
+        # Draw eyes
+        p = matplotlib.patches.Ellipse( (-x11-x14/2,x10), x14, x13*x14, 
+                                       angle=-180/np.pi*x12, 
+                                       facecolor='white', edgecolor='black')
+        ax.add_artist(p)
+
+        p = matplotlib.patches.Ellipse( (x11+x14/2,x10), x14, x13*x14, 
+                                       angle=180/np.pi*x12, 
+                                       facecolor='white', edgecolor='black')
+        ax.add_artist(p)
+
+        # Draw pupils
+        p = matplotlib.patches.Ellipse( (-x11-x14/2-x15*x14/2, x10), .05, .05, 
+                                       facecolor='black')
+        ax.add_artist(p)
+        p = matplotlib.patches.Ellipse( (x11+x14/2-x15*x14/2, x10), .05, .05, 
+                                       facecolor='black')
+        ax.add_artist(p)
+
+        # Draw eyebrows
+        ax.plot([-x11-x14/2-x14*x18/2,-x11-x14/2+x14*x18/2],
+                [x10+x13*x14*(x16+x17),x10+x13*x14*(x16-x17)],'k')
+        ax.plot([x11+x14/2+x14*x18/2,x11+x14/2-x14*x18/2],
+                [x10+x13*x14*(x16+x17),x10+x13*x14*(x16-x17)],'k')
+
+
+        # Show the lables
+        ax.text(1.3, 1.2, 'Explanation', ha='left', va='top', fontsize=12)
+        ax.text(1.3, 0.9, 'Width of upper face = Mg$^{2+}$', ha='left', va='top', fontsize=12)
+        ax.text(1.3, 0.6, 'Width of lower face = Ca$^{2+}$', ha='left', va='top', fontsize=12)
+        ax.text(1.3, 0.3, 'Length of nose = Na$^+$+K$^+$', ha='left', va='top', fontsize=12)
+        ax.text(1.3, 0.0, 'Curvature of mouth = SO$_4^{2-}$', ha='left', va='top', fontsize=12)
+        ax.text(1.3, -0.3, 'Length of mouth = HCO' + '$_3^-$', ha='left', va='top', fontsize=12)
+        ax.text(1.3, -0.6, 'Size of eyes = Cl$^-$', ha='left', va='top', fontsize=12)
+
+
+        ax.axis([-1.2, 1.2, -1.2, 1.2])
+        ax.set_xticks([])
+        ax.set_yticks([])
+
+        ax.set_title(df.at[i, 'Sample'], fontsize=14, weight='normal')
 
-            # Top of face, in box with l=-x4, r=x4, t=x1, b=x3
-            e = matplotlib.patches.Ellipse( (0,(x1+x3)/2), 2*x4, (x1-x3), 
-                                           fc='white', edgecolor='black', linewidth=2)
-            # e.set_clip_box(ax.bbox)
-            # e.set_facecolor([0,0,0])
-            ax.add_artist(e)
-        
-            # Bottom of face, in box with l=-x5, r=x5, b=-x1, t=x2+x3
-            e = matplotlib.patches.Ellipse( (0,(-x1+x2+x3)/2), 2*x5, (x1+x2+x3), 
-                                           fc='white', edgecolor='black', linewidth=2)
-            ax.add_artist(e)
-        
-            # Cover overlaps
-            e = matplotlib.patches.Ellipse( (0,(x1+x3)/2), 2*x4, (x1-x3), 
-                                           fc='white', edgecolor='black', ec='none')
-            ax.add_artist(e)
-            e = matplotlib.patches.Ellipse( (0,(-x1+x2+x3)/2), 2*x5, (x1+x2+x3), 
-                                           fc='white', edgecolor='black', ec='none')
-            ax.add_artist(e)
-            
-            # Draw nose
-            ax.plot([0,0], [-x6/2, x6/2], 'k')
-            
-            # Draw mouth
-            p = matplotlib.patches.Arc( (0,-x7+.5/x8), 1/x8, 1/x8, 
-                                       theta1=270-180/pi*arctan(x8*x9), 
-                                       theta2=270+180/pi*arctan(x8*x9))
-            ax.add_artist(p)
-            
-            # Draw eyes
-            p = matplotlib.patches.Ellipse( (-x11-x14/2,x10), x14, x13*x14, 
-                                           angle=-180/pi*x12, 
-                                           facecolor='white', edgecolor='black')
-            ax.add_artist(p)
-            
-            p = matplotlib.patches.Ellipse( (x11+x14/2,x10), x14, x13*x14, 
-                                           angle=180/pi*x12, 
-                                           facecolor='white', edgecolor='black')
-            ax.add_artist(p)
-        
-            # Draw pupils
-            p = matplotlib.patches.Ellipse( (-x11-x14/2-x15*x14/2, x10), .05, .05, 
-                                           facecolor='black')
-            ax.add_artist(p)
-            p = matplotlib.patches.Ellipse( (x11+x14/2-x15*x14/2, x10), .05, .05, 
-                                           facecolor='black')
-            ax.add_artist(p)
-            
-            # Draw eyebrows
-            ax.plot([-x11-x14/2-x14*x18/2,-x11-x14/2+x14*x18/2],
-                    [x10+x13*x14*(x16+x17),x10+x13*x14*(x16-x17)],'k')
-            ax.plot([x11+x14/2+x14*x18/2,x11+x14/2-x14*x18/2],
-                    [x10+x13*x14*(x16+x17),x10+x13*x14*(x16-x17)],'k')
-            
-            
-            # Show the lables
-            ax.text(1.3, 1.2, 'Explanation', ha='left', va='top', fontsize=12)
-            ax.text(1.3, 0.9, 'Width of upper face = Mg$^{2+}$', ha='left', va='top', fontsize=12)
-            ax.text(1.3, 0.6, 'Width of lower face = Ca$^{2+}$', ha='left', va='top', fontsize=12)
-            ax.text(1.3, 0.3, 'Length of nose = Na$^+$+K$^+$', ha='left', va='top', fontsize=12)
-            ax.text(1.3, 0.0, 'Curvature of mouth = SO$_4^{2-}$', ha='left', va='top', fontsize=12)
-            ax.text(1.3, -0.3, 'Length of mouth = HCO' + '$_3^-$', ha='left', va='top', fontsize=12)
-            ax.text(1.3, -0.6, 'Size of eyes = Cl$^-$', ha='left', va='top', fontsize=12)
-            
-            
-            ax.axis([-1.2, 1.2, -1.2, 1.2])
-            ax.set_xticks([])
-            ax.set_yticks([])
-            
-            ax.set_title(df.at[i, 'Sample'], fontsize=14, weight='normal')
-    
-        except(ValueError):
-            pass
         
-        # Display the info
-        cwd = os.getcwd()
-        print("Chernoff face created for %s. Saving it to %s\n" %(str(df.at[i, 'Sample']), cwd))
-    
-    
         # Save the figure
-        plt.savefig(figname + '_' + str(df.at[i, 'Sample']) + '.' + figformat, format=figformat, 
-                    bbox_inches='tight', dpi=300)
+        sample = str(df.at[i, 'Sample'])
+        figs[sample] = rendering.savefig(fig, figname + '_' + sample, figformat, 
+                                         "Chernoff face created for %s." %sample, 
+                                         buffer=rendering.sample_buffer(buffer, sample), 
+                                         return_fig=return_fig)
         
-    return
+    return figs if return_fig else None
 
 if __name__ == '__main__':
     # Example data
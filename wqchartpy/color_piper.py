@@ -6,91 +6,40 @@ Created on Wed Oct 22 14:07:24 2021
 """
 # Load required packages
 import os
+import functools
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from pylab import *
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import piper_background
+from . import coordinates
 
-# Define the color-coded Piper plotting function
-def plot(df, 
-         unit='mg/L', 
-         figname='color-coded Piper diagram', 
-         figformat='jpg'):
-    """Plot the color-coded Piper diagram.
-    The original color-coded Piper diagram was proposed by Peeters (2014).
-    We have updated the background color scheme such that it is more 
-    perceptually uniform.
-    
-    Parameters
-    ----------
-    df : class:`pandas.DataFrame`
-        Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
-    color: class `boolean`
-        If true, use background coloring of Piper plot.
-    alphalevel: class `double`
-        Transparency level of points. If 1, points are opaque.
-    figname : class:`string`
-        A path or file name when saving the figure.
-    figformat : class:`string`
-        The file format, e.g. 'png', 'pdf', 'svg'
-        
-    Output
-    ----------
-    dictionary with:
-        cat: [nx3] RGB triple cations
-        an:  [nx3] RGB triple anions
-        diamond: [nx3] RGB triple central diamond
-        
-    References
-    ----------
-    .. [1] Peeters, Luk. 2014.
-           A Background Color Scheme for Piper Plots to Spatially Visualize 
-           Hydrochemical Patterns
-           Groundwater 52(1).
-           https://doi.org/10.1111/gwat.12118
-    """
-    # Basic data check 
-    # -------------------------------------------------------------------------
-    # Determine if the required geochemical parameters are defined. 
-    if not {'Ca', 'Mg', 'Na', 'K', 
-            'HCO3', 'CO3', 'Cl', 'SO4'}.issubset(df.columns):
-        raise RuntimeError("""
-        Trilinear Piper diagram requires geochemical parameters:
-        Ca, Mg, Na, K, HCO3, CO3, Cl, and SO4.
-        Confirm that these parameters are provided in the input file.""")
-        
-    # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
-        
+# The bivariate colour scheme shipped with the package
+SCHEME = os.path.join(os.path.dirname(__file__), 'BivariateColourScheme.npy')
+
+# The directory where the background rasters are cached
+CACHE_DIR = os.environ.get('WQCHARTPY_CACHE', 
+                           os.path.join(os.path.expanduser('~'), '.cache', 'wqchartpy'))
+
+@functools.lru_cache(maxsize=None)
+def _colour_scheme():
+    """Load the splines of the bivariate colour scheme once."""
+    return np.load(SCHEME, allow_pickle=True, fix_imports=True, encoding='latin1').item()
+
+def _background(resolution):
+    """Evaluate the colour scheme on the background grid."""
     # Basic shape of piper plot
-    # -------------------------------------------------------------------------
-    # Define the offset between the diamond and triangle
-    alphalevel = 1.0
     offset = 0.10 
     offsety = offset * np.tan(np.pi/3)
     h = 0.5 * np.tan(np.pi/3)
     x1 = 1+2*offset
     
-    # Calculate the triangles' location 
-    ltriangle_x = np.array([0, 0.5, 1, 0])
-    ltriangle_y = np.array([0, h, 0, 0])
-    rtriangle_x = ltriangle_x + 2 * offset + 1
-    rtriangle_y = ltriangle_y
-    
-    # Calculate the diamond's location 
-    diamond_x = np.array([0.5, 1, 1.5, 1, 0.5]) + offset
-    diamond_y = h * (np.array([1, 2, 1, 0, 1])) + (offset * np.tan(np.pi/3))      
     # Array for background
-    X  = np.reshape(np.repeat(np.linspace(0, 2 + 2*offset, 1000), 1000 ), (1000, 1000), 'F' )
-    Y  = np.reshape(np.repeat(np.linspace(0, 2*h + offsety, 1000), 1000 ), (1000, 1000), 'C' )
+    X  = np.reshape(np.repeat(np.linspace(0, 2 + 2*offset, resolution), resolution), (resolution, resolution), 'F' )
+    Y  = np.reshape(np.repeat(np.linspace(0, 2*h + offsety, resolution), resolution), (resolution, resolution), 'C' )
     
     # create masks for cation, anion triangle and upper and lower diamond
     ind_cat = np.logical_or(np.logical_and(X<0.5, Y<2*h*X),
@@ -106,9 +55,7 @@ def plot(df,
     ind_d   = np.logical_or(ind_ld==1, ind_ud==1)
 
     # interpolate RGB values
-    # rgb_interp = np.load('BivariateColourScheme.npy', allow_pickle=True, fix_imports=True, encoding='latin1').item()
-    current_dir = os.path.dirname(__file__)
-    rgb_interp = np.load(os.path.join(current_dir, 'BivariateColourScheme.npy'), allow_pickle=True, fix_imports=True, encoding='latin1').item()
+    rgb_interp = _colour_scheme()
     rgba = ['R','G','B','A']
     rgba_dic = {}
     for col in rgba:
@@ -137,171 +84,74 @@ def plot(df,
         rgba_dic[col][ind_d] = np.clip(rgb_interp[col].ev(xd,yd),0,1)
 
     RGBA = np.dstack([rgba_dic[a] for a in rgba_dic])
-
-    # Plot the triangles and diamond
-    fig = plt.figure(figsize=(10,10), dpi=100)
-    ax = fig.add_subplot(111, aspect='equal', frameon=False, 
-                         xticks=[], yticks=[])
-    ax.imshow(RGBA, 
-          origin='lower',
-          extent=(0,2+2*offset,0,2*h+offsety))
-
-    ax.plot(ltriangle_x, ltriangle_y, '-k', lw=1.0)
-    ax.plot(rtriangle_x, rtriangle_y, '-k', lw=1.0)
-    ax.plot(diamond_x, diamond_y, '-k', lw=1.0)
-    
-    # Plot the dashed lines with the interval of 0.2
-    interval = 0.2
-    ticklabels = ['0', '20', '40', '60', '80', '100']
-    for i, x in enumerate(np.linspace(0, 1, int(1/interval+1))):
-        # the left triangle
-        ax.plot([x, x - x / 2.0], 
-                [0, x / 2.0 * np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the bottom ticklabels
-        if i in [1, 2, 3, 4]: 
-            ax.text(x, 0 - 0.03, ticklabels[-i-1], 
-                    ha='center', va='center')
-        ax.plot([x, (1 - x) / 2.0 + x], 
-                 [0, (1 - x) / 2.0 * np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticklabels
-        if i in [1, 2, 3, 4]:
-            ax.text((1 - x) / 2.0 + x + 0.026, 
-                    (1 - x) / 2.0 * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=-60)
-        ax.plot([x/2, 1-x/2], 
-                [x/2*np.tan(np.pi/3), x/2*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticklabels
-        if i in [1, 2, 3, 4]:
-            ax.text(x / 2 - 0.026, x / 2 * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=60)
-        
-        # the right triangle
-        ax.plot([x + 1 + 2 * offset, x - x / 2.0 + 1 + 2 * offset], 
-                [0, x / 2.0 * np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the bottom ticklabels
-        if i in [1, 2, 3, 4]:
-            ax.text(x + 1 + 2 * offset, 0 - 0.03, 
-                    ticklabels[i], ha='center', va='center')
-        ax.plot([x + 1 + 2 * offset, (1 - x) / 2.0 + x + 1 + 2 * offset],
-                 [0, (1 - x) / 2.0 * np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticklabels
-        if i in [1, 2, 3, 4]:
-            ax.text((1 - x) / 2.0 + x + 1 + 2*offset + 0.026, 
-                    (1 - x) /2.0 * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=-60)
-        ax.plot([x / 2.0 + 1 + 2 * offset, 1 - x / 2 + 1 + 2 * offset], 
-                [x / 2.0 * np.tan(np.pi/3), x / 2.0 * np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticklabels
-        if i in [1, 2, 3, 4]:
-            ax.text(x / 2.0 + 1 + 2 * offset - 0.026, 
-                    x / 2.0 * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=60)
-        
-        # the diamond
-        ax.plot([0.5 + offset + 0.5 / (1/interval) * x/interval, 1 + offset + 0.5 / (1/interval) *x/interval], 
-                 [h + offset*np.tan(np.pi/3) + 0.5/(1/interval) * x/interval * np.tan(np.pi/3), offset * np.tan(np.pi/3) + 0.5/(1/interval) * x/interval * np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the upper left and lower right ticklabels
-        if i in [1, 2, 3, 4]: 
-            ax.text(0.5 + offset +0.5/(1/interval) * x/interval  - 0.026, h + offset * np.tan(np.pi/3) + 0.5/(1/interval) * x/interval * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=60)
-            ax.text(1 + offset +0.5/(1/interval) * x/interval + 0.026, offset * np.tan(np.pi/3) + 0.5/(1/interval) * x/interval * np.tan(np.pi/3) - 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=60)
-        ax.plot([0.5 + offset + 0.5/(1/interval) * x/interval, 1 + offset + 0.5/(1/interval) * x/interval], 
-                 [h + offset * np.tan(np.pi/3) - 0.5/(1/interval) * x/interval * np.tan(np.pi/3), 2 * h + offset * np.tan(np.pi/3) - 0.5/(1/interval) * x/interval * np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the lower left and upper right ticklabels
-        if i in [1, 2, 3, 4]:  
-            ax.text(0.5 + offset + 0.5/(1/interval) * x/interval - 0.026, h + offset * np.tan(np.pi/3) - 0.5/(1/interval) * x/interval * np.tan(np.pi/3) - 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=-60)
-            ax.text(1 + offset + 0.5/(1/interval) * x/interval + 0.026, 2 * h + offset * np.tan(np.pi/3) - 0.5/(1/interval) * x/interval * np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=-60)
     
-    # Labels and title
-    plt.text(0.5, -offset, '%' + '$Ca^{2+}$', 
-             ha='center', va='center', fontsize=12)
-    plt.text(1 + 2*offset + 0.5, -offset, '%' + '$Cl^{-}$', 
-            ha='center', va='center', fontsize=12)
-    plt.text(0.25 - offset*np.cos(np.pi/30), 0.25 * np.tan(np.pi/3) + offset*np.sin(np.pi/30), '%' + '$Mg^{2+}$',  
-             ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.75 + 2*offset + offset*np.cos(np.pi/30), 0.25 * np.tan(np.pi/3) + offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(0.75 + offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Na^+$' + '+%' + '$K^+$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(1 + 2*offset + 0.25 - offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3) + offset*np.sin(np.pi/30), '%' + '$HCO_3^-$' + '+%' + '$CO_3^{2-}$',   
-              ha='center', va='center', rotation=60, fontsize=12)
+    return np.round(RGBA * 255).astype(np.uint8)
+
+@functools.lru_cache(maxsize=None)
+def background(resolution=1000):
+    """Return the RGBA raster of the background colors.
     
-    plt.text(0.5 + offset + 0.5*offset + offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$' + '+%' + '$Cl^-$',  
-              ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.5 + offset - 0.25 + offset * np.cos(np.pi/30), h + offset * np.tan(np.pi/3) + 0.25 * np.tan(np.pi/3) + offset*np.sin(np.pi/30), '%' + '$Ca^{2+}$' + '+%' + '$Mg^{2+}$', 
-              ha='center', va='center', rotation=-60, fontsize=12)
+    The splines of the colour scheme are only evaluated once per 
+    resolution. The raster is cached in memory and, as a plain uint8 
+    array, in CACHE_DIR (~/.cache/wqchartpy unless the WQCHARTPY_CACHE 
+    environment variable is set), so that later sessions load it directly.
     
-    # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
+    Parameters
+    ----------
+    resolution : class:`int`
+        Number of pixels along each axis of the raster.
     
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
+    Returns
+    -------
+    A read-only uint8 array of shape (resolution, resolution, 4).
+    """
+    # The cached file is tied to the colour scheme it was computed from
+    stat = os.stat(SCHEME)
+    fname = os.path.join(CACHE_DIR, 'color_piper_%d_%d_%d.npy' 
+                         %(resolution, stat.st_size, stat.st_mtime_ns))
+    try:
+        RGBA = np.load(fname)
+        if RGBA.shape != (resolution, resolution, 4) or RGBA.dtype != np.uint8:
+            raise ValueError
+    except (OSError, ValueError):
+        RGBA = _background(resolution)
+        # The disk cache is optional, e.g. in a read-only environment
+        try:
+            os.makedirs(CACHE_DIR, exist_ok=True)
+            tmp = fname + '.%d.tmp' %os.getpid()
+            with open(tmp, 'wb') as f:
+                np.save(f, RGBA)
+            os.replace(tmp, fname)
+        except OSError:
+            pass
+    RGBA.flags.writeable = False
+    return RGBA
+
+def colors(df=None, unit='mg/L', ions=None):
+    """Return the background colors of the samples.
     
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data. Only needed if ions is None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df. Converted from df if None.
         
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
-    
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-    
-    # Calculate the percentages
-    # -------------------------------------------------------------------------
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
-    
-    # Convert into cartesian coordinates
-    cat_x = 0.5 * (2 * cat[:, 2] + cat[:, 1])
-    cat_y = h * cat[:, 1]
-    an_x = 1 + 2 * offset + 0.5 * (2 * an[:, 2] + an[:, 1])
-    an_y = h * an[:, 1]
-    d_x = an_y / (4 * h) + 0.5 * an_x - cat_y / (4 * h) + 0.5 * cat_x
-    d_y = 0.5 * an_y + h * an_x + 0.5 * cat_y - h * cat_x
+    Returns
+    -------
+    A dictionary with the [nx3] RGB triples of the samples in the cation 
+    triangle (cat), the anion triangle (an) and the central diamond (d).
+    """
+    offset = coordinates.offset
+    h = coordinates.h
+    x1 = 1+2*offset
+    rgb_interp = _colour_scheme()
     
-    # plot data
-    plt.plot(cat_x, cat_y, '.k', alpha=alphalevel)
-    plt.plot(an_x,  an_y,  '.k', alpha=alphalevel)
-    plt.plot(d_x,    d_y,  '.k', alpha=alphalevel)
+    cat_x, cat_y, an_x, an_y, d_x, d_y = coordinates.piper(
+        df, unit=unit, ions=ions).values()
     
-    # calculate RGB values for data
     rgb_dic = {}
     rgb_dic['cat'] = np.zeros((len(cat_x),3))
     xc = 2*cat_x-(cat_y/h)-1
@@ -324,16 +174,131 @@ def plot(df,
     yd[yy<=h] = 2*xx[yy<=h] - yy[yy<=h]/h +1
     for i,col in enumerate(['R','G','B']):
         rgb_dic['d'][:,i] = np.clip(rgb_interp[col].ev(xd,yd),0,1)  
+    
+    return rgb_dic
+
+# Define the color-coded Piper plotting function
+@rendering.styled(default=False)
+def plot(df, 
+         unit='mg/L', 
+         figname='color-coded Piper diagram', 
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False,
+         resolution=1000):
+    """Plot the color-coded Piper diagram.
+    The original color-coded Piper diagram was proposed by Peeters (2014).
+    We have updated the background color scheme such that it is more 
+    perceptually uniform.
+    
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data to draw Gibbs diagram.
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
+    color: class `boolean`
+        If true, use background coloring of Piper plot.
+    alphalevel: class `double`
+        Transparency level of points. If 1, points are opaque.
+    figname : class:`string`
+        A path or file name when saving the figure.
+    figformat : class:`string`
+        The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure instead of the RGB values, see 
+        `colors`. It is not saved to disk unless a buffer is given.
+    resolution : class:`int`
+        Number of pixels along each axis of the background colors.
+        
+    Output
+    ----------
+    dictionary with:
+        cat: [nx3] RGB triple cations
+        an:  [nx3] RGB triple anions
+        d: [nx3] RGB triple central diamond
+    with one row per sample of df, in the same order, and NaN rows for 
+    the quarantined samples, see `wqchartpy.validation.validate`,
+    or the figure if return_fig is True.
+        
+    References
+    ----------
+    .. [1] Peeters, Luk. 2014.
+           A Background Color Scheme for Piper Plots to Spatially Visualize 
+           Hydrochemical Patterns
+           Groundwater 52(1).
+           https://doi.org/10.1111/gwat.12118
+    """
+    # Basic data check 
+    # -------------------------------------------------------------------------
+    # Determine if the required geochemical parameters are defined. 
+    if not {'Ca', 'Mg', 'Na', 'K', 
+            'HCO3', 'CO3', 'Cl', 'SO4'}.issubset(df.columns):
+        raise RuntimeError("""
+        Trilinear Piper diagram requires geochemical parameters:
+        Ca, Mg, Na, K, HCO3, CO3, Cl, and SO4.
+        Confirm that these parameters are provided in the input file.""")
+        
+    # Determine if the provided unit is allowed
+    units.check(unit)
         
-    # Display the info
-    cwd = os.getcwd()
-    print("Color-coded Piper plot created. Saving it to %s \n" %cwd)
+    # Basic shape of piper plot
+    # -------------------------------------------------------------------------
+    # Define the offset between the diamond and triangle
+    alphalevel = 1.0
+    offset = 0.10 
+    offsety = offset * np.tan(np.pi/3)
+    h = 0.5 * np.tan(np.pi/3)
+    
+    # The background colors, cached by resolution
+    RGBA = background(resolution)
+
+    # Plot the triangles and diamond
+    fig = rendering.figure(figsize=(10,10), dpi=100)
+    ax = fig.add_subplot(111, aspect='equal', frameon=False, 
+                         xticks=[], yticks=[])
+    ax.imshow(RGBA, 
+          origin='lower',
+          extent=(0,2+2*offset,0,2*h+offsety))
+
+    piper_background.draw(ax)
+    
+    # Quarantine the invalid samples up front, keeping their positions to
+    # return the colors of every sample of df
+    df, ions, valid = validation.clean(df, ions, 'color_piper',
+                                       return_mask=True)
+
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
+    
+    # Convert into cartesian coordinates
+    cat_x, cat_y, an_x, an_y, d_x, d_y = coordinates.piper(ions=ions).values()
+    
+    # plot data
+    ax.plot(cat_x, cat_y, '.k', alpha=alphalevel)
+    ax.plot(an_x,  an_y,  '.k', alpha=alphalevel)
+    ax.plot(d_x,    d_y,  '.k', alpha=alphalevel)
+    
+    # calculate RGB values for data, NaN for the quarantined samples
+    rgb_dic = {}
+    for key, rgb in colors(ions=ions).items():
+        rgb_dic[key] = np.full((len(valid), 3), np.nan)
+        rgb_dic[key][valid] = rgb
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
+    fig = rendering.savefig(fig, figname, figformat, 
+                            "Color-coded Piper plot created.", 
+                            buffer=buffer, return_fig=return_fig)
         
-    return(rgb_dic)
+    return fig if return_fig else rgb_dic
 
 if __name__ == '__main__':
     # Example data
@@ -4,31 +4,144 @@ Created on Wed Sep 15 14:34:07 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import piper_background
+from . import kde
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'lines.markersize': 6,
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 10,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 10,
+    'figure.titlesize': 10,
+    }
+
+def auto_nbins(n, bandwidth=0.05, dpi=300):
+    """Choose the resolution of the density grid.
+    
+    Parameters
+    ----------
+    n : class:`int`
+        Number of samples.
+    bandwidth : class:`float`
+        The bandwidth of the Gaussian kernel.
+    dpi : class:`int`
+        The resolution of the saved figure in dots per inch.
+        
+    Returns
+    -------
+    The number of grid nodes along each axis, from 50 to 1000.
+    """
+    # One grid node every two pixels across the diagram, which is about
+    # 8 inches wide in the saved figure
+    nbins = 8 * dpi / 2
+    # No finer than the density can show: 12 nodes per bandwidth, up to
+    # twice as many for large datasets, which show finer structures
+    width = 2 + 2 * piper_background.offset
+    nodes = 12 * (1 + min(n / 10000, 1))
+    nbins = min(nbins, nodes * width / bandwidth)
+    return int(np.clip(nbins, 50, 1000))
+
+def _figure():
+    """Create the figure and draw the background of the Piper diagram."""
+    # Plot background settings
+    # -------------------------------------------------------------------------
+    # Plot the traingles, diamond, grid lines and labels
+    fig = rendering.figure(figsize=(10, 10), dpi=100)
+    ax = fig.add_subplot(111, aspect='equal', frameon=False, 
+                         xticks=[], yticks=[])
+    piper_background.draw(ax)
+    
+    return fig, ax
+
+def _contours(ax, densities, nbins, levels=None):
+    """Draw the densities of the three regions and the colorbar."""
+    cmap = 'Reds'
+    if levels is None:
+        levels = [50, 50, 100]
+    else:
+        levels = [levels] * 3
+    
+    x, y = piper_background.grid(nbins)
+    masks = piper_background.masks(nbins)
+    for zz, mask, nlevels in zip(densities, masks, levels):
+        zz[~mask] = -9999
+        
+        cf = ax.contourf(x, y, zz, 
+                         levels=np.linspace(0, zz.max(), nlevels), 
+                         cmap=cmap)
+    
+    cb = ax.figure.colorbar(cf, extend='both', spacing='uniform',
+                            orientation='vertical', fraction=0.025, pad=0.05)
+    
+    cb.ax.set_ylabel('$Density$', rotation=90, labelpad=-75, fontsize=14)
+    cb.ax.set_yticks([0, zz.max()])
+    cb.ax.set_yticklabels(['Low', 'High'], fontsize=12)
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='contour-filled Piper diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False,
+         kde_method='binned',
+         nbins=500,
+         bandwidth=0.05,
+         levels=None,
+         dpi=300):
     """Plot the Piper diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
+    kde_method : class:`string`
+        The kernel density estimation method, either 'binned' (FFT on the 
+        binned samples, fast for any number of samples) or 'exact' (sum of 
+        the kernels at the grid nodes inside the diagram only, for small 
+        datasets).
+    nbins : class:`int` or class:`string`
+        Number of grid nodes along each axis for the density. If 'auto', 
+        it is chosen from the bandwidth, the number of samples and the dpi, 
+        so that quick previews at a low dpi are cheap.
+    bandwidth : class:`float`
+        The bandwidth of the Gaussian kernel.
+    levels : class:`int`
+        Number of contour levels. Defaults to 50 in the triangles and 100 
+        in the diamond.
+    dpi : class:`int`
+        The resolution of the saved figure in dots per inch.
         
         
     References
@@ -49,268 +162,31 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # mpl.rcParams['lines.linewidth'] = 1
-    mpl.rcParams['lines.markersize'] = 6
-    
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 10
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 10
-    plt.rcParams['figure.titlesize'] = 10   
-    
-    # Plot background settings
+    # Plot the background
     # -------------------------------------------------------------------------
-    # Define the offset between the diamond and traingle
-    offset = 0.10 
-    offsety = offset * np.tan(np.pi / 3.0)
-    h = 0.5 * np.tan(np.pi / 3.0)
-    
-    # Calculate the traingles' location 
-    ltriangle_x = np.array([0, 0.5, 1, 0])
-    ltriangle_y = np.array([0, h, 0, 0])
-    rtriangle_x = ltriangle_x + 2 * offset + 1
-    rtriangle_y = ltriangle_y
-    
-    # Calculate the diamond's location 
-    diamond_x = np.array([0.5, 1, 1.5, 1, 0.5]) + offset
-    diamond_y = h * (np.array([1, 2, 1, 0, 1])) + (offset * np.tan(np.pi / 3))
-    
-    # Plot the traingles and diamond
-    fig = plt.figure(figsize=(10,10), dpi=100)
-    ax = fig.add_subplot(111, aspect='equal', frameon=False, xticks=[], yticks=[])
-    ax.plot(ltriangle_x, ltriangle_y, '-k', lw=1.0)
-    ax.plot(rtriangle_x, rtriangle_y, '-k', lw=1.0)
-    ax.plot(diamond_x, diamond_y, '-k', lw=1.0)
-    
-    # Plot the lines with the interval of 20%
-    interval = 0.2
-    ticklabels = ['0', '20', '40', '60', '80', '100']
-    for i, x in enumerate(np.linspace(0, 1, int(1/interval+1))):
-        # the left traingle
-        ax.plot([x, x - x / 2.0], 
-                [0, x / 2.0 * np.tan(np.pi / 3)], 
-                'k:', lw=1.0)
-        ## the bottom ticks
-        if i in [1, 2, 3, 4]: 
-            ax.text(x, 0-0.03, ticklabels[-i-1], 
-                    ha='center', va='center')
-        ax.plot([x, (1-x)/2.0+x], 
-                 [0, (1-x)/2.0*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticks
-        if i in [1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, ticklabels[i], ha='center', va='center', rotation=-60)
-        ax.plot([x/2, 1-x/2], 
-                [x/2*np.tan(np.pi/3), x/2*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x/2 - 0.026, x/2*np.tan(np.pi/3) + 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=60)
-        
-        # the right traingle
-        ax.plot([x+1+2*offset, x-x/2.0+1+2*offset], 
-                [0, x/2.0*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the bottom ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x+1+2*offset, 0-0.03, ticklabels[i], 
-                    ha='center', va='center')
-        ax.plot([x+1+2*offset, (1-x)/2.0+x+1+2*offset],
-                 [0, (1-x)/2.0*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticks
-        if i in [1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x+1+2*offset  + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=-60)
-        ax.plot([x/2+1+2*offset, 1-x/2+1+2*offset], 
-                [x/2*np.tan(np.pi/3), x/2*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x/2+1+2*offset - 0.026, x/2*np.tan(np.pi/3) + 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=60)
-        
-        # the diamond
-        ax.plot([0.5+offset+0.5/(1/interval)*x/interval, 1+offset+0.5/(1/interval)*x/interval], 
-                 [h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3), offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the upper left and lower right
-        if i in [1, 2, 3, 4]: 
-            ax.text(0.5+offset+0.5/(1/interval)*x/interval  - 0.026, h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=60)
-        ax.plot([0.5+offset+0.5/(1/interval)*x/interval, 1+offset+0.5/(1/interval)*x/interval], 
-                 [h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3), 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the lower left and upper right
-        if i in [1, 2, 3, 4]:  
-            ax.text(0.5+offset+0.5/(1/interval)*x/interval- 0.026, h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=-60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=-60)
-    
-    # Labels and title
-    plt.text(0.5, -offset, '%' + '$Ca^{2+}$', 
-             ha='center', va='center', fontsize=12)
-    plt.text(1+2*offset+0.5, -offset, '%' + '$Cl^{-}$', 
-            ha='center', va='center', fontsize=12)
-    plt.text(0.25-offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Mg^{2+}$',  
-             ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.75+2*offset+offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(0.75+offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Na^+$' + '+%' + '$K^+$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(1+2*offset+0.25-offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$HCO_3^-$' + '+%' + '$CO_3^{2-}$',  
-              ha='center', va='center', rotation=60, fontsize=12)
-    
-    plt.text(0.5+offset+0.5*offset+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$' + '+%' + '$Cl^-$',  
-              ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.5+offset-0.25+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Ca^{2+}$' + '+%' + '$Mg^{2+}$', 
-              ha='center', va='center', rotation=-60, fontsize=12)
-    
-     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
+    fig, ax = _figure()
     
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-    
-    # Calculate the percentages
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:8], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'contour_piper')
 
-    # Convert into cartesian coordinates
-    cat_x = 0.5 * (2 * cat[:, 2] + cat[:, 1])
-    cat_y = h * cat[:, 1]
-    an_x = 1 + 2 * offset + 0.5 * (2 * an[:, 2] + an[:, 1])
-    an_y = h * an[:, 1]
-    d_x = an_y / (4 * h) + 0.5 * an_x - cat_y / (4 * h) + 0.5 * cat_x
-    d_y = 0.5 * an_y + h * an_x + 0.5 * cat_y - h * cat_x
-      
-    # Kernel density estimation
-    from sklearn.neighbors import KernelDensity
-    from matplotlib.path import Path
-    
-    nbins = 500
-    cmap = 'Reds'
-    
-    kde = KernelDensity(kernel='gaussian', 
-                        bandwidth=0.05,
-                        metric='euclidean')
-    
-    x = np.linspace(0,  1 + 2 * offset + 1, nbins)
-    y = np.linspace(0,  h * 2 + (offset * np.tan(np.pi / 3)), nbins)
-    xx, yy = np.meshgrid(x, y)
-    points = np.vstack((xx.flatten(), yy.flatten())).T
-    
-    # The left triangle
-    tupVerts = [(0, 0), 
-                (0.5, h), 
-                (1, 0), 
-                (0,0)]
-    kde.fit(np.vstack((cat_x, cat_y)).T)
-    p = Path(tupVerts)
-    grid = p.contains_points(points)
-    mask = grid.reshape(nbins, nbins).flatten()
-    
-    z = np.exp(kde.score_samples(points))
-    z[np.where(mask==False)] = -9999
-    zz = z.reshape(xx.shape)
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
     
-    plt.contourf(xx, yy, zz, 
-                 levels=np.linspace(0, z.max(), 50), 
-                 cmap=cmap)
-    
-    # The right triangle
-    tupVerts = [(1 + 2 * offset, 0), 
-                (1 + 2 * offset + 0.5, h), 
-                (2 + 2 * offset, 0), 
-                (1 + 2 * offset, 0)]
-    kde.fit(np.vstack((an_x, an_y)).T)
-    p = Path(tupVerts)
-    grid = p.contains_points(points)
-    mask = grid.reshape(nbins, nbins).flatten()
-    
-    z = np.exp(kde.score_samples(points))
-    z[np.where(mask==False)] = -9999
-    zz = z.reshape(xx.shape)
-    
-    plt.contourf(xx, yy, zz, levels=np.linspace(0, z.max(), 50), 
-                 cmap=cmap)
-    
-    # The central diamond
-    tupVerts = [(0.5 + offset, h + offset * np.tan(np.pi / 3)), 
-                (1.0 + offset, 2 * h + offset * np.tan(np.pi / 3)), 
-                (1.5 + offset, h + offset * np.tan(np.pi / 3)), 
-                (1.0 + offset, offset * np.tan(np.pi / 3)),
-                (0.5 + offset, h + offset * np.tan(np.pi / 3))]
-    kde.fit(np.vstack((d_x, d_y)).T)
-    p = Path(tupVerts)
-    grid = p.contains_points(points)
-    mask = grid.reshape(nbins, nbins).flatten()
-
-    z = np.exp(kde.score_samples(points))
-    z[np.where(mask==False)] = -9999
-    zz = z.reshape(xx.shape)
-    
-    cf = plt.contourf(xx, yy, zz, levels=np.linspace(0, z.max(), 100), 
-                      cmap=cmap)
+    # Kernel density estimation
+    if nbins == 'auto':
+        nbins = auto_nbins(len(ions), bandwidth, dpi)
     
-    cb = plt.colorbar(cf, extend='both', spacing='uniform',
-                      orientation='vertical', fraction=0.025, pad=0.05)
+    # The grid and the masks of the regions are cached by nbins
+    x, y = piper_background.grid(nbins)
+    masks = piper_background.masks(nbins)
     
-    cb.ax.set_ylabel('$Density$', rotation=90, labelpad=-75, fontsize=14)
-    cb.ax.set_yticks([0, z.max()])
-    cb.ax.set_yticklabels(['Low', 'High'], fontsize=12)
+    # The left triangle, the right triangle and the central diamond
+    densities = [kde.gaussian_kde(px, py, x, y, bandwidth, 
+                                  mask=mask, method=kde_method)
+                 for (px, py), mask in zip(piper_background.coords(ions), masks)]
+    _contours(ax, densities, nbins, levels)
     
     '''
     # Plot the scatters
@@ -322,41 +198,126 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            plt.scatter(cat_x[i], cat_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(an_x[i], an_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(d_x[i], d_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-        except(ValueError):
-                pass
+        ax.scatter(cat_x[i], cat_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(an_x[i], an_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(d_x[i], d_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
     '''
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Contour-filed Piper plot created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
+    return rendering.savefig(fig, figname, figformat, 
+                             "Contour-filed Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig, dpi=dpi)
+
+
+@rendering.styled(STYLE)
+def plot_stream(chunks, 
+                unit='mg/L', 
+                figname='contour-filled Piper diagram', 
+                figformat='jpg',
+                buffer=None,
+                return_fig=False,
+                nbins=500,
+                bandwidth=0.05,
+                levels=None,
+                dpi=300):
+    """Plot the contour-filled Piper diagram of a dataset read chunk by chunk.
+    
+    The samples of each chunk are binned onto the density grid as soon as 
+    the chunk is read, see `wqchartpy.readers.read_chunks`. The histograms 
+    are additive, so the peak memory is bounded by the size of one chunk 
+    and of the grid, whatever the size of the dataset.
+    
+    Parameters
+    ----------
+    chunks : iterable of class:`pandas.DataFrame`
+        Chunks of geochemical data, e.g. from `readers.read_chunks`.
+    unit : class:`string` or class:`dict`
+        The unit used in the chunks, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
+    figname : class:`string`
+        A path or file name when saving the figure.
+    figformat : class:`string`
+        The file format, e.g. 'png', 'pdf', 'svg'
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
+    nbins : class:`int` or class:`string`
+        Number of grid nodes along each axis for the density. As the 
+        number of samples is not known in advance, 'auto' assumes a large 
+        dataset.
+    bandwidth : class:`float`
+        The bandwidth of the Gaussian kernel.
+    levels : class:`int`
+        Number of contour levels. Defaults to 50 in the triangles and 100 
+        in the diamond.
+    dpi : class:`int`
+        The resolution of the saved figure in dots per inch.
+    """
+    # Determine if the provided unit is allowed
+    units.check(unit)
+    
+    if nbins == 'auto':
+        nbins = auto_nbins(10000, bandwidth, dpi)
+    x, y = piper_background.grid(nbins)
+    
+    # Accumulate the histograms of the three regions chunk by chunk
+    counts = [np.zeros((nbins, nbins)) for i in range(3)]
+    n = [0, 0, 0]
+    quarantine, total = [], 0
+    for df in chunks:
+        if not {'Ca', 'Mg', 'Na', 'K', 
+                'HCO3', 'CO3', 'Cl', 'SO4'}.issubset(df.columns):
+            raise RuntimeError("""
+        Trilinear Piper diagram requires geochemical parameters:
+        Ca, Mg, Na, K, HCO3, CO3, Cl, and SO4.
+        Confirm that these parameters are provided in the input file.""")
+        mask, report = validation.validate(df, 'contour_piper')
+        quarantine.append(report)
+        total += len(df)
+        df, _ = validation.take(df, mask)
+        ions = ion_matrix(df, unit)
+        for i, (px, py) in enumerate(piper_background.coords(ions)):
+            chunk_counts, chunk_n = kde.histogram(px, py, x, y)
+            counts[i] += chunk_counts
+            n[i] += chunk_n
+    if quarantine:
+        validation.warn(pd.concat(quarantine), total)
+    
+    # Plot the background
+    # -------------------------------------------------------------------------
+    fig, ax = _figure()
+    
+    # Kernel density estimation
+    densities = [kde.convolve(c, k, x, y, bandwidth, mask=mask)
+                 for c, k, mask in zip(counts, n, piper_background.masks(nbins))]
+    _contours(ax, densities, nbins, levels)
     
-    return
+    # Save the figure
+    return rendering.savefig(fig, figname, figformat, 
+                             "Contour-filed Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig, dpi=dpi)
 
 if __name__ == '__main__':
     # Example data
@@ -0,0 +1,169 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov 22 10:17:45 2021
+
+@author: Jing
+"""
+import math
+
+import numpy as np
+import pandas as pd
+
+from .chemistry import IonMatrix
+
+# Define the offset between the diamond and traingle of the Piper diagram
+offset = 0.10
+offsety = offset * np.tan(np.pi / 3.0)
+h = 0.5 * np.tan(np.pi / 3.0)
+
+# The names of the coordinates returned for each diagram
+PIPER = ['cat_x', 'cat_y', 'an_x', 'an_y', 'd_x', 'd_y']
+DUROV = ['cat_x', 'cat_y', 'an_x', 'an_y', 'tds_x', 'ph_y']
+CHADHA = ['x', 'y']
+
+
+def _ions(df, unit, ions):
+    """Return ions if given, otherwise convert df."""
+    if ions is None:
+        if df is None:
+            raise RuntimeError("""
+        Either the geochemical data or the ion matrix must be provided.""")
+        ions = IonMatrix.from_dataframe(df, unit=unit)
+    return ions
+
+
+def _result(names, arrays, df, frame):
+    """Return the coordinates as a dict of arrays or a DataFrame."""
+    coords = dict(zip(names, arrays))
+    if not frame:
+        return coords
+    index = df.index if df is not None and len(df) == len(arrays[0]) else None
+    return pd.DataFrame(coords, index=index)
+
+
+def piper(df=None, unit='mg/L', ions=None, frame=False):
+    """Return the positions of the samples in the Piper diagram.
+
+    The positions are computed with NumPy only, without rendering a
+    figure or importing matplotlib.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data. Only needed if ions is None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df. Converted from df if None.
+    frame : class:`bool`
+        If True, return a DataFrame with the index of df.
+
+    Returns
+    -------
+    The cat_x, cat_y, an_x, an_y, d_x and d_y coordinates of the samples
+    in the left triangle, the right triangle and the diamond, as a dict
+    of arrays or a DataFrame.
+    """
+    ions = _ions(df, unit, ions)
+
+    # Calculate the percentages
+    cat = ions.cat
+    an = ions.an
+
+    # Convert into cartesian coordinates
+    cat_x = 0.5 * (2 * cat[:, 2] + cat[:, 1])
+    cat_y = h * cat[:, 1]
+    an_x = 1 + 2 * offset + 0.5 * (2 * an[:, 2] + an[:, 1])
+    an_y = h * an[:, 1]
+    d_x = an_y / (4 * h) + 0.5 * an_x - cat_y / (4 * h) + 0.5 * cat_x
+    d_y = 0.5 * an_y + h * an_x + 0.5 * cat_y - h * cat_x
+
+    return _result(PIPER, [cat_x, cat_y, an_x, an_y, d_x, d_y], df, frame)
+
+
+def ph_range(ph):
+    """Return the range of the pH axis of the Durov diagram.
+
+    Parameters
+    ----------
+    ph : class:`numpy.ndarray`
+        The pH of the samples.
+    """
+    return math.floor(np.nanmin(ph)), math.ceil(np.nanmax(ph))
+
+
+def durov(df=None, unit='mg/L', ions=None, frame=False, phrange=None):
+    """Return the positions of the samples in the Durov diagram.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data, with TDS and pH. Only needed if ions is None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df. Converted from df if None.
+    frame : class:`bool`
+        If True, return a DataFrame with the index of df.
+    phrange : class:`tuple`
+        The (min, max) of the pH axis. Rounded from the pH of the samples
+        if None, as in the diagram, see `ph_range`.
+
+    Returns
+    -------
+    The cat_x, cat_y, an_x, an_y, tds_x and ph_y coordinates of the
+    samples, as a dict of arrays or a DataFrame.
+    """
+    ions = _ions(df, unit, ions)
+    if ions.tds is None or ions.ph is None:
+        raise RuntimeError("""
+        Durov diagram uses geochemical parameters TDS and pH.
+        Confirm that these parameters are provided in the input file.""")
+
+    # Calculate the percentages
+    cat = ions.cat
+    an = ions.an
+
+    # Convert into cartesian coordinates
+    minpH, maxpH = ph_range(ions.ph) if phrange is None else phrange
+
+    cat_x = -np.sin(np.pi / 3.0) * (1 - cat[:, 2] - cat[:, 0])
+    cat_y = np.sin(np.pi / 6.0) * (1 - cat[:, 2] - cat[:, 0]) + cat[:, 0]
+    an_x = np.sin(np.pi / 6.0) * (1 - an[:, 2]) + np.sin(np.pi / 6.0) * an[:, 0]
+    an_y = 1 + np.sin(np.pi / 3.0) * (1 - an[:, 2] - an[:, 0])
+    tds_x = 1 + (ions.tds / 1000 - 0) / (4 - 0) * 1.618
+    ph_y = -(ions.ph - minpH) / (maxpH - minpH) * 0.618
+
+    return _result(DUROV, [cat_x, cat_y, an_x, an_y, tds_x, ph_y], df, frame)
+
+
+def chadha(df=None, unit='mg/L', ions=None, frame=False):
+    """Return the positions of the samples in the Chadha diagram.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data. Only needed if ions is None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df. Converted from df if None.
+    frame : class:`bool`
+        If True, return a DataFrame with the index of df.
+
+    Returns
+    -------
+    The x, (Ca+Mg)-(Na+K), and y, (HCO3+CO3)-(Cl+SO4), coordinates of the
+    samples in milliequivalent percentage, as a dict of arrays or a
+    DataFrame.
+    """
+    ions = _ions(df, unit, ions)
+
+    # Calculate the percentages
+    cat = ions.cat
+    an = ions.an
+
+    x = 100 * (cat[:, 0] + cat[:, 1] - cat[:, 2])
+    y = 100 * (an[:, 0] - (an[:, 1] + an[:, 2]))
+
+    return _result(CHADHA, [x, y], df, frame)
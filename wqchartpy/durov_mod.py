@@ -4,36 +4,61 @@ Created on Wed Sep 30 20:51:33 2020
 
 @author: Jing
 """
-import os
-import math
 import numpy as np
 import pandas as pd
-import matplotlib as mpl
-import matplotlib.pyplot as plt
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import coordinates
 
-# Global plot settings
-# mpl.rcParams['lines.linewidth'] = 1
-mpl.rcParams['lines.markersize'] = 6
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Durov diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Durov diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -50,11 +75,7 @@ Cl, SO4, pH, and TDS.
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
     # Calculate the traingles' location
     h = 0.5 * np.tan(np.pi / 3.0) 
@@ -71,23 +92,8 @@ Cl, SO4, pH, and TDS.
     brectangle_x = np.array([0, 1, 1, 0, 0]) 
     brectangle_y = np.array([0, 0, -0.618, -0.618, 0]) 
     
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
-    
     # Plot the traingles and rectangles
-    fig = plt.figure(figsize=(10,10), dpi=100)
+    fig = rendering.figure(figsize=(10,10), dpi=100)
     ax = fig.add_subplot(111, aspect='equal', 
                          frameon=False, xticks=[], yticks=[])
     ax.plot(ltriangle_x, ltriangle_y, '-k', lw=1.0)
@@ -188,63 +194,16 @@ Cl, SO4, pH, and TDS.
     ax.text(0.15, 0.1, 'NaCl', ha='center', va='center', fontsize=10)
     ax.text(0.8, 0.9, 'CaHCO$_3$', ha='center', va='center', fontsize=10)
     
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'durov_mod')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                     ions_WEIGHT['Mg'], 
-                     ions_WEIGHT['Na'], 
-                     ions_WEIGHT['K'], 
-                     ions_WEIGHT['HCO3'],
-                     ions_WEIGHT['CO3'], 
-                     ions_WEIGHT['Cl'], 
-                     ions_WEIGHT['SO4'],  
-                     1,          # Faked weight for pH
-                     1000])      # Faked weight for TDS to convert mg/L to g/L
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4'], 
-                          1,         # Faked charge for pH
-                          1])        # Faked charge for TDS
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4', 'pH', 'TDS']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4', 'pH', 'TDS']].values
-    
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-    
-    # Calculate the percentages
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:8], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                     # Percentage Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                     # Percentage Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat      # Percentage Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman        # Percentage HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                       # Percentage Cl
-    an[:, 1] = meqL[:, 7] / suman                       # Percentage SO4
+    ions = ion_matrix(df, unit, ions)
     
     # Convert into cartesian coordinates
-    minpH = math.floor(np.min(meqL[:, 8]))
-    maxpH = math.ceil(np.max(meqL[:, 8]))
-    
-    cat_x = -np.sin(np.pi / 3.0) * (1 -  cat[:, 2] - cat[:, 0])
-    cat_y = np.sin(np.pi / 6.0) * (1 -  cat[:, 2] - cat[:, 0]) + cat[:, 0]
-    an_x = np.sin(np.pi / 6.0) * (1 - an[:, 2]) + np.sin(np.pi / 6.0) * an[:, 0] 
-    an_y = 1 + np.sin(np.pi / 3.0) * (1 - an[:, 2] - an[:, 0])
-    tds_x = 1 + (meqL[:, 9] - 0) / (4 - 0) * 1.618
-    ph_y = -(meqL[:, 8] - minpH) / (maxpH - minpH) * 0.618
+    minpH, maxpH = coordinates.ph_range(ions.ph)
+    cat_x, cat_y, an_x, an_y, tds_x, ph_y = coordinates.durov(
+        ions=ions, phrange=(minpH, maxpH)).values()
     
     # Plot the scatters
     Labels = []
@@ -255,45 +214,42 @@ Cl, SO4, pH, and TDS.
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            plt.scatter(cat_x[i], cat_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(an_x[i], an_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(an_x[i], cat_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(an_x[i], ph_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-            plt.scatter(tds_x[i], cat_y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        #label=TmpLabel, 
-                        edgecolors='black')
-            
-        except(ValueError):
-                pass
+        ax.scatter(cat_x[i], cat_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(an_x[i], an_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(an_x[i], cat_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(an_x[i], ph_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
+        ax.scatter(tds_x[i], cat_y[i], 
+                   marker=df.at[i, 'Marker'],
+                   s=df.at[i, 'Size'], 
+                   color=df.at[i, 'Color'], 
+                   alpha=df.at[i, 'Alpha'],
+                   #label=TmpLabel, 
+                   edgecolors='black')
+
             
     # Bottom rectangle / Adjust the pH labels automatically 
     # pHlabels = ['6', '6.5', '7', '7.5', '8', '8.5', '9', '9.5']
@@ -305,27 +261,23 @@ Cl, SO4, pH, and TDS.
         if i in [2, 4, 6]:
             ax.text(-2 * ticklength, x, round(pHlabels[i], 2), 
                     ha='right', va='center')
-    plt.text(-0.25, -0.618 / 2, 'pH', rotation=0, 
-             ha='center', va='center', fontsize=10)
+    ax.text(-0.25, -0.618 / 2, 'pH', rotation=0, 
+            ha='center', va='center', fontsize=10)
             
     # Create the legend
     # plt.legend(loc='upper left', markerscale=1, frameon=False, fontsize=12,
     #            labelspacing=0.25, handletextpad=0.25)
-    plt.legend(bbox_to_anchor=(1.05, 1.035), markerscale=1, fontsize=10,
-               frameon=True, edgecolor = 'black', title='Legend', 
-               labelspacing=0.25, handletextpad=0.25)
+    ax.legend(bbox_to_anchor=(1.05, 1.035), markerscale=1, fontsize=10,
+              frameon=True, edgecolor = 'black', title='Legend', 
+              labelspacing=0.25, handletextpad=0.25)
     
-    plt.tight_layout()
+    fig.tight_layout()
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Durov diagram created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Durov diagram created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
@@ -0,0 +1,274 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 25 09:12:40 2021
+
+@author: Jing
+"""
+import io
+import os
+import re
+import math
+import warnings
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+import matplotlib.image
+
+from .chemistry import IonMatrix
+from .rendering import RenderSession
+from .report import DIAGRAMS
+from .shared import SharedDataset, attach
+from . import rendering
+from . import validation
+
+# The layouts of the facets: one file per facet, or pages of panels
+LAYOUTS = ['files', 'grid']
+
+# The diagrams drawing one figure per sample, not laid out in a grid
+PER_SAMPLE = ['stiff', 'stiff_mod', 'chernoff']
+
+# The size of a panel in the grid, in inches
+PANEL_SIZE = 4
+
+
+def _groups(df, by):
+    """Return the positions of the rows of each facet."""
+    if by not in df.columns:
+        raise RuntimeError("""
+        The facets are defined by the column %s.
+        Confirm that this column is provided in the input file.""" % by)
+    return df.groupby(by, sort=False, dropna=False).indices
+
+
+def _facet(df, ions, rows):
+    """Return the samples of a facet, numbered from 0."""
+    return (df.iloc[rows].reset_index(drop=True),
+            None if ions is None else ions.take(rows))
+
+
+def split(df, by='Label', ions=None):
+    """Split a dataset into facets, one per value of a column.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    by : class:`string`
+        The column defining the facets, e.g. Label or Site.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, split along with it.
+
+    Returns
+    -------
+    A list of (value, DataFrame, ion matrix) tuples, in the order the
+    values first appear in df. The rows of each DataFrame are numbered
+    from 0. The ion matrices are None if ions is None.
+    """
+    return [(key,) + _facet(df, ions, rows)
+            for key, rows in _groups(df, by).items()]
+
+
+def _filenames(keys):
+    """Return a distinct file name for the value of each facet."""
+    names, used = [], set()
+    for key in keys:
+        name = re.sub(r'[^\w.-]+', '_', str(key)).strip('_') or 'facet'
+        unique, i = name, 1
+        while unique in used:
+            i += 1
+            unique = '%s_%d' % (name, i)
+        used.add(unique)
+        names.append(unique)
+    return names
+
+
+def _render_facets(name, facets, unit, figformat, panel_width):
+    """Render a batch of facets, used as the task of the worker processes.
+
+    If panel_width is None, each facet is saved to its figname. Otherwise
+    the figure of each facet is returned encoded as a PNG of about
+    panel_width pixels wide.
+    """
+    results = []
+    with RenderSession(trace_memory=False) as session:
+        for figname, df, ions in facets:
+            if panel_width is None:
+                session.render(name, df, unit=unit, figname=figname,
+                               figformat=figformat, ions=ions)
+                results.append(figname)
+                continue
+            fig = session.render(name, df, unit=unit, ions=ions,
+                                 return_fig=True)
+            buffer = io.BytesIO()
+            fig.savefig(buffer, format='png', bbox_inches='tight',
+                        dpi=panel_width / fig.get_figwidth())
+            results.append(buffer.getvalue())
+    return results
+
+
+def _render_shared(name, dataset, facets, unit, figformat, panel_width):
+    """Render a batch of facets of a dataset in shared memory, attached
+    by the worker process when it started.
+
+    The facets are given by their figname and the positions of their rows.
+    """
+    df, ions = attach(dataset)
+    facets = [(figname,) + _facet(df, ions, rows) for figname, rows in facets]
+    return _render_facets(name, facets, unit, figformat, panel_width)
+
+
+@rendering.styled()
+def _page(panels, ncols, figname, figformat, panel_width):
+    """Lay the panels of a page out in a grid and save it."""
+    nrows = int(math.ceil(len(panels) / ncols))
+    fig = rendering.figure(figsize=(ncols * PANEL_SIZE, nrows * PANEL_SIZE))
+    for i, (key, data) in enumerate(panels):
+        ax = fig.add_subplot(nrows, ncols, i + 1)
+        ax.imshow(matplotlib.image.imread(io.BytesIO(data), format='png'))
+        ax.set_title(str(key), fontsize=12)
+        ax.set_axis_off()
+    rendering.savefig(fig, figname, figformat, "Faceted plot created.",
+                      dpi=panel_width / PANEL_SIZE)
+    return figname
+
+
+def render(df,
+           diagram='triangle_piper',
+           by='Label',
+           layout='files',
+           unit='mg/L',
+           outdir='.',
+           figformat='jpg',
+           workers=None,
+           ncols=4,
+           nrows=4,
+           panel_width=800,
+           missing='drop',
+           fold=None):
+    """Render a diagram of each facet of a dataset in parallel.
+
+    The dataset is split by the values of a column, e.g. one facet per
+    Label or per monitoring site, and the diagram of each facet is either
+    saved to its own file or drawn as a panel of a grid. The major ions
+    are converted once for the whole dataset, and placed in shared memory
+    with it, so the worker processes only receive the rows of their
+    facets, see `wqchartpy.shared.SharedDataset`. The facets are rendered
+    in batches by worker processes, so that each worker builds the static
+    background geometry of the diagram once, see
+    `wqchartpy.piper_background.geometry`, and reuses it for all the
+    facets of its batches. The facets without a valid sample, see
+    `wqchartpy.validation.validate`, are skipped with a warning, so that
+    one bad site does not stop the others. As worker processes are
+    spawned, scripts calling this function must be protected by an
+    `if __name__ == '__main__':` guard.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data to draw the diagrams.
+    diagram : class:`string`
+        The name of the diagram, see `wqchartpy.report.DIAGRAMS`.
+    by : class:`string`
+        The column defining the facets, e.g. Label or Site.
+    layout : class:`string`
+        'files' to save the diagram of each facet to
+        outdir/diagram_value.figformat, or 'grid' to lay the facets out as
+        panels of ncols by nrows pages saved to
+        outdir/diagram_grid_page.figformat.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    outdir : class:`string`
+        The directory where the figures are saved.
+    figformat : class:`string`
+        The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    workers : class:`int`
+        Number of worker processes. Defaults to the number of CPUs. With a
+        single worker the facets are rendered in the calling process.
+    ncols : class:`int`
+        Number of panels per row of the grid.
+    nrows : class:`int`
+        Number of rows per page of the grid.
+    panel_width : class:`int`
+        The width of a panel of the grid in pixels.
+    missing : class:`string`
+        How the missing concentrations are handled: 'drop', 'zero' or
+        'balance', see `wqchartpy.chemistry.IonMatrix.fill_missing`.
+    fold : class:`bool` or class:`dict`
+        Whether to add minor species to the major ions, e.g. NO3 to Cl,
+        see `wqchartpy.chemistry.IonMatrix.from_dataframe`.
+
+    Returns
+    -------
+    The names of the saved figures, without the file extension.
+    """
+    if diagram not in DIAGRAMS:
+        raise RuntimeError("""
+        Unknown diagram: %s.
+        Choose among %s.""" % (diagram, ', '.join(DIAGRAMS)))
+    if layout not in LAYOUTS:
+        raise RuntimeError("""
+        Unknown layout: %s. Choose among %s.""" % (layout, ', '.join(LAYOUTS)))
+    if layout == 'grid' and diagram in PER_SAMPLE:
+        raise RuntimeError("""
+        The %s diagram draws one figure per sample.
+        Use the files layout instead.""" % diagram)
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    ions = IonMatrix.from_dataframe(df, unit=unit, missing=missing,
+                                    fold=fold)
+    groups = _groups(df, by)
+
+    # Skip the facets without a valid sample. The samples are checked one
+    # by one, so the whole dataset is checked at once
+    valid, _ = validation.validate(df, diagram, ions)
+    skipped = [key for key, rows in groups.items() if not valid[rows].any()]
+    if skipped:
+        warnings.warn('%d of %d facets have no valid sample and are '
+                      'skipped: %s%s' % (
+                          len(skipped), len(groups),
+                          ', '.join(str(key) for key in skipped[:10]),
+                          ', ...' if len(skipped) > 10 else ''),
+                      stacklevel=2)
+        groups = {key: rows for key, rows in groups.items()
+                  if valid[rows].any()}
+    keys = list(groups)
+    tasks = [(os.path.join(outdir, diagram + '_' + name), rows)
+             for name, rows in zip(_filenames(keys), groups.values())]
+    if layout == 'files':
+        panel_width = None
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = max(1, min(workers, len(tasks)))
+    if workers <= 1:
+        facets = [(figname,) + _facet(df, ions, rows)
+                  for figname, rows in tasks]
+        results = _render_facets(diagram, facets, unit, figformat,
+                                 panel_width)
+    else:
+        # Send the facets in batches, a few per worker, so that thousands
+        # of facets are not as many round trips to the worker processes
+        size = int(math.ceil(len(tasks) / (4.0 * workers)))
+        batches = [tasks[i:i + size] for i in range(0, len(tasks), size)]
+        context = multiprocessing.get_context('spawn')
+        with SharedDataset(df, ions) as shared, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                    initializer=attach,
+                                    initargs=(shared.handle,)) as executor:
+            futures = [executor.submit(_render_shared, diagram, shared.name,
+                                       batch, unit, figformat, panel_width)
+                       for batch in batches]
+            results = [result for future in futures
+                       for result in future.result()]
+    if layout == 'files':
+        return results
+
+    # Lay the panels out, ncols by nrows per page
+    panels = list(zip(keys, results))
+    per_page = ncols * nrows
+    return [_page(panels[i:i + per_page], ncols,
+                  os.path.join(outdir, '%s_grid_%d' % (diagram,
+                                                       i // per_page + 1)),
+                  figformat, panel_width)
+            for i in range(0, len(panels), per_page)]
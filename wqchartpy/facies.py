@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov 23 09:42:18 2021
+
+@author: Jing
+"""
+import numpy as np
+import pandas as pd
+
+from .chemistry import IonMatrix
+
+# The hydrogeochemical facies of the modified Piper diagram, delimited by
+# the 50% lines, see `triangle_piper_mod`. A corner type is assigned when
+# its ions exceed 50%, otherwise the sample is mixed.
+CATION_TYPES = ['Ca', 'Mg', 'Na+K', 'Mixed']
+ANION_TYPES = ['HCO3+CO3', 'SO4', 'Cl', 'Mixed']
+DIAMOND_TYPES = ['Ca-Mg-HCO3', 'Na-K-Cl-SO4', 'Ca-Mg-Cl-SO4', 'Na-K-HCO3',
+                 'Mixed']
+
+
+def _categorical(codes, invalid, categories):
+    """Return the codes as a Categorical, with NaN for the invalid rows."""
+    codes = codes.astype(np.int8)
+    codes[invalid] = -1
+    return pd.Categorical.from_codes(codes, categories=categories)
+
+
+def _triangle(p, categories):
+    """Classify the samples of a triangle from their three fractions."""
+    codes = np.full(len(p), 3, dtype=np.int8)
+    for i in range(3):
+        codes[p[:, i] > 0.5] = i
+    return _categorical(codes, np.isnan(p).any(axis=1), categories)
+
+
+def cation(cat):
+    """Return the cation type of the samples.
+
+    Parameters
+    ----------
+    cat : class:`numpy.ndarray`
+        The fractions of Ca, Mg and Na+K of the samples, see
+        `wqchartpy.chemistry.IonMatrix.cat`.
+
+    Returns
+    -------
+    A class:`pandas.Categorical` of `CATION_TYPES`.
+    """
+    return _triangle(cat, CATION_TYPES)
+
+
+def anion(an):
+    """Return the anion type of the samples.
+
+    Parameters
+    ----------
+    an : class:`numpy.ndarray`
+        The fractions of HCO3+CO3, SO4 and Cl of the samples, see
+        `wqchartpy.chemistry.IonMatrix.an`.
+
+    Returns
+    -------
+    A class:`pandas.Categorical` of `ANION_TYPES`.
+    """
+    return _triangle(an, ANION_TYPES)
+
+
+def diamond(cat, an):
+    """Return the facies of the samples in the diamond.
+
+    The diamond is divided by its 50% lines into four fields. The upper
+    and lower fields are further divided at mid-height, their inner
+    halves being mixed waters.
+
+    Parameters
+    ----------
+    cat : class:`numpy.ndarray`
+        The fractions of Ca, Mg and Na+K of the samples.
+    an : class:`numpy.ndarray`
+        The fractions of HCO3+CO3, SO4 and Cl of the samples.
+
+    Returns
+    -------
+    A class:`pandas.Categorical` of `DIAMOND_TYPES`.
+    """
+    camg = cat[:, 0] + cat[:, 1]
+    so4cl = an[:, 1] + an[:, 2]
+    # The height in the diamond, from 0 at the bottom to 2 at the top
+    height = camg + so4cl
+
+    codes = np.full(len(cat), 4, dtype=np.int8)
+    codes[(camg > 0.5) & (so4cl < 0.5)] = 0
+    codes[(camg < 0.5) & (so4cl > 0.5)] = 1
+    codes[height > 1.5] = 2
+    codes[height < 0.5] = 3
+    invalid = np.isnan(camg) | np.isnan(so4cl)
+    return _categorical(codes, invalid, DIAMOND_TYPES)
+
+
+def classify(df=None, unit='mg/L', ions=None):
+    """Classify the samples into the hydrogeochemical facies.
+
+    The samples are classified without plotting, so the facies of a
+    large number of samples are obtained at NumPy speed.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data. Only needed if ions is None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df. Converted from df if None.
+
+    Returns
+    -------
+    A DataFrame with the categorical columns Cation, Anion and Facies,
+    with the index of df. Samples with missing ions are NaN.
+    """
+    if ions is None:
+        if df is None:
+            raise RuntimeError("""
+        Either the geochemical data or the ion matrix must be provided.""")
+        ions = IonMatrix.from_dataframe(df, unit=unit)
+
+    # Calculate the percentages
+    cat = ions.cat
+    an = ions.an
+
+    index = df.index if df is not None and len(df) == len(ions) else None
+    return pd.DataFrame({'Cation': cation(cat),
+                         'Anion': anion(an),
+                         'Facies': diamond(cat, an)}, index=index)
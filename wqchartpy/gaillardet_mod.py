@@ -4,34 +4,63 @@ Created on Thu Sep 16 10:22:05 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
 import matplotlib
-from pylab import *
-import matplotlib.pyplot as plt
 import matplotlib.patches as mpatches
 from mpl_toolkits.axes_grid1.inset_locator import inset_axes
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Gaillardet diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Gaillardet diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L and meq/L are supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -51,50 +80,18 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed.
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'gaillardet_mod')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['HCO3']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'HCO3']]
-        dat = tmpdf.values
-        
-        molL = (dat / abs(gmol))
-        
-    elif unit == 'meq/L':
-        molL = df[['Ca', 'Mg', 'Na', 'HCO3']].values / np.abs(np.array([ions_CHARGE['Ca'], ions_CHARGE['Mg'], ions_CHARGE['Na'], ions_CHARGE['HCO3']]))
-        
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-    
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
+    molL = ion_matrix(df, unit, ions).select(['Ca', 'Mg', 'Na', 'HCO3'], 
+                                              unit='mmol/L')
     
     # Do the plot
     # -------------------------------------------------------------------------
-    fig = plt.figure(figsize=(12, 10))
+    fig = rendering.figure(figsize=(12, 10))
     
     # Plot the scatters
     ax1 = fig.add_subplot(221, aspect='equal')
@@ -108,34 +105,31 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                    vmin = np.min(df['Color'].values)
-                    vmax = np.max(df['Color'].values)
-                    plt.scatter(molL[i, 0] / molL[i, 2], molL[i, 3] / molL[i, 2], 
-                                marker=df.at[i, 'Marker'],
-                                s=df.at[i, 'Size'], 
-                                c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                                alpha=df.at[i, 'Alpha'],
-                                label=TmpLabel, 
-                                edgecolors='black')
-            else:
-                plt.scatter(molL[i, 0] / molL[i, 2], molL[i, 3] / molL[i, 2], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black')
-            
-        except(ValueError):
-            pass
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+                vmin = np.min(df['Color'].values)
+                vmax = np.max(df['Color'].values)
+                ax1.scatter(molL[i, 0] / molL[i, 2], molL[i, 3] / molL[i, 2], 
+                            marker=df.at[i, 'Marker'],
+                            s=df.at[i, 'Size'], 
+                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                            alpha=df.at[i, 'Alpha'],
+                            label=TmpLabel, 
+                            edgecolors='black')
+        else:
+            ax1.scatter(molL[i, 0] / molL[i, 2], molL[i, 3] / molL[i, 2], 
+                    marker=df.at[i, 'Marker'],
+                    s=df.at[i, 'Size'], 
+                    color=df.at[i, 'Color'], 
+                    alpha=df.at[i, 'Alpha'],
+                    label=TmpLabel, 
+                    edgecolors='black')
+
         
     # Creat the legend
     # plt.legend(loc='lower right', markerscale=1, frameon=False, fontsize=12,
     #            labelspacing=0.25, handletextpad=0.25)
-    plt.legend(bbox_to_anchor=(1.225, 1.015), markerscale=1, fontsize=10,
+    ax1.legend(bbox_to_anchor=(1.225, 1.015), markerscale=1, fontsize=10,
                   frameon=True, edgecolor = 'black', title='Legend', 
                   labelspacing=0.25, handletextpad=0.25)
     
@@ -168,9 +162,9 @@ def plot(df,
     ax1.set_xlabel('$\dfrac{Ca^{2+}}{Na^+}$', fontsize=12, weight='normal')
     ax1.set_ylabel('$\dfrac{HCO_3^-}{Na^+}$', fontsize=12, weight='normal')
   
-    minorticks_off()
-    tick_params(which='major', direction='in', length=4, width=1.25)
-    tick_params(which='minor', direction='in', length=2.5, width=1.25)
+    ax1.minorticks_off()
+    ax1.tick_params(which='major', direction='in', length=4, width=1.25)
+    ax1.tick_params(which='minor', direction='in', length=2.5, width=1.25)
     
     labels = ax1.get_xticklabels() + ax1.get_yticklabels()
     [label.set_fontsize(10) for label in labels]
@@ -199,34 +193,31 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                    vmin = np.min(df['Color'].values)
-                    vmax = np.max(df['Color'].values)
-                    cf = plt.scatter(molL[i, 0] / molL[i, 2], molL[i, 1] / molL[i, 2], 
-                                marker=df.at[i, 'Marker'],
-                                s=df.at[i, 'Size'], 
-                                c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                                alpha=df.at[i, 'Alpha'],
-                                #label=TmpLabel, 
-                                edgecolors='black')
-            else:
-                plt.scatter(molL[i, 0] / molL[i, 2], molL[i, 1] / molL[i, 2], 
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+                vmin = np.min(df['Color'].values)
+                vmax = np.max(df['Color'].values)
+                cf = ax2.scatter(molL[i, 0] / molL[i, 2], molL[i, 1] / molL[i, 2], 
                             marker=df.at[i, 'Marker'],
                             s=df.at[i, 'Size'], 
-                            color=df.at[i, 'Color'], 
+                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
                             alpha=df.at[i, 'Alpha'],
                             #label=TmpLabel, 
                             edgecolors='black')
-                
-            
-        except(ValueError):
-            pass
+        else:
+            ax2.scatter(molL[i, 0] / molL[i, 2], molL[i, 1] / molL[i, 2], 
+                        marker=df.at[i, 'Marker'],
+                        s=df.at[i, 'Size'], 
+                        color=df.at[i, 'Color'], 
+                        alpha=df.at[i, 'Alpha'],
+                        #label=TmpLabel, 
+                        edgecolors='black')
+
+
         
     # Creat the legend
     if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
-        cb = plt.colorbar(cf, extend='both', spacing='uniform', 
+        cb = fig.colorbar(cf, extend='both', spacing='uniform', 
                           orientation='vertical', fraction=0.05, pad=0.125, 
                           )
         #cb.set_label(label='$TDS$' + ' ' + '$(mg/L)$', size=14)
@@ -269,9 +260,9 @@ def plot(df,
     ax2.set_xlim(0.1, 100)
     ax2.set_ylim(0.01, 25)
     
-    minorticks_on()
-    tick_params(which='major', direction='in', length=4, width=1.25)
-    tick_params(which='minor', direction='in', length=2.5, width=1.25)
+    ax2.minorticks_on()
+    ax2.tick_params(which='major', direction='in', length=4, width=1.25)
+    ax2.tick_params(which='minor', direction='in', length=2.5, width=1.25)
     
     ax2.spines['top'].set_linewidth(1.25)
     ax2.spines['top'].set_color('k')
@@ -282,18 +273,14 @@ def plot(df,
     ax2.spines['right'].set_linewidth(1.25)
     ax2.spines['right'].set_color('k')
     
-    plt.subplots_adjust(wspace=0.001)
-    # Display the info
-    cwd = os.getcwd()
-    print("Gaillardet plot created. Saving it to %s \n" %cwd) 
+    fig.subplots_adjust(wspace=0.001)
        
-    plt.tight_layout()
+    fig.tight_layout()
    
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat,
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Gaillardet plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
@@ -4,31 +4,60 @@ Created on Tue Sep 14 13:15:59 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from matplotlib.pyplot import minorticks_on, tick_params
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Gibbs diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Gibbs diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L and meq/L are supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -45,11 +74,16 @@ def plot(df,
          Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
+        
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'gibbs_mod')
+
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
+    mmolL = ions.select(['Na', 'Ca', 'Cl', 'HCO3'], unit='mmol/L')
+    Na_Ca = mmolL[:, 0] / (mmolL[:, 0] + mmolL[:, 1])
+    Cl_HCO3 = mmolL[:, 2] / (mmolL[:, 2] + mmolL[:, 3])
         
     # Load the wrapped lines taken from Gibbs (1970)
     Cl_HCO3_plot_wrapped_lines = np.array([
@@ -168,22 +202,7 @@ def plot(df,
          1311.4464, 1044.6506, 816.7192, 650.65, 508.5584,
          412.8464, 341.5145, 261.8588]])
     
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
-    
-    fig = plt.figure(figsize=(10, 15))
+    fig = rendering.figure(figsize=(10, 15))
     
     ############################## Na-Ca plot #################################
     ax1 = fig.add_subplot(221)
@@ -199,39 +218,23 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if unit == 'mg/L':
-                x = df.at[i, 'Na'] / ions_WEIGHT['Na'] / \
-                    (df.at[i, 'Na'] / ions_WEIGHT['Na'] + \
-                     df.at[i, 'Ca'] / ions_WEIGHT['Ca'])
+        x = Na_Ca[i]
 
-            elif unit == 'meq/L':
-                x = df.at[i, 'Na'] / ions_WEIGHT['Na'] / ions_CHARGE['Na'] / \
-                    (df.at[i, 'Na'] / ions_WEIGHT['Na'] / ions_CHARGE['Na'] + \
-                     df.at[i, 'Ca'] / ions_WEIGHT['Ca'] / ions_CHARGE['Ca'])
-            
-            else:
-                raise RuntimeError("""
-                Currently only mg/L and meq/L are supported.
-                Convert the unit if needed.""")
-       
-            y = df.at[i, 'TDS']   
-            ax1.scatter(x, y, 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black') 
-        except(ValueError):
-                pass
+        y = df.at[i, 'TDS']   
+        ax1.scatter(x, y, 
+                    marker=df.at[i, 'Marker'],
+                    s=df.at[i, 'Size'], 
+                    color=df.at[i, 'Color'], 
+                    alpha=df.at[i, 'Alpha'],
+                    label=TmpLabel, 
+                    edgecolors='black') 
     
     ax1.set_xlim(0, 1)
     ax1.set_ylim(1, 45000)
     
-    minorticks_on()
-    tick_params(which='major', direction='in', length=4, width=1.25)
-    tick_params(which='minor', direction='in', length=2.5, width=1.25)
+    ax1.minorticks_on()
+    ax1.tick_params(which='major', direction='in', length=4, width=1.25)
+    ax1.tick_params(which='minor', direction='in', length=2.5, width=1.25)
     
     ax1.spines['top'].set_linewidth(1.25)
     ax1.spines['top'].set_color('k')
@@ -274,27 +277,22 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            x = df.at[i, 'Cl'] / ions_WEIGHT['Cl'] / \
-                (df.at[i, 'Cl'] / ions_WEIGHT['Cl'] + \
-                 df.at[i, 'HCO3'] / ions_WEIGHT['HCO3'])
-            y = df.at[i, 'TDS']
-            ax2.scatter(x, y, 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black') 
-        except(ValueError):
-                pass
+        x = Cl_HCO3[i]
+        y = df.at[i, 'TDS']
+        ax2.scatter(x, y, 
+                    marker=df.at[i, 'Marker'],
+                    s=df.at[i, 'Size'], 
+                    color=df.at[i, 'Color'], 
+                    alpha=df.at[i, 'Alpha'],
+                    label=TmpLabel, 
+                    edgecolors='black') 
     
     ax2.set_xlim(0, 1)
     ax2.set_ylim(1, 45000)
     
-    minorticks_on()
-    tick_params(which='major', direction='in', length=4, width=1.25)
-    tick_params(which='minor', direction='in', length=2.5, width=1.25)
+    ax2.minorticks_on()
+    ax2.tick_params(which='major', direction='in', length=4, width=1.25)
+    ax2.tick_params(which='minor', direction='in', length=2.5, width=1.25)
     ax2.spines['top'].set_linewidth(1.25)
     ax2.spines['top'].set_color('k')
     ax2.spines['bottom'].set_linewidth(1.25)
@@ -324,21 +322,17 @@ def plot(df,
     #            labelspacing=0.25, handletextpad=0.25)
     
     # Create the legend
-    plt.legend(bbox_to_anchor=(1.05, 1.01), markerscale=1,
+    ax2.legend(bbox_to_anchor=(1.05, 1.01), markerscale=1,
                frameon=True, edgecolor = 'black', title='Legend', fontsize=8, 
                labelspacing=0.25, handletextpad=0.25)
     
-    plt.tight_layout()
+    fig.tight_layout()
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Gibbs plot created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Gibbs plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
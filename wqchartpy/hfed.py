@@ -4,30 +4,46 @@ Created on Sun Sep  6 10:36:15 2020
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
 from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
 
 # Define the plotting function
+@rendering.styled(default=False)
 def plot(df, 
          unit='mg/L', 
          figname='HFE-D diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the HFE-D  diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw HFE-D diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L and meq/L are supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -44,11 +60,7 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed.
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
     '''
     # Seawater concentrations from Turekian, K.K. ,1968.- Oceans , Prentice Hall
@@ -70,7 +82,7 @@ def plot(df,
                      'Cl': 20066}    # 566   mmol/L
 
     # Figure settings
-    fig = plt.figure(figsize=(10, 10))
+    fig = rendering.figure(figsize=(10, 10))
     
     # Axis settings
     left, bottom, width, height = 0.1, 0.1, 0.8, 0.8
@@ -104,17 +116,17 @@ def plot(df,
     ax.set_ylim([-12, 153.4])
     
     # Ticks
-    plt.text(0, 135.4, '100', ha='center', va='bottom')
-    plt.text(50, 135.4, '50', ha='center', va='bottom')
-    plt.text(66.7, 135.4, '33.3', ha='center', va='bottom')
-    plt.text(83.4, 135.4, '50', ha='center', va='bottom')
-    plt.text(133.4, 135.4, '100', ha='center', va='bottom')
-    
-    plt.text(-2, 0, '100', ha='right', va='center')
-    plt.text(-2, 50, '50', ha='right', va='center')
-    plt.text(-2, 66.7, '33.3', ha='right', va='center')
-    plt.text(-2, 83.4, '50', ha='right', va='center')
-    plt.text(-2, 133.4, '100', ha='right', va='center')
+    ax.text(0, 135.4, '100', ha='center', va='bottom')
+    ax.text(50, 135.4, '50', ha='center', va='bottom')
+    ax.text(66.7, 135.4, '33.3', ha='center', va='bottom')
+    ax.text(83.4, 135.4, '50', ha='center', va='bottom')
+    ax.text(133.4, 135.4, '100', ha='center', va='bottom')
+    
+    ax.text(-2, 0, '100', ha='right', va='center')
+    ax.text(-2, 50, '50', ha='right', va='center')
+    ax.text(-2, 66.7, '33.3', ha='right', va='center')
+    ax.text(-2, 83.4, '50', ha='right', va='center')
+    ax.text(-2, 133.4, '100', ha='right', va='center')
     
     # Lables
     ax.annotate('%' + '$Na^+$' +'+%' + '$K^+$', 
@@ -146,24 +158,24 @@ def plot(df,
                 arrowprops=dict(arrowstyle="simple", fc="k", ec="k"))
     
     # Instrusion arc
-    plt.annotate('',
-                 xy=(60, 12), xycoords='data',
-                 xytext=(180, 200), textcoords='offset points',
-                 size=40,
-                 # bbox=dict(boxstyle="round", fc="0.8"),
-                 arrowprops=dict(arrowstyle="simple",
+    ax.annotate('',
+                xy=(60, 12), xycoords='data',
+                xytext=(180, 200), textcoords='offset points',
+                size=40,
+                # bbox=dict(boxstyle="round", fc="0.8"),
+                arrowprops=dict(arrowstyle="simple",
                                  fc="#F4CED4", ec="none", 
                                  connectionstyle="arc3, rad=-0.3"))
     ax.text(100, 28.4, 'Intrusion', fontsize=28, color="#F4CED4", 
             rotation=45, ha='center', va='center', weight='bold')
              
     # Fresenshing arc
-    plt.annotate('',
-                 xy=(73.4, 121.4), xycoords='data',
-                 xytext=(-180, -200), textcoords='offset points',
-                 size=40,
-                 # bbox=dict(boxstyle="round", fc="0.8"),
-                 arrowprops=dict(arrowstyle="simple",
+    ax.annotate('',
+                xy=(73.4, 121.4), xycoords='data',
+                xytext=(-180, -200), textcoords='offset points',
+                size=40,
+                # bbox=dict(boxstyle="round", fc="0.8"),
+                arrowprops=dict(arrowstyle="simple",
                                  fc="#D7DFEF", ec="none",
                                  connectionstyle="arc3, rad=-0.3"))
     
@@ -171,41 +183,41 @@ def plot(df,
             rotation=45, ha='center', va='center', weight='bold')
     
     # Face numbers
-    plt.text(25, 108.4, '1', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(25, 75.05, '2', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(25, 58.35, '3', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(25, 25.00, '4', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    
-    plt.text(58.3, 108.4, '5', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(58.3, 75.05, '6', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(58.3, 58.35, '7', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(58.3, 25.00, '8', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    
-    plt.text(75.0, 108.4, '9', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(75.0, 75.05, '10', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(75.0, 58.35, '11', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(75.0, 25.00, '12', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    
-    plt.text(108.4, 108.4, '13', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(108.4, 75.05, '14', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(108.4, 58.35, '15', fontsize=26, color="0.6", 
-             ha='center', va='center')
-    plt.text(108.4, 25.00, '16', fontsize=26, color="0.6", 
-             ha='center', va='center')
+    ax.text(25, 108.4, '1', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(25, 75.05, '2', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(25, 58.35, '3', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(25, 25.00, '4', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    
+    ax.text(58.3, 108.4, '5', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(58.3, 75.05, '6', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(58.3, 58.35, '7', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(58.3, 25.00, '8', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    
+    ax.text(75.0, 108.4, '9', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(75.0, 75.05, '10', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(75.0, 58.35, '11', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(75.0, 25.00, '12', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    
+    ax.text(108.4, 108.4, '13', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(108.4, 75.05, '14', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(108.4, 58.35, '15', fontsize=26, color="0.6", 
+            ha='center', va='center')
+    ax.text(108.4, 25.00, '16', fontsize=26, color="0.6", 
+            ha='center', va='center')
     
     
     # Water type notes
@@ -219,10 +231,10 @@ def plot(df,
             linestyle='-', linewidth=1.0, color='k')
     ax.plot([83.4, 83.4], [-9.5, -2.5], 
             linestyle='-', linewidth=1.0, color='k')
-    plt.text(25, -6, '$Na-$', ha='center', va='center', fontsize=13) 
-    plt.text(58.3, -6, '$MixNa-$', ha='center', va='center', fontsize=13) 
-    plt.text(75, -6, '$MixCa-$', ha='center', va='center', fontsize=13) 
-    plt.text(108.4, -6, '$Ca-$', ha='center', va='center', fontsize=13)
+    ax.text(25, -6, '$Na-$', ha='center', va='center', fontsize=13) 
+    ax.text(58.3, -6, '$MixNa-$', ha='center', va='center', fontsize=13) 
+    ax.text(75, -6, '$MixCa-$', ha='center', va='center', fontsize=13) 
+    ax.text(108.4, -6, '$Ca-$', ha='center', va='center', fontsize=13)
     
     ax.plot([135.9, 135.9], [0, 133.4], 
             linestyle='-', linewidth=1.0, color='k')
@@ -234,95 +246,60 @@ def plot(df,
             linestyle='-', linewidth=1.0, color='k')
     ax.plot([135.9, 142.9], [83.4, 83.4], 
             linestyle='-', linewidth=1.0, color='k')
-    plt.text(139.4, 108, '$-HCO_3$', 
-             ha='center', va='center', fontsize=13, rotation=90) 
-    plt.text(139.4, 75.05, '$-MixHCO_3$', 
-             ha='center', va='center', fontsize=13, rotation=90) 
-    plt.text(139.4, 58.35, '$-MixCl$', 
-             ha='center', va='center', fontsize=13, rotation=90) 
-    plt.text(139.4, 25, '$-Cl$', 
-             ha='center', va='center', fontsize=13, rotation=90) 
-    
-    
-    plt.text(149, 134, 'Hydrochemical Facies', 
-             ha='left', va='center', fontsize=16)
-    plt.text(149, 127, '1: Na-HCO' + '$_3$' + '/SO' +'$_4$', 
-             ha='left', va='center', fontsize=14) 
-    plt.text(149, 121, '2: Na-MixHCO' + '$_3$' + '/MixSO' + '$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149, 115, '3: Na-MixCl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149, 109, '4: Na-Cl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149, 103, '5: MixNa-HCO' + '$_3$' + '/SO' +'$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  97, '6: MixNa-MixHCO' + '$_3$' + '/MixSO' +'$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  91, '7: MixNa-MixCl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  85, '8: MixNa-Cl', 
-             va='center', fontsize=14)
-    plt.text(149,  79, '9: MixCa-HCO' + '$_3$' + '/SO' +'$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  73, '10: MixCa-MixHCO' + '$_3$' + '/MixSO' +'$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  67, '11: MixCa-MixCl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  61, '12: MixCa-Cl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  55, '13: Ca-HCO' + '$_3$' + '/SO' +'$_4$', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  49, '14: Ca-MixHCO' + '$_3$' + '/MixSO' +'$_4$', ha='left', 
-             va='center', fontsize=14)
-    plt.text(149,  43, '15: Ca-MixCl', 
-             ha='left', va='center', fontsize=14)
-    plt.text(149,  37, '16: Ca-Cl', 
-             ha='left', va='center', fontsize=14)
-    
-    # Convert mg/L to meq/L
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-    
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
-        
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+    ax.text(139.4, 108, '$-HCO_3$', 
+            ha='center', va='center', fontsize=13, rotation=90) 
+    ax.text(139.4, 75.05, '$-MixHCO_3$', 
+            ha='center', va='center', fontsize=13, rotation=90) 
+    ax.text(139.4, 58.35, '$-MixCl$', 
+            ha='center', va='center', fontsize=13, rotation=90) 
+    ax.text(139.4, 25, '$-Cl$', 
+            ha='center', va='center', fontsize=13, rotation=90) 
+    
+    
+    ax.text(149, 134, 'Hydrochemical Facies', 
+            ha='left', va='center', fontsize=16)
+    ax.text(149, 127, '1: Na-HCO' + '$_3$' + '/SO' +'$_4$', 
+            ha='left', va='center', fontsize=14) 
+    ax.text(149, 121, '2: Na-MixHCO' + '$_3$' + '/MixSO' + '$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149, 115, '3: Na-MixCl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149, 109, '4: Na-Cl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149, 103, '5: MixNa-HCO' + '$_3$' + '/SO' +'$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  97, '6: MixNa-MixHCO' + '$_3$' + '/MixSO' +'$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  91, '7: MixNa-MixCl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  85, '8: MixNa-Cl', 
+            va='center', fontsize=14)
+    ax.text(149,  79, '9: MixCa-HCO' + '$_3$' + '/SO' +'$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  73, '10: MixCa-MixHCO' + '$_3$' + '/MixSO' +'$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  67, '11: MixCa-MixCl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  61, '12: MixCa-Cl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  55, '13: Ca-HCO' + '$_3$' + '/SO' +'$_4$', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  49, '14: Ca-MixHCO' + '$_3$' + '/MixSO' +'$_4$', ha='left', 
+            va='center', fontsize=14)
+    ax.text(149,  43, '15: Ca-MixCl', 
+            ha='left', va='center', fontsize=14)
+    ax.text(149,  37, '16: Ca-Cl', 
+            ha='left', va='center', fontsize=14)
+    
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'hfed')
+
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
     
     # Calculate the percentages
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat * 100                # Percentage Ca
-    cat[:, 1] = meqL[:, 1] / sumcat * 100                # Percentage Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat * 100 # Percentage Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman * 100   # Percentage HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman * 100                  # Percentage Cl
-    an[:, 1] = meqL[:, 7] / suman * 100                  # Percentage SO4
+    cat = ions.cat * 100
+    an = ions.an * 100
     
     # Convert into cartesian coordinates
     cat_rech = np.where(cat[:, 0] > cat[:, 1], cat[:, 0], cat[:, 1])
@@ -339,32 +316,29 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                    vmin = np.min(df['Color'].values)
-                    vmax = np.max(df['Color'].values)
-        
-                    cf = plt.scatter(x[i], y[i], 
-                                marker=df.at[i, 'Marker'],
-                                s=df.at[i, 'Size'], 
-                                c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                                alpha=df.at[i, 'Alpha'],
-                                label=TmpLabel, 
-                                edgecolors='black')
-                
-            else:
-                 plt.scatter(x[i], y[i], 
-                        marker=df.at[i, 'Marker'],
-                        s=df.at[i, 'Size'], 
-                        color=df.at[i, 'Color'], 
-                        alpha=df.at[i, 'Alpha'],
-                        label=TmpLabel, 
-                        edgecolors='black')
-            
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+                vmin = np.min(df['Color'].values)
+                vmax = np.max(df['Color'].values)
+
+                cf = ax.scatter(x[i], y[i], 
+                            marker=df.at[i, 'Marker'],
+                            s=df.at[i, 'Size'], 
+                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                            alpha=df.at[i, 'Alpha'],
+                            label=TmpLabel, 
+                            edgecolors='black')
+
+        else:
+             ax.scatter(x[i], y[i], 
+                    marker=df.at[i, 'Marker'],
+                    s=df.at[i, 'Size'], 
+                    color=df.at[i, 'Color'], 
+                    alpha=df.at[i, 'Alpha'],
+                    label=TmpLabel, 
+                    edgecolors='black')
+
 
-        except(ValueError):
-                pass
             
     # Calculate the mixing line
     # Coordinates of the left (seawater) of the mixing line
@@ -388,39 +362,35 @@ def plot(df,
     y_rechagrewater = max(y)  # Highest percentage in HCO3 or SO4
     
     # Plot mixing line
-    plt.plot([x_seawater, x_rechagrewater], [y_seawater, y_rechagrewater], 
-             linestyle='-', linewidth=1.5, color='k')
+    ax.plot([x_seawater, x_rechagrewater], [y_seawater, y_rechagrewater], 
+            linestyle='-', linewidth=1.5, color='k')
 
-    plt.scatter(x_seawater, y_seawater, 
-                marker='s', s=75, facecolor='k', edgecolor='k')    
-    plt.scatter(x_rechagrewater, y_rechagrewater, 
-                marker='s', s=75, facecolor='w', edgecolor='k') 
-    
-    plt.text(x_seawater + 2.5, y_seawater, 'SW', 
-             fontsize=14, ha='left', va='center')
-    plt.text(x_rechagrewater + 2.5, y_rechagrewater, 'FW', 
-             fontsize=14, ha='left', va='center')
+    ax.scatter(x_seawater, y_seawater, 
+               marker='s', s=75, facecolor='k', edgecolor='k')    
+    ax.scatter(x_rechagrewater, y_rechagrewater, 
+               marker='s', s=75, facecolor='w', edgecolor='k') 
+    
+    ax.text(x_seawater + 2.5, y_seawater, 'SW', 
+            fontsize=14, ha='left', va='center')
+    ax.text(x_rechagrewater + 2.5, y_rechagrewater, 'FW', 
+            fontsize=14, ha='left', va='center')
 
     # Creat the legend
     if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
-        cb = plt.colorbar(cf, extend='both', spacing='uniform', shrink=0.5,
+        cb = fig.colorbar(cf, extend='both', spacing='uniform', shrink=0.5,
                           orientation='horizontal', fraction=0.05, pad=0.025, 
                           )
         cb.set_label(label='$TDS$' + ' ' + '$(mg/L)$', size=14)
         #cb.ax.set_ylabel('$TDS$' + ' ' + '$(mg/L)$', rotation=75, labelpad=0, fontsize=14)
     
-    plt.legend(bbox_to_anchor=(0.15, 0.875), markerscale=1, frameon=False, 
-               labelspacing=0.25, handletextpad=0.25)
+    ax.legend(bbox_to_anchor=(0.15, 0.875), markerscale=1, frameon=False, 
+              labelspacing=0.25, handletextpad=0.25)
     
-    # Display the info
-    cwd = os.getcwd()
-    print("HFE-D plot created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "HFE-D plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
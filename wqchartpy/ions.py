@@ -4,24 +4,52 @@ Created on Tue Sep 14 13:41:09 2021
 
 @author: Jing
 """
-# Weight values are taken from hanford.dat provided by PFLOTRAN 
+# Weight values are taken from hanford.dat provided by PFLOTRAN
 #   https://pflotran.org/.
 
-ions_WEIGHT = {'Ca'  : 40.0780,
-               'Mg'  : 24.3050,
-               'K'   : 39.0983,
-               'Na'  : 22.9898,
-               'Cl'  : 35.4527,
-               'SO4' : 96.0636,
-               'CO3' : 60.0092,
-               'HCO3': 61.0171}
-
-ions_CHARGE = {'Ca'  : +2,
-               'Mg'  : +2,
-               'K'   : +1, 
-               'Na'  : +1,
-               'Cl'  : -1,
-               'SO4' : -2,
-               'CO3' : -2,
-               'HCO3': -1,}
-    
\ No newline at end of file
+# The registry of the ions. Each species has a molar weight (g/mol), a
+# charge, a group, the corner of the Piper diagram it belongs to, and, for
+# the minor species, the major ion it is folded into when requested, e.g.
+# NO3 into the Cl corner. Add a row to support a new species.
+SPECIES = [
+    # name    weight     charge  group      corner       fold
+    ('Ca',    40.0780,   +2,     'cation',  'Ca',        None),
+    ('Mg',    24.3050,   +2,     'cation',  'Mg',        None),
+    ('Na',    22.9898,   +1,     'cation',  'Na+K',      None),
+    ('K',     39.0983,   +1,     'cation',  'Na+K',      None),
+    ('HCO3',  61.0171,   -1,     'anion',   'HCO3+CO3',  None),
+    ('CO3',   60.0092,   -2,     'anion',   'HCO3+CO3',  None),
+    ('Cl',    35.4527,   -1,     'anion',   'Cl',        None),
+    ('SO4',   96.0636,   -2,     'anion',   'SO4',       None),
+    ('NO3',   62.0049,   -1,     'anion',   None,        'Cl'),
+    ('F',     18.9984,   -1,     'anion',   None,        'Cl'),
+    ('Br',    79.9040,   -1,     'anion',   None,        'Cl'),
+    ('Sr',    87.6200,   +2,     'cation',  None,        'Ca'),
+    ('Fe',    55.8450,   +2,     'cation',  None,        None),
+    ('SiO2',  60.0843,    0,     'neutral', None,        None),
+    ]
+
+# The major ions, with a corner in the Piper diagram, and the minor ones
+MAJOR = [name for name, weight, charge, group, corner, fold in SPECIES
+         if corner is not None]
+MINOR = [name for name, weight, charge, group, corner, fold in SPECIES
+         if corner is None]
+
+# The corners of the cation and anion triangles of the Piper diagram
+CATION_CORNERS = ['Ca', 'Mg', 'Na+K']
+ANION_CORNERS = ['HCO3+CO3', 'SO4', 'Cl']
+
+ions_WEIGHT = {name: weight for name, weight, charge, group, corner, fold
+               in SPECIES}
+
+ions_CHARGE = {name: charge for name, weight, charge, group, corner, fold
+               in SPECIES}
+
+ions_GROUP = {name: group for name, weight, charge, group, corner, fold
+              in SPECIES}
+
+ions_CORNER = {name: corner for name, weight, charge, group, corner, fold
+               in SPECIES if corner is not None}
+
+ions_FOLD = {name: fold for name, weight, charge, group, corner, fold
+             in SPECIES if fold is not None}
@@ -0,0 +1,197 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Nov 12 10:07:44 2021
+
+@author: Jing
+"""
+import numpy as np
+from scipy.signal import fftconvolve
+
+
+def _linear_binning(x, y, xgrid, ygrid):
+    """Distribute the samples onto the nodes of a regular grid.
+
+    Each sample is shared between the four surrounding nodes with
+    bilinear weights, which is more accurate than a plain histogram for
+    the same grid resolution.
+    """
+    nx, ny = len(xgrid), len(ygrid)
+    dx = (xgrid[-1] - xgrid[0]) / (nx - 1)
+    dy = (ygrid[-1] - ygrid[0]) / (ny - 1)
+
+    # Fractional node indices of the samples
+    fx = np.clip((x - xgrid[0]) / dx, 0, nx - 1)
+    fy = np.clip((y - ygrid[0]) / dy, 0, ny - 1)
+    ix = np.minimum(fx.astype(int), nx - 2)
+    iy = np.minimum(fy.astype(int), ny - 2)
+    wx = fx - ix
+    wy = fy - iy
+
+    counts = np.zeros(ny * nx)
+    for ox, oy, w in [(0, 0, (1 - wx) * (1 - wy)), (1, 0, wx * (1 - wy)),
+                      (0, 1, (1 - wx) * wy), (1, 1, wx * wy)]:
+        counts += np.bincount((iy + oy) * nx + ix + ox, weights=w,
+                              minlength=ny * nx)
+    return counts.reshape(ny, nx)
+
+
+def _exact(x, y, px, py, bandwidth, chunk=2**22):
+    """Sum the Gaussian kernels of all the samples at the given points.
+
+    The points are processed in chunks to bound the memory used by the
+    pairwise distances.
+    """
+    z = np.empty(len(px))
+    step = max(1, chunk // len(x))
+    for start in range(0, len(px), step):
+        d2 = (px[start:start + step, np.newaxis] - x[np.newaxis, :]) ** 2 + \
+             (py[start:start + step, np.newaxis] - y[np.newaxis, :]) ** 2
+        z[start:start + step] = np.sum(np.exp(-0.5 * d2 / bandwidth ** 2),
+                                       axis=1)
+    return z / (len(x) * 2 * np.pi * bandwidth ** 2)
+
+
+def gaussian_kde(x, y, xgrid, ygrid, bandwidth=0.05, mask=None,
+                 method='binned'):
+    """Gaussian kernel density estimate on a regular grid.
+
+    With the binned method, the samples are binned onto the grid and the
+    counts are convolved with the Gaussian kernel using FFT. The cost is
+    proportional to the grid size and not to the number of samples times
+    the grid size, as when every grid node is evaluated against every
+    sample. The result approximates sklearn.neighbors.KernelDensity with a
+    gaussian kernel and the same bandwidth, i.e. a normalized density.
+
+    With the exact method, the kernels of all the samples are summed at
+    each grid node inside the mask only. It is exact but its cost grows
+    with the number of samples, so it suits small datasets.
+
+    Parameters
+    ----------
+    x, y : class:`numpy.ndarray`
+        Coordinates of the samples. Samples with NaN coordinates are
+        ignored.
+    xgrid, ygrid : class:`numpy.ndarray`
+        Evenly spaced coordinates of the grid nodes.
+    bandwidth : class:`float`
+        The standard deviation of the Gaussian kernel.
+    mask : class:`numpy.ndarray`
+        Boolean array of the grid nodes where the density is needed, of
+        the same shape as the result. The density is set to 0 outside,
+        and only the bounding box of the mask is convolved.
+    method : class:`string`
+        Either 'binned' or 'exact'.
+
+    Returns
+    -------
+    The density at the grid nodes, of shape (len(ygrid), len(xgrid)) as
+    the arrays returned by numpy.meshgrid(xgrid, ygrid).
+    """
+    if method not in ['binned', 'exact']:
+        raise RuntimeError("""
+        The kernel density estimation method must be binned or exact.""")
+
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        raise RuntimeError("""
+        The kernel density estimation requires at least one valid sample.""")
+
+    if method == 'exact':
+        z = np.zeros((len(ygrid), len(xgrid)))
+        if mask is None:
+            mask = np.ones(z.shape, dtype=bool)
+        iy, ix = np.nonzero(mask)
+        z[iy, ix] = _exact(x, y, xgrid[ix], ygrid[iy], bandwidth)
+        return z
+
+    counts, n = histogram(x, y, xgrid, ygrid)
+    return convolve(counts, n, xgrid, ygrid, bandwidth, mask)
+
+
+def histogram(x, y, xgrid, ygrid):
+    """Bin the samples onto the nodes of a regular grid.
+
+    The counts are additive, so the histograms of the chunks of a large
+    dataset can be summed before calling `convolve`.
+
+    Parameters
+    ----------
+    x, y : class:`numpy.ndarray`
+        Coordinates of the samples. Samples with NaN coordinates are
+        ignored.
+    xgrid, ygrid : class:`numpy.ndarray`
+        Evenly spaced coordinates of the grid nodes.
+
+    Returns
+    -------
+    The counts of shape (len(ygrid), len(xgrid)) and the number of valid
+    samples.
+    """
+    x = np.asarray(x, dtype=float)
+    y = np.asarray(y, dtype=float)
+    valid = np.isfinite(x) & np.isfinite(y)
+    x, y = x[valid], y[valid]
+    if len(x) == 0:
+        return np.zeros((len(ygrid), len(xgrid))), 0
+    return _linear_binning(x, y, xgrid, ygrid), len(x)
+
+
+def convolve(counts, n, xgrid, ygrid, bandwidth=0.05, mask=None):
+    """Gaussian kernel density estimate from binned samples.
+
+    Parameters
+    ----------
+    counts : class:`numpy.ndarray`
+        The binned samples, see `histogram`.
+    n : class:`int`
+        The number of samples.
+    xgrid, ygrid : class:`numpy.ndarray`
+        Evenly spaced coordinates of the grid nodes.
+    bandwidth : class:`float`
+        The standard deviation of the Gaussian kernel.
+    mask : class:`numpy.ndarray`
+        Boolean array of the grid nodes where the density is needed. The
+        density is set to 0 outside, and only the bounding box of the mask
+        is convolved.
+
+    Returns
+    -------
+    The density at the grid nodes.
+    """
+    if n == 0:
+        raise RuntimeError("""
+        The kernel density estimation requires at least one valid sample.""")
+
+    # Sample the kernel on the grid spacing, truncated at 4 bandwidths
+    dx = (xgrid[-1] - xgrid[0]) / (len(xgrid) - 1)
+    dy = (ygrid[-1] - ygrid[0]) / (len(ygrid) - 1)
+    kx = np.arange(-int(np.ceil(4 * bandwidth / dx)),
+                   int(np.ceil(4 * bandwidth / dx)) + 1) * dx
+    ky = np.arange(-int(np.ceil(4 * bandwidth / dy)),
+                   int(np.ceil(4 * bandwidth / dy)) + 1) * dy
+    kernel = np.exp(-0.5 * (ky[:, np.newaxis] ** 2 + kx[np.newaxis, :] ** 2)
+                    / bandwidth ** 2) / (2 * np.pi * bandwidth ** 2)
+
+    if mask is None:
+        z = fftconvolve(counts, kernel, mode='same') / n
+        # Remove the round-off noise of the FFT
+        return np.maximum(z, 0)
+
+    # Only convolve the bounding box of the mask, padded by the kernel
+    # radius so that every sample contributing to the mask is included
+    z = np.zeros(counts.shape)
+    rows, cols = np.nonzero(np.any(mask, axis=1))[0], \
+        np.nonzero(np.any(mask, axis=0))[0]
+    if len(rows) == 0:
+        return z
+    ry, rx = len(ky) // 2, len(kx) // 2
+    r0, r1 = max(rows[0] - ry, 0), min(rows[-1] + ry + 1, counts.shape[0])
+    c0, c1 = max(cols[0] - rx, 0), min(cols[-1] + rx + 1, counts.shape[1])
+    z[r0:r1, c0:c1] = fftconvolve(counts[r0:r1, c0:c1], kernel,
+                                  mode='same') / n
+    z = np.maximum(z, 0)
+    z[~mask] = 0
+    return z
@@ -0,0 +1,327 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 11 14:36:52 2021
+
+@author: Jing
+"""
+import functools
+
+import numpy as np
+from matplotlib.collections import LineCollection, PolyCollection
+from matplotlib.path import Path
+
+from . import coordinates
+
+# Define the offset between the diamond and traingle
+offset = coordinates.offset
+offsety = coordinates.offsety
+h = coordinates.h
+
+# The styles of the background
+STYLES = ['standard', 'modified']
+
+# The left triangle, the right triangle and the central diamond
+REGIONS = [[(0, 0), (0.5, h), (1, 0), (0, 0)],
+           [(1 + 2 * offset, 0), (1 + 2 * offset + 0.5, h),
+            (2 + 2 * offset, 0), (1 + 2 * offset, 0)],
+           [(0.5 + offset, h + offsety), (1.0 + offset, 2 * h + offsety),
+            (1.5 + offset, h + offsety), (1.0 + offset, offsety),
+            (0.5 + offset, h + offsety)]]
+
+
+def _frozen(array):
+    """Return a read-only array, as it is shared by every plot."""
+    array = np.asarray(array, dtype=float)
+    array.flags.writeable = False
+    return array
+
+
+def _outline():
+    """Segments of the two triangles and the diamond."""
+    ltriangle = np.array([[0, 0], [0.5, h], [1, 0], [0, 0]])
+    rtriangle = ltriangle + [2 * offset + 1, 0]
+    diamond = np.column_stack([np.array([0.5, 1, 1.5, 1, 0.5]) + offset,
+                               h * np.array([1, 2, 1, 0, 1]) + offsety])
+    return [ltriangle, rtriangle, diamond]
+
+
+def _standard():
+    """Geometry of the Piper diagram with grid lines every 20%."""
+    t = np.tan(np.pi / 3)
+    dx = 1 + 2 * offset
+    ticklabels = ['0', '20', '40', '60', '80', '100']
+    grid, ticks = [], []
+    for i, x in enumerate(np.linspace(0, 1, 6)):
+        # the left and right traingles
+        for shift in [0, dx]:
+            grid += [[(x + shift, 0), (x / 2 + shift, x / 2 * t)],
+                     [(x + shift, 0), ((1 - x) / 2 + x + shift, (1 - x) / 2 * t)],
+                     [(x / 2 + shift, x / 2 * t), (1 - x / 2 + shift, x / 2 * t)]]
+        # the diamond
+        grid += [[(0.5 + offset + 0.5 * x, h + offsety + 0.5 * x * t),
+                  (1 + offset + 0.5 * x, offsety + 0.5 * x * t)],
+                 [(0.5 + offset + 0.5 * x, h + offsety - 0.5 * x * t),
+                  (1 + offset + 0.5 * x, 2 * h + offsety - 0.5 * x * t)]]
+        if i in [1, 2, 3, 4]:
+            ticks += [
+                # the left traingle: bottom, right and left ticks
+                (x, 0 - 0.03, ticklabels[-i-1], 0),
+                ((1 - x) / 2 + x + 0.026, (1 - x) / 2 * t + 0.015, ticklabels[i], -60),
+                (x / 2 - 0.026, x / 2 * t + 0.015, ticklabels[i], 60),
+                # the right traingle: bottom, right and left ticks
+                (x + dx, 0 - 0.03, ticklabels[i], 0),
+                ((1 - x) / 2 + x + dx + 0.026, (1 - x) / 2 * t + 0.015, ticklabels[-i-1], -60),
+                (x / 2 + dx - 0.026, x / 2 * t + 0.015, ticklabels[-i-1], 60),
+                # the diamond: upper left, lower right, lower left and upper right
+                (0.5 + offset + 0.5 * x - 0.026, h + offsety + 0.5 * x * t + 0.015, ticklabels[i], 60),
+                (1 + offset + 0.5 * x + 0.026, offsety + 0.5 * x * t - 0.015, ticklabels[-i-1], 60),
+                (0.5 + offset + 0.5 * x - 0.026, h + offsety - 0.5 * x * t - 0.015, ticklabels[i], -60),
+                (1 + offset + 0.5 * x + 0.026, 2 * h + offsety - 0.5 * x * t + 0.015, ticklabels[-i-1], -60)]
+
+    c, s = np.cos(np.pi / 30), np.sin(np.pi / 30)
+    labels = [
+        (0.5, -offset, '%' + '$Ca^{2+}$', 0),
+        (1 + 2 * offset + 0.5, -offset, '%' + '$Cl^{-}$', 0),
+        (0.25 - offset * c, 0.25 * t + offset * s, '%' + '$Mg^{2+}$', 60),
+        (1.75 + 2 * offset + offset * c, 0.25 * t + offset * s, '%' + '$SO_4^{2-}$', -60),
+        (0.75 + offset * c, 0.25 * t + offset * s, '%' + '$Na^+$' + '+%' + '$K^+$', -60),
+        (1 + 2 * offset + 0.25 - offset * c, 0.25 * t + offset * s,
+         '%' + '$HCO_3^-$' + '+%' + '$CO_3^{2-}$', 60),
+        (0.5 + offset + 0.5 * offset + offset * c, h + offsety + 0.25 * t + offset * s,
+         '%' + '$SO_4^{2-}$' + '+%' + '$Cl^-$', 60),
+        (1.5 + offset - 0.25 + offset * c, h + offsety + 0.25 * t + offset * s,
+         '%' + '$Ca^{2+}$' + '+%' + '$Mg^{2+}$', -60)]
+    labels = [(x, y, text, dict(rotation=rotation, fontsize=12))
+              for x, y, text, rotation in labels]
+
+    # The water types domains
+    r = 0.5 * np.sin(np.pi / 3)
+    fills = [[(0.25, h / 2), (0.5, 0), (0.75, h / 2)],
+             [(dx + 0.25, h / 2), (dx + 0.5, 0), (dx + 0.75, h / 2)],
+             [(0.75 + offset, h + offsety - r), (1.25 + offset, h + offsety - r),
+              (1 + offset, h + offsety)],
+             [(0.75 + offset, h + offsety + r), (1 + offset, h + offsety),
+              (1.25 + offset, h + offsety + r)]]
+
+    return dict(grid=grid, linestyle=':', linewidth=1.0, ticks=ticks,
+                labels=labels, fills=fills)
+
+
+def _modified():
+    """Geometry of the Piper diagram with hydrogeochemical facies."""
+    t = np.tan(np.pi / 3)
+    dx = 1 + 2 * offset
+    ticklabels = ['0', '25', '50', '75', '100']
+
+    # The 50% lines delimiting the facies
+    x = 0.5
+    grid = []
+    for shift in [0, dx]:
+        grid += [[(x + shift, 0), (x / 2 + shift, x / 2 * t)],
+                 [(x + shift, 0), ((1 - x) / 2 + x + shift, (1 - x) / 2 * t)],
+                 [(x / 2 + shift, x / 2 * t), (1 - x / 2 + shift, x / 2 * t)]]
+    grid += [[(0.5 + offset + 0.5 * x, h + offsety + 0.5 * x * t),
+              (1 + offset + 0.5 * x, offsety + 0.5 * x * t)],
+             [(0.5 + offset + 0.5 * x, h + offsety - 0.5 * x * t),
+              (1 + offset + 0.5 * x, 2 * h + offsety - 0.5 * x * t)],
+             [(0.5 + offset + 0.5 * x, h + offsety + 0.5 * x * t),
+              (1 + offset + 0.5 * x, h + offsety + 0.5 * x * t)],
+             [(0.5 + offset + 0.5 * x, h + offsety - 0.5 * x * t),
+              (1 + offset + 0.5 * x, h + offsety - 0.5 * x * t)]]
+    # The hairlines were drawn once per tick and the diamond diagonal twice, 
+    # the overlapping strokes give them their darkness
+    grid = (grid + grid[6:7]) * 5
+
+    ticks = []
+    for i, x in enumerate(np.linspace(0, 1, 5)):
+        ticks += [
+            (x, 0 - 0.03, ticklabels[-i-1], 0),
+            ((1 - x) / 2 + x + 0.026, (1 - x) / 2 * t + 0.015, ticklabels[i], -60),
+            (x / 2 - 0.026, x / 2 * t + 0.015, ticklabels[i], 60),
+            (x + dx, 0 - 0.03, ticklabels[i], 0),
+            ((1 - x) / 2 + x + dx + 0.026, (1 - x) / 2 * t + 0.015, ticklabels[-i-1], -60),
+            (x / 2 + dx - 0.026, x / 2 * t + 0.015, ticklabels[-i-1], 60),
+            (0.5 + offset + 0.5 * x - 0.026, h + offsety + 0.5 * x * t + 0.015, ticklabels[i], 60),
+            (1 + offset + 0.5 * x + 0.026, offsety + 0.5 * x * t - 0.015, ticklabels[-i-1], 60)]
+        if i in [1, 2, 3, 4]:
+            ticks += [
+                (0.49 + offset + 0.5 * x - 0.026, h + offsety - 0.5 * x * t - 0.015, ticklabels[i], -60),
+                (1 + offset + 0.5 * x + 0.026, 2 * h + offsety - 0.5 * x * t + 0.015, ticklabels[-i-1], -60)]
+
+    c, s = np.cos(np.pi / 30), np.sin(np.pi / 30)
+    labels = [
+        (0.525, -offset, 'calcium', 0),
+        (1.015 + 2 * offset + 0.5, -offset, 'chloride', 0),
+        (0.27 - offset * c, 0.295 * t + offset * s, 'magnesium', 60),
+        (1.765 + 2 * offset + offset * c, 0.25 * t + offset * s, 'sulfate', -60),
+        (0.725 + offset * c, 0.275 * t + offset * s, 'sodium' + ' + ' + 'potassium', -60),
+        (1 + 2 * offset + 0.3 - offset * c, 0.30 * t + offset * s,
+         'bicarbonate' + ' + ' + 'carbonate', 60),
+        (0.515 + offset + 0.5 * offset + offset * c, h + offsety + 0.28 * t + offset * s,
+         'sulfate' + ' + ' + 'chloride', 60),
+        (1.5 + offset - 0.25 + offset * c, h + offsety + 0.25 * t + offset * s,
+         'calcium' + ' + ' + 'magnesium', -60)]
+    labels = [(x, y, text, dict(rotation=rotation, fontsize=10))
+              for x, y, text, rotation in labels]
+
+    # Percent labels
+    percent = dict(color='black', fontsize=12, alpha=0.95)
+    labels += [
+        (0.325 + offset * c, 0.575 * t + offset * s, 'PERCENT', dict(rotation=60, **percent)),
+        (1.675 + offset * c, 0.575 * t + offset * s, 'PERCENT', dict(rotation=-60, **percent)),
+        (1.011 + offset * c, -0.15, 'PERCENT', dict(rotation=0, **percent))]
+
+    # Hydrogeochemical facies types
+    facies = dict(fontsize=8, color='grey', alpha=0.35)
+    label_offset = 1.2
+    for x, y, text in [
+            (0.235, 0.10, '$Ca^{2+}$'),
+            (0.755, 0.10, '$Na^+$, $K^+$'),
+            (0.5, 0.25, 'Mixed'),
+            (0.5, 0.55, '$Mg^{2+}$'),
+            (label_offset + 0.235, 0.10, '$HCO_3^-$'),
+            (label_offset + 0.755, 0.10, '$Cl^-$'),
+            (label_offset + 0.5, 0.25, 'Mixed'),
+            (label_offset + 0.5, 0.55, '$SO_4^{2-}$'),
+            (-0.6 + label_offset + 0.235, -0.3 + label_offset + 0.10, '$Ca^{2+}$, $Mg^{2+}$\n$HCO_3^-$'),
+            (-0.6 + label_offset + 0.755, -0.3 + label_offset + 0.10, '$Na^+$, $K^{+}$\n$Cl^-$, $SO_4^{2-}$'),
+            (-0.6 + label_offset + 0.5, -0.15 + label_offset + 0.25, 'Mixed'),
+            (-0.6 + label_offset + 0.5, -0.70 + label_offset + 0.25, 'Mixed'),
+            (-0.6 + label_offset + 0.5, -1.05 + label_offset + 0.25, '$Na^+$, $K^{+}$\n$HCO_3^-$'),
+            (-0.6 + label_offset + 0.5, -0.2 + label_offset + 0.55, '$Ca^{2+}$, $Mg^{2+}$\n$Cl^-$, $SO_4^{2-}$')]:
+        labels.append((x, y, text, dict(ha='center', va='baseline', **facies)))
+
+    return dict(grid=grid, linestyle='--', linewidth=0.05, ticks=ticks,
+                labels=labels, fills=[])
+
+
+@functools.lru_cache(maxsize=None)
+def geometry(style='standard'):
+    """Return the static geometry of the Piper background.
+
+    The geometry is computed once per style and shared by every call, so
+    only the data layer is computed when drawing a diagram.
+
+    Parameters
+    ----------
+    style : class:`string`
+        Either 'standard', the 20% grid of the triangle, contour-filled and
+        color-coded Piper diagrams, or 'modified', the 25% ticks and 50%
+        facies lines of the modified triangle Piper diagram.
+
+    Returns
+    -------
+    A dictionary of outline, grid and fill segments, tick labels and axis
+    labels.
+    """
+    if style not in STYLES:
+        raise RuntimeError("""
+        Unknown Piper background style: %s.
+        Choose among %s.""" % (style, ', '.join(STYLES)))
+    geom = _standard() if style == 'standard' else _modified()
+    geom['outline'] = tuple(_frozen(line) for line in _outline())
+    geom['grid'] = _frozen(geom['grid'])
+    geom['fills'] = tuple(_frozen(fill) for fill in geom['fills'])
+    geom['ticks'] = tuple(geom['ticks'])
+    geom['labels'] = tuple(geom['labels'])
+    return geom
+
+
+def draw(ax, style='standard', fill=False):
+    """Draw the background of the Piper diagram.
+
+    The outline and the grid lines are drawn as two line collections
+    instead of one line per segment.
+
+    Parameters
+    ----------
+    ax : class:`matplotlib.axes.Axes`
+        The axes of the diagram.
+    style : class:`string`
+        The style of the background, see `geometry`.
+    fill : class:`bool`
+        If True, fill the domains of the water types in grey.
+    """
+    geom = geometry(style)
+
+    ax.add_collection(LineCollection(geom['outline'], colors='k',
+                                     linewidths=1.0, linestyles='-'))
+    ax.add_collection(LineCollection(geom['grid'], colors='k',
+                                     linewidths=geom['linewidth'],
+                                     linestyles=geom['linestyle']))
+    if fill:
+        ax.add_collection(PolyCollection(geom['fills'], closed=True,
+                                         facecolors=[(0.8, 0.8, 0.8)],
+                                         edgecolors=[(0.8, 0.8, 0.8)],
+                                         zorder=0))
+    ax.autoscale_view()
+
+    for x, y, text, rotation in geom['ticks']:
+        ax.text(x, y, text, ha='center', va='center', rotation=rotation)
+    for x, y, text, kwargs in geom['labels']:
+        kwargs = dict(dict(ha='center', va='center'), **kwargs)
+        ax.text(x, y, text, **kwargs)
+
+
+def coords(ions):
+    """Return the cartesian coordinates of the samples.
+
+    Parameters
+    ----------
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        The major ions of the samples.
+
+    Returns
+    -------
+    The (x, y) coordinates of the samples in the left triangle, the right
+    triangle and the diamond.
+    """
+    c = coordinates.piper(ions=ions)
+    return [(c['cat_x'], c['cat_y']), (c['an_x'], c['an_y']),
+            (c['d_x'], c['d_y'])]
+
+
+@functools.lru_cache(maxsize=None)
+def grid(nbins):
+    """Return the coordinates of a regular grid covering the diagram.
+
+    Parameters
+    ----------
+    nbins : class:`int`
+        Number of grid nodes along each axis.
+
+    Returns
+    -------
+    The x and y coordinates of the grid nodes.
+    """
+    x = np.linspace(0, 1 + 2 * offset + 1, nbins)
+    y = np.linspace(0, h * 2 + offsety, nbins)
+    return _frozen(x), _frozen(y)
+
+
+@functools.lru_cache(maxsize=None)
+def masks(nbins):
+    """Return the masks of the regions of the diagram on a regular grid.
+
+    The masks only depend on the grid resolution, so they are computed
+    once per nbins and shared by every plot.
+
+    Parameters
+    ----------
+    nbins : class:`int`
+        Number of grid nodes along each axis, see `grid`.
+
+    Returns
+    -------
+    Boolean arrays of shape (nbins, nbins) of the left triangle, the right
+    triangle and the central diamond, see `REGIONS`.
+    """
+    x, y = grid(nbins)
+    xx, yy = np.meshgrid(x, y)
+    points = np.vstack((xx.flatten(), yy.flatten())).T
+    result = []
+    for verts in REGIONS:
+        mask = Path(verts).contains_points(points).reshape(nbins, nbins)
+        mask.flags.writeable = False
+        result.append(mask)
+    return tuple(result)
@@ -0,0 +1,398 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Mon Nov 15 10:26:13 2021
+
+@author: Jing
+"""
+import os
+import glob
+import json
+import hashlib
+
+import numpy as np
+import pandas as pd
+
+from .ions import MINOR
+
+try:
+    import pyarrow.dataset as ds
+except ImportError:
+    ds = None
+
+# The columns used by the diagrams: the major ions, TDS and pH, the style
+# of the samples, and the minor species that can be folded into the major
+# ions
+COLUMNS = ['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4', 'TDS', 'pH',
+           'Label', 'Color', 'Marker', 'Size', 'Alpha'] + MINOR
+
+# The style of the samples, read for every diagram
+STYLE = ['Sample', 'Label', 'Color', 'Marker', 'Size', 'Alpha']
+
+# The measurements required by each diagram
+_MAJOR = ['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']
+REQUIRED = {
+    'triangle_piper': _MAJOR,
+    'triangle_piper_mod': _MAJOR,
+    'rectangle_piper': _MAJOR,
+    'color_piper': _MAJOR,
+    'contour_piper': _MAJOR,
+    'durov': _MAJOR + ['pH', 'TDS'],
+    'durov_mod': _MAJOR + ['pH', 'TDS'],
+    'chadha': _MAJOR,
+    'gibbs': ['Na', 'Ca', 'HCO3', 'Cl', 'TDS'],
+    'gibbs_mod': ['Na', 'Ca', 'HCO3', 'Cl', 'TDS'],
+    'gaillardet': ['Ca', 'Mg', 'Na', 'HCO3'],
+    'gaillardet_mod': ['Ca', 'Mg', 'Na', 'HCO3'],
+    'hfed': _MAJOR,
+    'hfed_mod': _MAJOR,
+    'schoeller': ['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3'],
+    'schoeller_mod': ['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3'],
+    'stiff': ['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4'],
+    'stiff_mod': ['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4'],
+    'chernoff': ['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4'],
+}
+
+# The style columns drawn by each diagram
+_MARKERS = ['Marker', 'Color', 'Size', 'Alpha']
+DRAWN = {
+    'triangle_piper': _MARKERS,
+    'triangle_piper_mod': _MARKERS,
+    'rectangle_piper': _MARKERS,
+    'color_piper': [],
+    'contour_piper': [],
+    'durov': _MARKERS,
+    'durov_mod': _MARKERS,
+    'chadha': _MARKERS,
+    'gibbs': _MARKERS,
+    'gibbs_mod': _MARKERS,
+    'gaillardet': _MARKERS,
+    'gaillardet_mod': _MARKERS,
+    'hfed': _MARKERS,
+    'hfed_mod': _MARKERS,
+    'schoeller': ['Marker', 'Color', 'Alpha'],
+    'schoeller_mod': ['Marker', 'Color', 'Alpha'],
+    'stiff': [],
+    'stiff_mod': [],
+    'chernoff': [],
+}
+
+# The directory where the parsed Excel workbooks are cached
+CACHE_DIR = os.environ.get('WQCHARTPY_CACHE',
+                           os.path.join(os.path.expanduser('~'), '.cache',
+                                        'wqchartpy'))
+
+# File extensions read as Arrow datasets, and their formats
+_ARROW = {'.parquet': 'parquet', '.pq': 'parquet',
+          '.feather': 'feather', '.arrow': 'feather', '.ipc': 'feather'}
+
+
+def required_columns(diagrams=None):
+    """Return the columns needed to draw the given diagrams.
+
+    Parameters
+    ----------
+    diagrams : class:`list`
+        Names of the diagrams, see `REQUIRED`. A single name is accepted.
+        All the columns in `COLUMNS` and `STYLE` are returned if None.
+    """
+    if diagrams is None:
+        names = COLUMNS + STYLE
+    else:
+        if isinstance(diagrams, str):
+            diagrams = [diagrams]
+        unknown = [d for d in diagrams if d not in REQUIRED]
+        if unknown:
+            raise RuntimeError("""
+        Unknown diagrams: %s.""" % ', '.join(unknown))
+        names = [c for d in diagrams for c in REQUIRED[d]] + STYLE
+    # Remove the duplicates, keeping the order
+    return list(dict.fromkeys(names))
+
+
+def read(fname, columns=None):
+    """Read a CSV, tab delimited TXT, Excel, Parquet or Arrow file.
+
+    Parameters
+    ----------
+    fname : class:`string`
+        The data file.
+    columns : class:`list`
+        Only read these columns, e.g. `required_columns('gibbs')`. Columns
+        missing from the file are ignored. All the columns are read if None.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext in _ARROW:
+        return read_parquet(fname, columns=columns)
+    usecols = None if columns is None else \
+        (lambda name, names=set(columns): name in names)
+    if ext in ['.xls', '.xlsx']:
+        return read_excel(fname, columns=columns)
+    elif ext == '.txt':
+        return pd.read_csv(fname, sep='\t', usecols=usecols)
+    else:
+        return pd.read_csv(fname, usecols=usecols)
+
+
+def _dataset(source, format=None):
+    if ds is None:
+        raise RuntimeError("""
+        Reading Parquet and Arrow files requires pyarrow.
+        Install it with pip install pyarrow.""")
+    if format is None:
+        first = source if isinstance(source, str) else source[0]
+        format = _ARROW.get(os.path.splitext(first)[1].lower(), 'parquet')
+    return ds.dataset(source, format=format)
+
+
+def _project(dataset, columns, diagrams):
+    """Keep the requested columns present in the dataset schema."""
+    if columns is None:
+        columns = required_columns(diagrams)
+    return [c for c in columns if c in dataset.schema.names]
+
+
+def read_parquet(source, diagrams=None, columns=None, format=None):
+    """Read a Parquet or Arrow (Feather) dataset, column by column.
+
+    Only the columns needed by the diagrams are read from disk, e.g.
+    Na, Ca, Cl, HCO3 and TDS plus the style columns for `gibbs`. The
+    columns are converted to NumPy one block each, without consolidating
+    them into a single 2D block, so that the ions are copied only once,
+    into the ion matrix of `wqchartpy.chemistry`.
+
+    Parameters
+    ----------
+    source : class:`string`
+        A file, a directory of files (e.g. a partitioned dataset), or a
+        list of files.
+    diagrams : class:`list`
+        Names of the diagrams to draw, see `required_columns`.
+    columns : class:`list`
+        The columns to read, instead of those needed by the diagrams.
+        Columns missing from the dataset are ignored.
+    format : class:`string`
+        Either 'parquet' or 'feather'. Guessed from the file extension
+        if None, Parquet by default.
+
+    Returns
+    -------
+    A class:`pandas.DataFrame`.
+    """
+    dataset = _dataset(source, format)
+    table = dataset.to_table(columns=_project(dataset, columns, diagrams))
+    return table.to_pandas(split_blocks=True, self_destruct=True)
+
+
+def read_parquet_chunks(source, diagrams=None, columns=None, format=None,
+                        chunksize=100000):
+    """Read a Parquet or Arrow dataset in chunks, see `read_parquet`.
+
+    The chunks can be drawn with the plot_stream() functions.
+
+    Parameters
+    ----------
+    chunksize : class:`int`
+        Maximum number of rows per chunk.
+
+    Returns
+    -------
+    An iterator of class:`pandas.DataFrame`, indexed from 0 in each chunk.
+    """
+    dataset = _dataset(source, format)
+    for batch in dataset.to_batches(
+            columns=_project(dataset, columns, diagrams),
+            batch_size=chunksize):
+        if batch.num_rows:
+            yield batch.to_pandas(split_blocks=True)
+
+
+def _digest(fname, sheet_name):
+    """SHA-256 of the content of a file and of the sheet name."""
+    h = hashlib.sha256()
+    with open(fname, 'rb') as f:
+        for block in iter(lambda: f.read(1 << 20), b''):
+            h.update(block)
+    h.update(repr(sheet_name).encode())
+    return h.hexdigest()
+
+
+def _copy_prefix(fname, sheet_name):
+    """The prefix of the cached copies of a sheet of a workbook."""
+    key = hashlib.sha256(repr((os.path.abspath(fname), sheet_name)).encode())
+    return os.path.join(CACHE_DIR, 'excel_%s_' % key.hexdigest()[:16])
+
+
+def _encode(df):
+    """Return the arrays of a NumPy archive of df, or None.
+
+    The numeric and date columns are stored as arrays, the other columns
+    as JSON in the header with the column names. None is returned if a
+    column holds other objects, e.g. dates mixed with text.
+    """
+    arrays, objects = {}, []
+    for i in range(df.shape[1]):
+        column = df.iloc[:, i]
+        if isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biufM':
+            arrays['c%d' % i] = column.values
+            objects.append(None)
+            continue
+        values = [v.item() if isinstance(v, np.generic) else v
+                  for v in column.tolist()]
+        if not all(v is None or isinstance(v, (str, int, float))
+                   for v in values):
+            return None
+        objects.append(values)
+    try:
+        header = json.dumps({'columns': list(df.columns), 'objects': objects})
+    except TypeError:
+        return None
+    arrays['header'] = np.array(header)
+    return arrays
+
+
+def _decode(archive):
+    """Return the DataFrame stored in a NumPy archive, see `_encode`."""
+    header = json.loads(str(archive['header']))
+    df = pd.DataFrame({i: archive['c%d' % i] if values is None
+                       else pd.Series(values)
+                       for i, values in enumerate(header['objects'])})
+    df.columns = pd.Index(header['columns'])
+    return df
+
+
+def _load_copy(cached):
+    """Load the cached copy of a sheet, None if there is none."""
+    try:
+        if ds is not None and os.path.exists(cached + '.parquet'):
+            return pd.read_parquet(cached + '.parquet')
+        with np.load(cached + '.npz', allow_pickle=False) as archive:
+            return _decode(archive)
+    except Exception:
+        return None
+
+
+def _save_copy(df, cached):
+    """Cache a sheet as Parquet, or as a NumPy archive without pyarrow.
+
+    Neither format can execute code when loaded, unlike a pickle.
+    """
+    tmp = cached + '.%d.tmp' % os.getpid()
+    if ds is not None:
+        try:
+            df.to_parquet(tmp)
+            os.replace(tmp, cached + '.parquet')
+            return
+        except (ValueError, TypeError, NotImplementedError):
+            # e.g. numbers and text in the same column
+            pass
+    arrays = _encode(df)
+    if arrays is not None:
+        with open(tmp, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp, cached + '.npz')
+    elif os.path.exists(tmp):
+        os.remove(tmp)
+
+
+def _prune(prefix, cached):
+    """Remove the older copies of a sheet, and the pickled copies of
+    earlier versions of WQChartPy."""
+    for path in glob.glob(glob.escape(prefix) + '*') + \
+            glob.glob(os.path.join(glob.escape(CACHE_DIR), 'excel_*.pkl')):
+        if not path.startswith(cached) and not path.endswith('.tmp'):
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+
+def read_excel(fname, sheet_name=0, columns=None, cache=True):
+    """Read a sheet of an Excel workbook, parsing the workbook only once.
+
+    Parsing a workbook is slow. The parsed sheet is stored as a Parquet
+    file, or a NumPy archive if pyarrow is not installed, in CACHE_DIR
+    (~/.cache/wqchartpy unless the WQCHARTPY_CACHE environment variable
+    is set), keyed by the SHA-256 of the workbook and its modification
+    time, so that later loads of an unchanged workbook skip the
+    spreadsheet parsing. A copy that cannot be loaded is parsed again and
+    replaced, and the copies of earlier versions of the workbook are
+    removed. Sheets mixing dates and text in a column are not cached
+    without pyarrow.
+
+    Parameters
+    ----------
+    fname : class:`string`
+        The XLS or XLSX workbook.
+    sheet_name : class:`string` or class:`int`
+        The name or the index of the sheet, the first one by default.
+    columns : class:`list`
+        Only return these columns. Columns missing from the sheet are
+        ignored. All the columns are returned if None.
+    cache : class:`bool`
+        Whether to use the cache.
+
+    Returns
+    -------
+    A class:`pandas.DataFrame`.
+    """
+    if not cache:
+        df = pd.read_excel(fname, sheet_name=sheet_name)
+    else:
+        # The whole sheet is cached, so that every selection of columns
+        # is served from the same copy
+        prefix = _copy_prefix(fname, sheet_name)
+        cached = '%s%s_%d' % (prefix, _digest(fname, sheet_name),
+                              os.stat(fname).st_mtime_ns)
+        df = _load_copy(cached)
+        if df is None:
+            df = pd.read_excel(fname, sheet_name=sheet_name)
+            # The disk cache is optional, e.g. in a read-only environment
+            try:
+                os.makedirs(CACHE_DIR, exist_ok=True)
+                _save_copy(df, cached)
+                _prune(prefix, cached)
+            except OSError:
+                pass
+
+    if columns is not None:
+        df = df[[c for c in df.columns if c in set(columns)]]
+    return df
+
+
+def read_chunks(fname, columns=None, chunksize=100000):
+    """Read a large CSV or tab delimited TXT file chunk by chunk.
+
+    Only the given columns are parsed and only one chunk is held in
+    memory at a time, so files larger than the memory can be drawn with
+    the plot_stream() functions, e.g. `triangle_piper.plot_stream`:
+
+        chunks = readers.read_chunks('export.csv')
+        triangle_piper.plot_stream(chunks, unit='mg/L')
+
+    Parameters
+    ----------
+    fname : class:`string`
+        The CSV or TXT file. TXT files are tab delimited.
+    columns : class:`list`
+        The columns to read, `COLUMNS` by default. Columns missing from
+        the file are ignored.
+    chunksize : class:`int`
+        Number of rows per chunk.
+
+    Returns
+    -------
+    An iterator of class:`pandas.DataFrame`, indexed from 0 in each chunk.
+    """
+    ext = os.path.splitext(fname)[1].lower()
+    if ext in ['.xls', '.xlsx']:
+        raise RuntimeError("""
+        Excel files cannot be read chunk by chunk.
+        Export the data to CSV or use readers.read instead.""")
+    sep = '\t' if ext == '.txt' else ','
+    columns = set(COLUMNS if columns is None else columns)
+
+    reader = pd.read_csv(fname, sep=sep, usecols=lambda name: name in columns,
+                         chunksize=chunksize)
+    with reader:
+        for chunk in reader:
+            yield chunk.reset_index(drop=True)
@@ -5,30 +5,56 @@ Created on Wed Sep 15 14:54:43 2021
 @author: Jing
 """
 # Import modules
-import os
+import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-from pylab import *
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'savefig.dpi': 300,
+    'xtick.labelsize': 12,
+    'ytick.labelsize': 12,
+    'font.size': 12,
+    'legend.fontsize': 14,
+    'figure.figsize': (15.0, 5.0),  # define size of Figure window
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE, default=False)
 def plot(df, 
          unit='mg/L', 
          figname='rectaangle Piper diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Piper diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -49,73 +75,27 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
-    # Global plot settings
+    # Plot settings
     # -------------------------------------------------------------------------
-    rc('savefig', dpi=300)
-    rc('xtick', labelsize=12)
-    rc('ytick', labelsize=12)
-    rc('font', size=12)
-    rc('legend', fontsize=14)
-    rc('figure', figsize=(15.0, 5.0)) # define size of Figure window
     markersize=4
     linewidth=2
-    xtickpositions = linspace(0, 100, 6) # desired xtickpositions for graphs
+    xtickpositions = np.linspace(0, 100, 6) # desired xtickpositions for graphs
     
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'rectangle_piper')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
-    
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+    ions = ion_matrix(df, unit, ions)
     
     # Calculate the percentages
-    # -------------------------------------------------------------------------
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
+    cat = ions.cat
+    an = ions.an
 
     # Make Figure
     # -------------------------------------------------------------------------
-    fig = plt.figure()
+    fig = rendering.figure()
             
     # CATIONS
     # -------------------------------------------------------------------------
@@ -138,32 +118,29 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                plt.scatter(100 * cat[i, 0], 100 * cat[i, 1], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-            else:
-                plt.scatter(100 * cat[i, 0], 100 * cat[i, 1], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            color=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-        except(ValueError):
-                pass
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+            vmin = np.min(df['Color'].values)
+            vmax = np.max(df['Color'].values)
+            ax1b.scatter(100 * cat[i, 0], 100 * cat[i, 1], 
+                         marker=df.at[i, 'Marker'],
+                         s=df.at[i, 'Size'], 
+                         c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                         alpha=df.at[i, 'Alpha'],
+                         label=TmpLabel, 
+                         edgecolors='black')
+        else:
+            ax1b.scatter(100 * cat[i, 0], 100 * cat[i, 1], 
+                         marker=df.at[i, 'Marker'],
+                         s=df.at[i, 'Size'], 
+                         color=df.at[i, 'Color'], 
+                         alpha=df.at[i, 'Alpha'],
+                         label=TmpLabel, 
+                         edgecolors='black')
             
     # Creat the legend
-    lgnd = legend(loc='upper left', markerscale=1, frameon=False, fontsize=12,
-                  handletextpad=-0.5, facecolor=(0.8, 0.8, 0.8))
+    lgnd = ax1b.legend(loc='upper left', markerscale=1, frameon=False, fontsize=12,
+                       handletextpad=-0.5, facecolor=(0.8, 0.8, 0.8))
     #lgnd.legendHandles[0]._sizes = [30]
     #lgnd.legendHandles[1]._sizes = [30]
     
@@ -177,7 +154,7 @@ def plot(df,
                     fontsize=12, weight='normal')
     #ax1.set_xlabel('<- Ca (% meq)')
     #ax1b.set_ylabel('Mg (% meq) ->')
-    setp(ax1, yticklabels=[])
+    ax1.set(yticklabels=[])
     
     # Reverse x axis:
     ax1.set_xlim(ax1.get_xlim()[::-1]) 
@@ -201,29 +178,26 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                plt.scatter(100 * an[i, 2], 100 * an[i, 1], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                
-            else:
-                plt.scatter(100 * an[i, 2], 100 * an[i, 1], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            color=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-        except(ValueError):
-                pass
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+            vmin = np.min(df['Color'].values)
+            vmax = np.max(df['Color'].values)
+            ax3.scatter(100 * an[i, 2], 100 * an[i, 1], 
+                        marker=df.at[i, 'Marker'],
+                        s=df.at[i, 'Size'], 
+                        c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                        alpha=df.at[i, 'Alpha'],
+                        #label=TmpLabel, 
+                        edgecolors='black')
+
+        else:
+            ax3.scatter(100 * an[i, 2], 100 * an[i, 1], 
+                        marker=df.at[i, 'Marker'],
+                        s=df.at[i, 'Size'], 
+                        color=df.at[i, 'Color'], 
+                        alpha=df.at[i, 'Alpha'],
+                        #label=TmpLabel, 
+                        edgecolors='black')
             
     # Set first axis limits and labels        
     ax3.set_xlim(0, 100)
@@ -258,30 +232,27 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                cf = ax2.scatter(100 * cat[i, 2], 100 * (an[i, 1] + an[i, 2]), 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black') 
-            else:
-                ax2.scatter(100 * cat[i, 2], 100 * (an[i, 1] + an[i, 2]), 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            color=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-    
-                
-        except(ValueError):
-                pass
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+            vmin = np.min(df['Color'].values)
+            vmax = np.max(df['Color'].values)
+            cf = ax2.scatter(100 * cat[i, 2], 100 * (an[i, 1] + an[i, 2]), 
+                        marker=df.at[i, 'Marker'],
+                        s=df.at[i, 'Size'], 
+                        c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                        alpha=df.at[i, 'Alpha'],
+                        #label=TmpLabel, 
+                        edgecolors='black') 
+        else:
+            ax2.scatter(100 * cat[i, 2], 100 * (an[i, 1] + an[i, 2]), 
+                        marker=df.at[i, 'Marker'],
+                        s=df.at[i, 'Size'], 
+                        color=df.at[i, 'Color'], 
+                        alpha=df.at[i, 'Alpha'],
+                        #label=TmpLabel, 
+                        edgecolors='black')
+
+
             
     # Set second axis limits and labels
     ax2.set_xlim(0,100)
@@ -305,18 +276,14 @@ def plot(df,
     ax2b.set_ylim(ax2b.get_ylim()[::-1])
     
     # adjust position of subplots
-    plt.subplots_adjust(left=0.05, bottom=0.2, right=0.95, top=0.90, 
+    fig.subplots_adjust(left=0.05, bottom=0.2, right=0.95, top=0.90, 
                     wspace=0.4, hspace=0.0)
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Rectangle Piper plot created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Rectangle Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
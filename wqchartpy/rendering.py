@@ -0,0 +1,272 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 10 15:02:18 2021
+
+@author: Jing
+"""
+import io
+import os
+import sys
+import importlib
+import functools
+import contextlib
+import threading
+import time
+import tracemalloc
+
+import matplotlib as mpl
+import matplotlib.style
+from matplotlib.figure import Figure
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+
+# matplotlib's rcParams and font cache are shared by the whole process,
+# so the diagrams are drawn one at a time, from the creation of the figure
+# to its encoding. The lock is reentrant, a diagram may be drawn while
+# another one holds it.
+LOCK = threading.RLock()
+
+
+@contextlib.contextmanager
+def style(rc=None, default=True):
+    """Apply the style of a diagram while it is drawn.
+
+    The rcParams are restored when leaving the context, so the style of a
+    diagram neither leaks into the user's figures nor into the next
+    diagram. The context holds `LOCK`, so diagrams drawn from several
+    threads do not see each other's style.
+
+    The lock is held for the whole diagram, including the encoding of the
+    saved figure, as matplotlib also reads the rcParams while drawing the
+    figure. Rendering diagrams from several threads is therefore safe but
+    serialized, it does not run faster than rendering them one after the
+    other. Render them in worker processes to use several CPUs, e.g. with
+    `wqchartpy.report.render`, `wqchartpy.facet.render` or the process
+    executor of `wqchartpy.aio.AsyncRenderer`.
+
+    Parameters
+    ----------
+    rc : class:`dict`
+        The rcParams of the diagram, e.g. {'font.size': 10}.
+    default : class:`bool`
+        If True, start from matplotlib's default style, otherwise from the
+        current rcParams.
+    """
+    styles = (['default'] if default else []) + ([rc] if rc else [])
+    with LOCK, mpl.style.context(styles):
+        yield
+
+
+def styled(rc=None, default=True):
+    """Decorate a plotting function to draw it within its style.
+
+    See `style` for the parameters.
+    """
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            with style(rc, default):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def figure(**kwargs):
+    """Create the figure of a diagram, drawn by the Agg canvas.
+
+    The figure is not registered with pyplot's figure manager, so no GUI
+    backend is imported, nothing needs to be closed and the memory is
+    released as soon as the figure is no longer referenced.
+
+    Parameters
+    ----------
+    kwargs : 
+        Keyword arguments passed to class:`matplotlib.figure.Figure`, 
+        e.g. figsize and dpi.
+    """
+    fig = Figure(**kwargs)
+    FigureCanvasAgg(fig)
+    return fig
+
+
+def savefig(fig,
+            figname,
+            figformat,
+            info,
+            buffer=None,
+            return_fig=False,
+            dpi=300):
+    """Save a diagram to disk or into memory.
+
+    By default the figure is saved to figname.figformat as before. If a
+    buffer is given, the encoded figure is written into it instead and
+    nothing touches the filesystem. If return_fig is True and no buffer
+    is given, the figure is not encoded at all. The figures are created
+    by `figure` outside of pyplot, so repeated calls do not accumulate
+    open figures, e.g. one per sample in the Stiff diagram.
+
+    Parameters
+    ----------
+    fig : class:`matplotlib.figure.Figure`
+        The figure of the diagram.
+    figname : class:`string`
+        A path or file name when saving the figure.
+    figformat : class:`string`
+        The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    info : class:`string`
+        Message displayed when the figure is saved to disk.
+    buffer : file-like object
+        A writable binary buffer, e.g. class:`io.BytesIO`, receiving the
+        encoded figure.
+    return_fig : class:`bool`
+        If True, return the figure.
+    dpi : class:`int`
+        The resolution in dots per inch.
+
+    Returns
+    -------
+    The figure if return_fig is True, otherwise None.
+    """
+    if buffer is not None:
+        fig.savefig(buffer, format=figformat,
+                    bbox_inches='tight', dpi=dpi)
+    elif not return_fig:
+        # Display the info
+        cwd = os.getcwd()
+        print("%s Saving it to %s \n" %(info, cwd))
+
+        # Save the figure
+        fig.savefig(figname + '.' + figformat, format=figformat,
+                    bbox_inches='tight', dpi=dpi)
+
+    return fig if return_fig else None
+
+
+def sample_buffer(buffer, sample):
+    """Return a new buffer for one sample of a per-sample diagram.
+
+    Diagrams drawing one figure per sample, such as the Stiff diagram
+    and the Chernoff faces, take a dictionary as buffer. A class:`io.BytesIO`
+    is stored in it for each sample, keyed by the sample name.
+
+    Parameters
+    ----------
+    buffer : class:`dict`
+        The dictionary receiving the buffers, or None.
+    sample : class:`string`
+        The name of the sample.
+    """
+    if buffer is None:
+        return None
+    buffer[sample] = io.BytesIO()
+    return buffer[sample]
+
+
+def _fignums():
+    """Return the numbers of the pyplot figures, if pyplot is in use."""
+    plt = sys.modules.get('matplotlib.pyplot')
+    return set() if plt is None else set(plt.get_fignums())
+
+
+class RenderSession(object):
+    """Own the lifecycle of the figures created while rendering diagrams.
+
+    A session is meant for long-running processes, e.g. a daemon rendering
+    diagrams on request. The diagrams of WQChartPy do not use pyplot, but
+    any pyplot figure left open while rendering, e.g. by a custom plot()
+    function, is closed when the diagram has been rendered, so that memory
+    does not grow with the number of requests. The peak memory allocated by Python while
+    rendering is tracked with class:`tracemalloc`.
+
+    The statistics are available in the `stats` dictionary: the number of
+    rendered diagrams, the number of figures left open by them and closed
+    by the session, the peak memory in bytes and the rendering time in
+    seconds.
+
+    Use it as a context manager:
+
+        with RenderSession() as session:
+            session.render(triangle_piper, df, figname='piper')
+            print(session.stats)
+
+    Parameters
+    ----------
+    trace_memory : class:`bool`
+        If True, track the peak memory of each diagram. Tracing slows
+        down the rendering, so it can be turned off.
+    """
+    def __init__(self, trace_memory=True):
+        self.trace_memory = trace_memory
+        self.stats = {'diagrams': 0, 'leaked': 0, 'peak_memory': 0,
+                      'time': 0.0}
+        self._tracing = False
+        self._open = False
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def open(self):
+        """Start the session."""
+        if self.trace_memory and not tracemalloc.is_tracing():
+            tracemalloc.start()
+            self._tracing = True
+        self._open = True
+
+    def close(self):
+        """Close the session and stop tracing the memory if it started it."""
+        if self._tracing:
+            tracemalloc.stop()
+            self._tracing = False
+        self._open = False
+
+    def render(self, module, df, **kwargs):
+        """Render a diagram and release all the figures it created.
+
+        Parameters
+        ----------
+        module : module or class:`string`
+            A diagram module of WQChartPy, e.g. triangle_piper, or its name.
+        df : class:`pandas.DataFrame`
+            Geochemical data to draw the diagram.
+        kwargs : 
+            Keyword arguments passed to the plot() function of the module.
+
+        Returns
+        -------
+        What the plot() function returns.
+        """
+        if not self._open:
+            raise RuntimeError("""
+        The rendering session is not open.
+        Use it in a with statement or call open() first.""")
+
+        if isinstance(module, str):
+            module = importlib.import_module('.' + module, __package__)
+
+        # Hold the lock, so that only the figures of this diagram are closed
+        with LOCK:
+            before = _fignums()
+            if self.trace_memory and hasattr(tracemalloc, 'reset_peak'):
+                # Python 3.9+, the peak is otherwise tracked since open()
+                tracemalloc.reset_peak()
+            start = time.perf_counter()
+            try:
+                result = module.plot(df, **kwargs)
+            finally:
+                # Close the figures the diagram left open
+                leaked = [num for num in _fignums() if num not in before]
+                for num in leaked:
+                    sys.modules['matplotlib.pyplot'].close(num)
+
+            self.stats['time'] += time.perf_counter() - start
+            self.stats['diagrams'] += 1
+            self.stats['leaked'] += len(leaked)
+            if self.trace_memory:
+                peak = tracemalloc.get_traced_memory()[1]
+                self.stats['peak_memory'] = max(self.stats['peak_memory'], peak)
+
+        return result
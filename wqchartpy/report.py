@@ -0,0 +1,162 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Tue Nov  9 09:21:45 2021
+
+@author: Jing
+"""
+import os
+import argparse
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+
+from .chemistry import IonMatrix, MISSING_POLICIES
+from .ions import MINOR
+from .rendering import RenderSession
+from .shared import SharedDataset, attach
+from .readers import read, required_columns
+from . import units
+
+# The diagrams that can be rendered, named after their modules
+DIAGRAMS = ['triangle_piper', 'triangle_piper_mod', 'rectangle_piper',
+            'color_piper', 'contour_piper', 'durov', 'durov_mod', 'chadha',
+            'gibbs', 'gibbs_mod', 'gaillardet', 'gaillardet_mod', 'hfed',
+            'hfed_mod', 'schoeller', 'schoeller_mod', 'stiff', 'stiff_mod',
+            'chernoff']
+
+
+def _render(name, df, unit, figname, figformat, ions):
+    """Render a single diagram, used as the task of the worker processes."""
+    with RenderSession(trace_memory=False) as session:
+        session.render(name, df, unit=unit, figname=figname,
+                       figformat=figformat, ions=ions)
+    return name
+
+
+def _render_shared(name, dataset, unit, figname, figformat):
+    """Render a single diagram of a dataset in shared memory, attached
+    by the worker process when it started."""
+    df, ions = attach(dataset)
+    return _render(name, df, unit, figname, figformat, ions)
+
+
+def render(df,
+           diagrams=None,
+           unit='mg/L',
+           outdir='.',
+           figformat='jpg',
+           workers=None,
+           missing='drop',
+           fold=None):
+    """Render several diagrams of one dataset in parallel.
+
+    The major ions are converted once and shared with every diagram. Each
+    diagram is rendered in its own worker process.
+    The dataset and its ion matrix are placed in shared memory, so the
+    worker processes read them without a copy, see
+    `wqchartpy.shared.SharedDataset`.
+    As worker processes are spawned, scripts calling this function must
+    be protected by an `if __name__ == '__main__':` guard.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data to draw the diagrams.
+    diagrams : class:`list`
+        Names of the diagrams to render, see `DIAGRAMS`. All diagrams are
+        rendered if None.
+    unit : class:`string` or class:`dict`
+        The unit used in df, see `wqchartpy.units`.
+    outdir : class:`string`
+        The directory where the figures are saved, named after the diagrams.
+    figformat : class:`string`
+        The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    workers : class:`int`
+        Number of worker processes. Defaults to the number of CPUs. With a
+        single worker the diagrams are rendered in the calling process.
+    missing : class:`string`
+        How the missing concentrations are handled: 'drop', 'zero' or
+        'balance', see `wqchartpy.chemistry.IonMatrix.fill_missing`.
+    fold : class:`bool` or class:`dict`
+        Whether to add minor species to the major ions, e.g. NO3 to Cl,
+        see `wqchartpy.chemistry.IonMatrix.from_dataframe`.
+
+    Returns
+    -------
+    The names of the rendered diagrams.
+    """
+    if diagrams is None:
+        diagrams = DIAGRAMS
+    unknown = set(diagrams) - set(DIAGRAMS)
+    if unknown:
+        raise RuntimeError("""
+        Unknown diagrams: %s.
+        Choose among %s.""" % (', '.join(sorted(unknown)), ', '.join(DIAGRAMS)))
+    if not os.path.isdir(outdir):
+        os.makedirs(outdir)
+
+    ions = IonMatrix.from_dataframe(df, unit=unit, missing=missing,
+                                    fold=fold)
+    fignames = [os.path.join(outdir, name) for name in diagrams]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    workers = min(workers, len(diagrams))
+    if workers <= 1:
+        return [_render(name, df, unit, figname, figformat, ions)
+                for name, figname in zip(diagrams, fignames)]
+
+    context = multiprocessing.get_context('spawn')
+    with SharedDataset(df, ions) as shared, \
+            ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                                initializer=attach,
+                                initargs=(shared.handle,)) as executor:
+        futures = [executor.submit(_render_shared, name, shared.name, unit,
+                                   figname, figformat)
+                   for name, figname in zip(diagrams, fignames)]
+        return [future.result() for future in futures]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m wqchartpy.report',
+        description='Render WQChartPy diagrams of one dataset in parallel.')
+    parser.add_argument('fname',
+                        help='input data file (CSV, TXT, XLSX, Parquet or Arrow)')
+    parser.add_argument('-d', '--diagrams', nargs='+', choices=DIAGRAMS,
+                        help='diagrams to render (default: all)')
+    parser.add_argument('-u', '--unit', default='mg/L',
+                        help='unit used in the data file, or "suffix" or '
+                             '"row" if the unit of each column is given as '
+                             'a suffix, e.g. "Ca (mg/L)", or in the first '
+                             'row (default: mg/L)')
+    parser.add_argument('-o', '--outdir', default='.',
+                        help='output directory (default: .)')
+    parser.add_argument('-f', '--figformat', default='jpg',
+                        help='figure format (default: jpg)')
+    parser.add_argument('-j', '--workers', type=int, default=None,
+                        help='number of worker processes (default: CPUs)')
+    parser.add_argument('-m', '--missing', default='drop',
+                        choices=MISSING_POLICIES,
+                        help='handling of the missing concentrations '
+                             '(default: drop)')
+    parser.add_argument('--fold', action='store_true',
+                        help='add the minor species to the major ions, '
+                             'e.g. NO3 to Cl')
+    args = parser.parse_args(argv)
+
+    unit = args.unit
+    if unit == 'suffix':
+        df, unit = units.from_suffixes(read(args.fname))
+    elif unit == 'row':
+        df, unit = units.from_units_row(read(args.fname))
+    else:
+        # Only read the columns used by the diagrams
+        df = read(args.fname, columns=required_columns(args.diagrams) +
+                  (MINOR if args.fold else []))
+    render(df, diagrams=args.diagrams, unit=unit, outdir=args.outdir,
+           figformat=args.figformat, workers=args.workers,
+           missing=args.missing, fold=args.fold or None)
+
+
+if __name__ == '__main__':
+    main()
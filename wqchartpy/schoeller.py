@@ -4,30 +4,45 @@ Created on Thu Sep 16 13:11:29 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
 
 # Define the plotting function
+@rendering.styled(default=False)
 def plot(df, 
          unit='mg/L', 
          figname='Schoeller diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the HFE-D  diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw HFE-D diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -44,48 +59,19 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
     
     
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'schoeller')
+
     # Convert unit if needed
-    # -------------------------------------------------------------------------
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4'],
-                         ions_WEIGHT['HCO3']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'],
-                          ions_CHARGE['Cl'],
-                          ions_CHARGE['SO4'],
-                          ions_CHARGE['HCO3']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3']].values
-        
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+    ions = ion_matrix(df, unit, ions)
+    meqL = ions.select(['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3'])
         
     # Do the plot
     # -------------------------------------------------------------------------
-    fig = plt.figure(figsize=(6, 3))
+    fig = rendering.figure(figsize=(6, 3))
     ax = fig.add_subplot(111)
     ax.semilogy()
     
@@ -99,14 +85,11 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            ax.plot([1, 2, 3, 4, 5, 6, 7], meqL[i, :], 
-                    marker=df.at[i, 'Marker'],
-                    color=df.at[i, 'Color'], 
-                    alpha=df.at[i, 'Alpha'],
-                    label=TmpLabel) 
-        except(ValueError):
-                pass
+        ax.plot([1, 2, 3, 4, 5, 6, 7], meqL[i, :], 
+                marker=df.at[i, 'Marker'],
+                color=df.at[i, 'Color'], 
+                alpha=df.at[i, 'Alpha'],
+                label=TmpLabel) 
             
     # Background settings
     ax.set_xticks([1, 2, 3, 4, 5, 6, 7])
@@ -120,21 +103,17 @@ def plot(df,
     
     # Plot the vertical lines
     for xtick in [1, 2, 3, 4, 5, 6, 7]:
-        plt.axvline(xtick, linewidth=1, color='grey', linestyle='dashed')
+        ax.axvline(xtick, linewidth=1, color='grey', linestyle='dashed')
             
     # Creat the legend
     ax.legend(loc='best', markerscale=1, frameon=False, fontsize=10,
               labelspacing=0.25, handletextpad=0.25)
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Schoeller diagram created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Schoeller diagram created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
@@ -4,30 +4,60 @@ Created on Thu Sep 16 13:11:29 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Schoeller diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the HFE-D  diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw HFE-D diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -44,63 +74,19 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
     
     
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'schoeller_mod')
+
     # Convert unit if needed
-    # -------------------------------------------------------------------------
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4'],
-                         ions_WEIGHT['HCO3']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'],
-                          ions_CHARGE['Cl'],
-                          ions_CHARGE['SO4'],
-                          ions_CHARGE['HCO3']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3']].values
-        
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-        
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
+    ions = ion_matrix(df, unit, ions)
+    meqL = ions.select(['Ca', 'Mg', 'Na', 'K', 'Cl', 'SO4', 'HCO3'])
         
     # Do the plot
     # -------------------------------------------------------------------------
-    fig = plt.figure(figsize=(8, 4))
+    fig = rendering.figure(figsize=(8, 4))
     ax = fig.add_subplot(111)
     ax.semilogy()
     
@@ -114,14 +100,11 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            ax.plot([1, 2, 3, 4, 5, 6, 7], meqL[i, :], 
-                    marker=df.at[i, 'Marker'],
-                    color=df.at[i, 'Color'], 
-                    alpha=df.at[i, 'Alpha'],
-                    label=TmpLabel) 
-        except(ValueError):
-                pass
+        ax.plot([1, 2, 3, 4, 5, 6, 7], meqL[i, :], 
+                marker=df.at[i, 'Marker'],
+                color=df.at[i, 'Color'], 
+                alpha=df.at[i, 'Alpha'],
+                label=TmpLabel) 
             
     # Background settings
     ax.set_xticks([1, 2, 3, 4, 5, 6, 7])
@@ -136,25 +119,21 @@ def plot(df,
     
     # Plot the vertical lines
     for xtick in [1, 2, 3, 4, 5, 6, 7]:
-        plt.axvline(xtick, linewidth=0.5, color='k', linestyle='--', alpha=0.25)
+        ax.axvline(xtick, linewidth=0.5, color='k', linestyle='--', alpha=0.25)
             
     # Create the legend
-    plt.legend(bbox_to_anchor=(1.05, 1.0175), markerscale=1,
-               frameon=True, edgecolor = 'black', title='Legend', fontsize=8, 
-               labelspacing=0.25, handletextpad=0.25)
+    ax.legend(bbox_to_anchor=(1.05, 1.0175), markerscale=1,
+              frameon=True, edgecolor = 'black', title='Legend', fontsize=8, 
+              labelspacing=0.25, handletextpad=0.25)
     
     
-    plt.tight_layout()
+    fig.tight_layout()
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Schoeller diagram created. Saving it to %s \n" %cwd)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Schoeller diagram created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
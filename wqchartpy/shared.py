@@ -0,0 +1,193 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Fri Nov 26 10:21:07 2021
+
+@author: Jing
+"""
+from multiprocessing import shared_memory
+
+import numpy as np
+import pandas as pd
+
+from .chemistry import IonMatrix
+
+# The alignment of the arrays in the shared memory block, in bytes
+ALIGN = 64
+
+# The quantities of the ion matrix computed once and shared with it: the
+# ion sums and the cation and anion fractions placing the samples in the
+# diagrams
+CACHED = ['sumcat', 'suman', 'cat', 'an']
+
+# The datasets attached by this process, by the name of their block
+_attached = {}
+
+
+def _shareable(column):
+    """Whether a column is stored as a plain numeric NumPy array."""
+    return isinstance(column.dtype, np.dtype) and column.dtype.kind in 'biuf'
+
+
+def _view(buf, offset, shape, dtype):
+    """Return an array of the shared memory block."""
+    return np.ndarray(shape, dtype=dtype, buffer=buf, offset=offset)
+
+
+def _encode_strings(values):
+    """Return distinct strings as UTF-8 bytes and their end offsets."""
+    encoded = [value.encode('utf-8') for value in values]
+    data = np.frombuffer(b''.join(encoded), dtype=np.uint8)
+    return data, np.cumsum([len(value) for value in encoded], dtype=np.int64)
+
+
+def _decode_strings(data, ends):
+    """Return the strings encoded by `_encode_strings`."""
+    data = data.tobytes()
+    starts = np.concatenate([[0], ends[:-1]])
+    return [data[a:b].decode('utf-8') for a, b in zip(starts, ends)]
+
+
+class SharedDataset(object):
+    """A dataset and its ion matrix placed in shared memory.
+
+    The numeric columns of the DataFrame, the meq/L matrix with the TDS
+    and pH, and the cached sums and fractions of the ions are copied once
+    into a single class:`multiprocessing.shared_memory.SharedMemory`
+    block. The other columns, e.g. Sample, Label, Color and Marker, are
+    stored as integer codes of their distinct values, the distinct
+    strings being stored in the block as well.
+
+    Worker processes receive the `handle`, a picklable description of
+    the block, once when they start, and rebuild the DataFrame and the
+    ion matrix from the block with `attach`. The numeric columns and the
+    ion matrix are read-only views of the block. The tasks then only
+    refer to the dataset by its `name`:
+
+        with SharedDataset(df, ions) as shared:
+            with ProcessPoolExecutor(initializer=attach,
+                                     initargs=(shared.handle,)) as executor:
+                executor.submit(task, shared.name)
+
+    The block is released when the dataset is closed, so close it after
+    the workers are done.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        The ion matrix converted from df.
+    """
+    def __init__(self, df, ions):
+        if len(ions) != len(df):
+            raise RuntimeError("""
+        The ion matrix and the DataFrame have different numbers of samples.""")
+        arrays, objects = {}, {}
+        for c in df.columns:
+            column = df[c]
+            if _shareable(column):
+                arrays[('column', c)] = column.values
+                continue
+            # Missing values are coded -1
+            codes, uniques = pd.factorize(column)
+            arrays[('codes', c)] = codes.astype(
+                np.int32 if len(uniques) < 2**31 else np.int64)
+            if all(isinstance(value, str) for value in uniques):
+                arrays[('strings', c)], arrays[('ends', c)] = \
+                    _encode_strings(uniques)
+                uniques = None
+            objects[c] = (column.dtype, uniques)
+        arrays[('ions', 'meqL')] = ions.meqL
+        if ions.tds is not None:
+            arrays[('ions', 'tds')] = ions.tds
+        if ions.ph is not None:
+            arrays[('ions', 'ph')] = ions.ph
+        for key in CACHED:
+            arrays[('cache', key)] = getattr(ions, key)
+
+        # Lay the arrays out one after the other in a single block
+        layout, size = {}, 0
+        for key, array in arrays.items():
+            layout[key] = (size, array.shape, array.dtype.str)
+            size += -(-array.nbytes // ALIGN) * ALIGN
+        self._shm = shared_memory.SharedMemory(create=True, size=max(size, 1))
+        for key, array in arrays.items():
+            _view(self._shm.buf, *layout[key])[...] = array
+
+        self.name = self._shm.name
+        self.handle = {'name': self.name,
+                       'layout': layout,
+                       'columns': list(df.columns),
+                       'index': df.index,
+                       'objects': objects,
+                       'dtype': ions.dtype.str,
+                       'missing': ions.missing}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
+
+    def close(self):
+        """Release the shared memory block."""
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+
+def _column(views, key, dtype, uniques, index):
+    """Rebuild a column stored as integer codes, see `SharedDataset`."""
+    if uniques is None:
+        uniques = _decode_strings(views[('strings', key)],
+                                  views[('ends', key)])
+    # The code -1 of the missing values picks the NaN appended last
+    values = np.empty(len(uniques) + 1, dtype=object)
+    values[:-1] = list(uniques)
+    values[-1] = np.nan
+    return pd.Series(values[views[('codes', key)]], index=index).astype(dtype)
+
+
+def attach(handle):
+    """Return the DataFrame and the ion matrix of a shared dataset.
+
+    The dataset is attached once per process, and later calls return the
+    same DataFrame and ion matrix, so it can be attached by the initializer
+    of a worker process and then referred to by its name in the tasks.
+
+    Parameters
+    ----------
+    handle : class:`dict` or class:`string`
+        The handle of the dataset, see `SharedDataset.handle`, or the name
+        of a dataset already attached by this process.
+
+    Returns
+    -------
+    The DataFrame and the class:`wqchartpy.chemistry.IonMatrix`.
+    """
+    if isinstance(handle, str):
+        return _attached[handle][1:]
+    name = handle['name']
+    if name not in _attached:
+        shm = shared_memory.SharedMemory(name=name)
+        views = {}
+        for key, (offset, shape, dtype) in handle['layout'].items():
+            views[key] = _view(shm.buf, offset, shape, dtype)
+            views[key].flags.writeable = False
+
+        index = handle['index']
+        objects = handle['objects']
+        df = pd.DataFrame({c: _column(views, c, *objects[c], index=index)
+                           if c in objects else views[('column', c)]
+                           for c in handle['columns']},
+                          index=index, copy=False)
+        ions = IonMatrix(views[('ions', 'meqL')],
+                         tds=views.get(('ions', 'tds')),
+                         ph=views.get(('ions', 'ph')),
+                         dtype=handle['dtype'])
+        ions._cache.update({key: views[('cache', key)] for key in CACHED})
+        ions.missing = handle['missing']
+        _attached[name] = (shm, df, ions)
+    return _attached[name][1:]
@@ -4,33 +4,63 @@ Created on Wed Sep 15 16:38:48 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
 from matplotlib.ticker import MaxNLocator
 import matplotlib as mpl
-from pylab import *
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='Stiff diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Stiff diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L is supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The file format, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : class:`dict`
+        If given, the figure of each sample is encoded into a 
+        class:`io.BytesIO` stored in this dictionary under the sample name, 
+        instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return a dictionary of the figures keyed by sample name. 
+        They are not saved to disk unless a buffer is given.
         
         
      References
@@ -50,69 +80,28 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'stiff_mod')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'],  
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4']].values
-    
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+    ions = ion_matrix(df, unit, ions)
+    meqL = ions.select(['Ca', 'Mg', 'Na', 'K', 'HCO3', 'Cl', 'SO4'])
    
     cat_max = np.max(np.array(((meqL[:, 2] + meqL[:, 3]), meqL[:, 0], meqL[:, 1])))
     an_max = np.max(meqL[:, 4:])
     
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
-    
     # Plot the Stiff diagrams for each sample
     # ------------------------------------------------------------------------- 
+    figs = {}
     Labels = []
     n_cols = 5  # Number of columns for the subplot grid
     n_plots = len(df)
     n_rows = (n_plots // n_cols) + (1 if n_plots % n_cols != 0 else 0)
     
-    fig, axs = plt.subplots(n_rows, n_cols, figsize=(n_cols*4, n_rows*4))
+    fig = rendering.figure(figsize=(n_cols*4, n_rows*4))
+    axs = fig.subplots(n_rows, n_cols)
     axs = axs.flatten()
     
     for i in range(len(df)):
@@ -122,57 +111,56 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
         
-        try:
-            x = [-(meqL[i, 2] + meqL[i, 3]), -meqL[i, 0], -meqL[i, 1], 
-                 meqL[i, 6], meqL[i, 4], meqL[i, 5], -(meqL[i, 2] + meqL[i, 3])]
-            y = [3, 2, 1, 1, 2, 3, 3]
-            
-            ax = axs[i]
-            ax.fill(x, y, facecolor='w', edgecolor='k', linewidth=1, alpha=1)
-            
-            ax.plot([0, 0], [1, 3], 'k--', linewidth=0.75, alpha=0.25)
-            ax.plot([-0.5, 0.5], [2, 2], 'k-', linewidth=0.75, alpha=0.25)
-    
-            cmax = cat_max if cat_max > an_max else an_max
-            ax.set_xlim([-cmax, cmax])
-            ax.text(-cmax, 2.9, 'Na$^+$' + '+' + 'K$^+$', fontsize=12, ha='right')
-            ax.text(-cmax, 1.9, 'Ca$^{2+}$', fontsize=12, ha='right')
-            ax.text(-cmax, 1.0, 'Mg$^{2+}$', fontsize=12, ha='right')
-            
-            ax.text(cmax, 2.9,'Cl$^-$',fontsize=12, ha='left')
-            ax.text(cmax, 1.9,'HCO'+'$_{3}^-$',fontsize=12,ha='left')
-            ax.text(cmax, 1.0,'SO'+'$_{4}^{2-}$',fontsize=12,ha='left')
-            
-            ax.spines['left'].set_color('None')
-            ax.spines['right'].set_color('None')
-            ax.spines['top'].set_color('None')
-            ax.tick_params(which='major', direction='out', length=4, width=1.25)
-            ax.tick_params(which='minor', direction='in', length=2, width=1.25)
-            ax.spines['bottom'].set_linewidth(1)
-            ax.spines['bottom'].set_color('k')
-            ax.set_yticks([])
-            ticks = np.array([-cmax, -cmax/2, 0, cmax/2, cmax])
-            tickla = [f'{tick:1.0f}' for tick in abs(ticks)]
-            ax.set_xticks(ticks)
-            ax.set_xticklabels(tickla)
-            
-            labels = ax.get_xticklabels()
-            [label.set_fontsize(10) for label in labels]
-            ax.set_xlabel('cations        $\dfrac{meq}{L}$        anions', fontsize=10, weight='normal', style='italic')
-                
-            ax.set_title(df.at[i, 'Sample'], fontsize=12, weight='normal')
-    
-        except(ValueError):
-            pass
+        x = [-(meqL[i, 2] + meqL[i, 3]), -meqL[i, 0], -meqL[i, 1], 
+             meqL[i, 6], meqL[i, 4], meqL[i, 5], -(meqL[i, 2] + meqL[i, 3])]
+        y = [3, 2, 1, 1, 2, 3, 3]
+
+        ax = axs[i]
+        ax.fill(x, y, facecolor='w', edgecolor='k', linewidth=1, alpha=1)
+
+        ax.plot([0, 0], [1, 3], 'k--', linewidth=0.75, alpha=0.25)
+        ax.plot([-0.5, 0.5], [2, 2], 'k-', linewidth=0.75, alpha=0.25)
+
+        cmax = cat_max if cat_max > an_max else an_max
+        ax.set_xlim([-cmax, cmax])
+        ax.text(-cmax, 2.9, 'Na$^+$' + '+' + 'K$^+$', fontsize=12, ha='right')
+        ax.text(-cmax, 1.9, 'Ca$^{2+}$', fontsize=12, ha='right')
+        ax.text(-cmax, 1.0, 'Mg$^{2+}$', fontsize=12, ha='right')
+
+        ax.text(cmax, 2.9,'Cl$^-$',fontsize=12, ha='left')
+        ax.text(cmax, 1.9,'HCO'+'$_{3}^-$',fontsize=12,ha='left')
+        ax.text(cmax, 1.0,'SO'+'$_{4}^{2-}$',fontsize=12,ha='left')
+
+        ax.spines['left'].set_color('None')
+        ax.spines['right'].set_color('None')
+        ax.spines['top'].set_color('None')
+        ax.tick_params(which='major', direction='out', length=4, width=1.25)
+        ax.tick_params(which='minor', direction='in', length=2, width=1.25)
+        ax.spines['bottom'].set_linewidth(1)
+        ax.spines['bottom'].set_color('k')
+        ax.set_yticks([])
+        ticks = np.array([-cmax, -cmax/2, 0, cmax/2, cmax])
+        tickla = [f'{tick:1.0f}' for tick in abs(ticks)]
+        ax.set_xticks(ticks)
+        ax.set_xticklabels(tickla)
+
+        labels = ax.get_xticklabels()
+        [label.set_fontsize(10) for label in labels]
+        ax.set_xlabel('cations        $\dfrac{meq}{L}$        anions', fontsize=10, weight='normal', style='italic')
+
+        ax.set_title(df.at[i, 'Sample'], fontsize=12, weight='normal')
+
     
     # Hide any unused subplots
     for j in range(i+1, len(axs)):
         axs[j].axis('off')
     
     # Save the combined figure
-    plt.tight_layout()
-    plt.savefig(figname + '_combined.' + figformat, format=figformat, bbox_inches='tight', dpi=300)
-    plt.show()
+    fig.tight_layout()
+    figs['combined'] = rendering.savefig(fig, figname + '_combined', figformat, 
+                                         "Combined Stiff plot created.", 
+                                         buffer=rendering.sample_buffer(buffer, 'combined'), 
+                                         return_fig=return_fig)
 
     # Plot the Stiff diagrams for each sample
     # ------------------------------------------------------------------------- 
@@ -184,64 +172,60 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
     
-        try:
-            x = [-(meqL[i, 2] + meqL[i, 3]), -meqL[i, 0], -meqL[i, 1], 
-                 meqL[i, 6], meqL[i, 4], meqL[i, 5], -(meqL[i, 2] + meqL[i, 3])]
-            y = [3, 2, 1, 1, 2, 3, 3]
-            
-            plt.figure(figsize=(3, 3))
-            plt.fill(x, y, facecolor='w', edgecolor='k', linewidth=1, alpha=1)
-            
-            plt.plot([0, 0], [1, 3], 'k--', linewidth=0.75, alpha=0.25)
-            plt.plot([-0.5, 0.5], [2, 2], 'k-', linewidth=0.75, alpha=0.25)
-  
-            cmax = cat_max if cat_max > an_max else an_max
-            plt.xlim([-cmax, cmax])
-            plt.text(-cmax, 2.9, 'Na$^+$' + '+' + 'K$^+$', fontsize=12, ha= 'right')
-            plt.text(-cmax, 1.9, 'Ca$^{2+}$', fontsize=12, ha= 'right')
-            plt.text(-cmax, 1.0, 'Mg$^{2+}$', fontsize=12, ha= 'right')
-            
-            plt.text(cmax, 2.9,'Cl$^-$',fontsize=12, ha= 'left')
-            plt.text(cmax, 1.9,'HCO'+'$_{3}^-$',fontsize=12,ha= 'left')
-            plt.text(cmax, 1.0,'SO'+'$_{4}^{2-}$',fontsize=12,ha= 'left')
-            
-            ax = plt.gca()
-            ax.spines['left'].set_color('None')
-            ax.spines['right'].set_color('None')
-            ax.spines['top'].set_color('None')
-            minorticks_off()
-            tick_params(which='major', direction='out', length=4, width=1.25)
-            tick_params(which='minor', direction='in', length=2, width=1.25)
-            ax.spines['bottom'].set_linewidth(1)
-            ax.spines['bottom'].set_color('k')
-            #ylim(0.8, 3.2)
-            setp(gca(), yticks=[], yticklabels=[])
-            #plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
-            ticks = np.array([-cmax, -cmax/2, 0, cmax/2, cmax])
-            tickla = [f'{tick:1.0f}' for tick in abs(ticks)]
-            ax.xaxis.set_ticks(ticks)
-            ax.xaxis.set_ticklabels(tickla)
-            
-            labels = ax.get_xticklabels()
-            [label.set_fontsize(10) for label in labels]
-            ax.set_xlabel('cations        $\dfrac{meq}{L}$        anions', fontsize=10, weight='normal', style='italic')
-                
-            ax.set_title(df.at[i, 'Sample'], fontsize=12, weight='normal')
-            
-            plt.tight_layout()
+        x = [-(meqL[i, 2] + meqL[i, 3]), -meqL[i, 0], -meqL[i, 1], 
+             meqL[i, 6], meqL[i, 4], meqL[i, 5], -(meqL[i, 2] + meqL[i, 3])]
+        y = [3, 2, 1, 1, 2, 3, 3]
+
+        fig = rendering.figure(figsize=(3, 3))
+        ax = fig.add_subplot()
+        ax.fill(x, y, facecolor='w', edgecolor='k', linewidth=1, alpha=1)
+
+        ax.plot([0, 0], [1, 3], 'k--', linewidth=0.75, alpha=0.25)
+        ax.plot([-0.5, 0.5], [2, 2], 'k-', linewidth=0.75, alpha=0.25)
+
+        cmax = cat_max if cat_max > an_max else an_max
+        ax.set_xlim([-cmax, cmax])
+        ax.text(-cmax, 2.9, 'Na$^+$' + '+' + 'K$^+$', fontsize=12, ha= 'right')
+        ax.text(-cmax, 1.9, 'Ca$^{2+}$', fontsize=12, ha= 'right')
+        ax.text(-cmax, 1.0, 'Mg$^{2+}$', fontsize=12, ha= 'right')
+
+        ax.text(cmax, 2.9,'Cl$^-$',fontsize=12, ha= 'left')
+        ax.text(cmax, 1.9,'HCO'+'$_{3}^-$',fontsize=12,ha= 'left')
+        ax.text(cmax, 1.0,'SO'+'$_{4}^{2-}$',fontsize=12,ha= 'left')
+
+        ax.spines['left'].set_color('None')
+        ax.spines['right'].set_color('None')
+        ax.spines['top'].set_color('None')
+        ax.minorticks_off()
+        ax.tick_params(which='major', direction='out', length=4, width=1.25)
+        ax.tick_params(which='minor', direction='in', length=2, width=1.25)
+        ax.spines['bottom'].set_linewidth(1)
+        ax.spines['bottom'].set_color('k')
+        #ylim(0.8, 3.2)
+        ax.set(yticks=[], yticklabels=[])
+        #plt.gca().xaxis.set_major_locator(MaxNLocator(integer=True))
+        ticks = np.array([-cmax, -cmax/2, 0, cmax/2, cmax])
+        tickla = [f'{tick:1.0f}' for tick in abs(ticks)]
+        ax.xaxis.set_ticks(ticks)
+        ax.xaxis.set_ticklabels(tickla)
+
+        labels = ax.get_xticklabels()
+        [label.set_fontsize(10) for label in labels]
+        ax.set_xlabel('cations        $\dfrac{meq}{L}$        anions', fontsize=10, weight='normal', style='italic')
+
+        ax.set_title(df.at[i, 'Sample'], fontsize=12, weight='normal')
+
+        fig.tight_layout()
 
-        except(ValueError):
-                pass
-    
-        # Display the info
-        cwd = os.getcwd()
-        print("Stiff plot created for %s. Saving it to %s\n" %(str(df.at[i, 'Sample']), cwd))
     
         # Save the figure
-        plt.savefig(figname + '_' + str(df.at[i, 'Sample']) + '.' + figformat, format=figformat, 
-                    bbox_inches='tight', dpi=300)
+        sample = str(df.at[i, 'Sample'])
+        figs[sample] = rendering.savefig(fig, figname + '_' + sample, figformat, 
+                                         "Stiff plot created for %s." %sample, 
+                                         buffer=rendering.sample_buffer(buffer, sample), 
+                                         return_fig=return_fig)
         
-    return
+    return figs if return_fig else None
 
 if __name__ == '__main__':
     # Example data
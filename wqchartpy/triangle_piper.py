@@ -4,31 +4,147 @@ Created on Wed Sep 15 14:34:07 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import piper_background
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 10,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 10,
+    'figure.titlesize': 10,
+    }
+
+def _scatter(ax, df, coords, label_on=1, Labels=None):
+    """Draw the samples with one collection per (Marker, Label) group.
+    
+    Each group is drawn with a single vectorized `scatter` call per 
+    sub-plot instead of one call per sample, so the number of artists 
+    scales with the number of groups rather than the number of samples.
+    
+    Parameters
+    ----------
+    ax : class:`matplotlib.axes.Axes`
+        The axes to draw on.
+    df : class:`pandas.DataFrame`
+        Geochemical data providing the Label, Color, Marker, Size and 
+        Alpha columns.
+    coords : class:`list`
+        The (x, y) coordinate arrays of every sub-plot, e.g. the cation 
+        triangle, the anion triangle and the diamond.
+    label_on : class:`int`
+        Index in coords of the sub-plot that carries the legend labels.
+    Labels : class:`list`
+        Labels already in the legend, updated in place. Used to draw a 
+        dataset chunk by chunk without repeating the legend entries.
+        
+    Returns
+    -------
+    The last collection drawn, used as the mappable of the colorbar.
+    """
+    numeric = (df['Color'].dtype is np.dtype('float')) or \
+        (df['Color'].dtype is np.dtype('int64'))
+    if numeric:
+        vmin = np.min(df['Color'].values)
+        vmax = np.max(df['Color'].values)
+        
+    sizes = df['Size'].values
+    colors = df['Color'].values
+    
+    cf = None
+    if Labels is None:
+        Labels = []
+    # The alpha of a group is a scalar, arrays need matplotlib >= 3.4
+    groups = df.groupby(['Marker', 'Label', 'Alpha'], sort=False, 
+                        dropna=False).indices
+    for (marker, label, alpha), idx in groups.items():
+        if (label in Labels or label == ''):
+            TmpLabel = ''
+        else:
+            TmpLabel = label
+            Labels.append(TmpLabel)
+        
+        kwargs = dict(marker=marker, s=sizes[idx], alpha=alpha, 
+                      edgecolors='black')
+        if numeric:
+            kwargs.update(c=colors[idx], vmin=vmin, vmax=vmax)
+        else:
+            kwargs.update(c=list(colors[idx]))
+            
+        for j, (x, y) in enumerate(coords):
+            sc = ax.scatter(x[idx], y[idx], 
+                            label=TmpLabel if j == label_on else None, 
+                            **kwargs)
+            if j == 0:
+                cf = sc
+    
+    return cf
+
+def _figure():
+    """Create the figure and draw the background of the Piper diagram."""
+    # Plot background settings
+    # -------------------------------------------------------------------------
+    # Plot the traingles, diamond, grid lines and labels
+    fig = rendering.figure(figsize=(10, 10), dpi=100)
+    ax = fig.add_subplot(111, aspect='equal', frameon=False, 
+                         xticks=[], yticks=[])
+    piper_background.draw(ax, fill=True)
+    
+    return fig, ax
+
+def _legend(ax, cf, numeric):
+    """Draw the colorbar, if the colors are numeric, and the legend."""
+    if numeric:
+        cb = ax.figure.colorbar(cf, extend='both', spacing='uniform',
+                                orientation='vertical', fraction=0.025, pad=0.05)
+        cb.ax.set_ylabel('$TDS$' + ' ' + '$(mg/L)$', rotation=90, labelpad=-75, fontsize=14)
+    
+    ax.legend(bbox_to_anchor=(0.15, 0.875), markerscale=1, fontsize=12,
+              frameon=False, 
+              labelspacing=0.25, handletextpad=0.25)
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='triangle Piper diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Piper diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L and meq/L are supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -54,288 +170,117 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
+    units.check(unit)
         
-    # Global plot settings
+    # Plot the background
     # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 10
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 10
-    plt.rcParams['figure.titlesize'] = 10   
-    
-    # Plot background settings
-    # -------------------------------------------------------------------------
-    # Define the offset between the diamond and traingle
-    offset = 0.10                         
-    offsety = offset * np.tan(np.pi / 3.0)
-    h = 0.5 * np.tan(np.pi / 3.0)
-    
-    # Calculate the traingles' location 
-    ltriangle_x = np.array([0, 0.5, 1, 0])
-    ltriangle_y = np.array([0, h, 0, 0])
-    rtriangle_x = ltriangle_x + 2 * offset + 1
-    rtriangle_y = ltriangle_y
+    fig, ax = _figure()
     
-    # Calculate the diamond's location 
-    diamond_x = np.array([0.5, 1, 1.5, 1, 0.5]) + offset
-    diamond_y = h * (np.array([1, 2, 1, 0, 1])) + (offset * np.tan(np.pi / 3))
-    
-    # Plot the traingles and diamond
-    fig = plt.figure(figsize=(10, 10), dpi=100)
-    ax = fig.add_subplot(111, aspect='equal', frameon=False, 
-                         xticks=[], yticks=[])
-    ax.plot(ltriangle_x, ltriangle_y, '-k', lw=1.0)
-    ax.plot(rtriangle_x, rtriangle_y, '-k', lw=1.0)
-    ax.plot(diamond_x, diamond_y, '-k', lw=1.0)
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'triangle_piper')
+
+    # Convert unit if needed
+    ions = ion_matrix(df, unit, ions)
     
-    # Plot the lines with interval of 20%
-    interval = 0.2
-    ticklabels = ['0', '20', '40', '60', '80', '100']
-    for i, x in enumerate(np.linspace(0, 1, int(1/interval+1))):
-        # the left traingle
-        ax.plot([x, x - x / 2.0], 
-                [0, x / 2.0 * np.tan(np.pi / 3)], 
-                'k:', lw=1.0)
-        ## the bottom ticks
-        if i in [1, 2, 3, 4]: 
-            ax.text(x, 0-0.03, ticklabels[-i-1], 
-                    ha='center', va='center')
-        ax.plot([x, (1-x)/2.0+x], 
-                 [0, (1-x)/2.0*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticks
-        if i in [1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=-60)
-        ax.plot([x/2, 1-x/2], 
-                [x/2*np.tan(np.pi/3), x/2*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x/2 - 0.026, x/2*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=60)
-        
-        # the right traingle
-        ax.plot([x+1+2*offset, x-x/2.0+1+2*offset], 
-                [0, x/2.0*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the bottom ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x+1+2*offset, 0-0.03, 
-                    ticklabels[i], ha='center', va='center')
-        ax.plot([x+1+2*offset, (1-x)/2.0+x+1+2*offset],
-                 [0, (1-x)/2.0*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the right ticks
-        if i in [1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x+1+2*offset  + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=-60)
-        ax.plot([x/2+1+2*offset, 1-x/2+1+2*offset], 
-                [x/2*np.tan(np.pi/3), x/2*np.tan(np.pi/3)], 
-                'k:', lw=1.0)
-        ## the left ticks
-        if i in [1, 2, 3, 4]:
-            ax.text(x/2+1+2*offset - 0.026, x/2*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=60)
-        
-        # the diamond
-        ax.plot([0.5+offset+0.5/(1/interval)*x/interval, 1+offset+0.5/(1/interval)*x/interval], 
-                 [h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3), offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the upper left and lower right
-        if i in [1, 2, 3, 4]: 
-            ax.text(0.5+offset+0.5/(1/interval)*x/interval  - 0.026, h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=60)
-        ax.plot([0.5+offset+0.5/(1/interval)*x/interval, 1+offset+0.5/(1/interval)*x/interval], 
-                 [h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3), 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3)], 
-                 'k:', lw=1.0)
-        ## the lower left and upper right
-        if i in [1, 2, 3, 4]:  
-            ax.text(0.5+offset+0.5/(1/interval)*x/interval- 0.026, h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=-60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=-60)
+    # Plot the scatters
+    cf = _scatter(ax, df, piper_background.coords(ions))
     
-    # Labels and title
-    plt.text(0.5, -offset, '%' + '$Ca^{2+}$', 
-             ha='center', va='center', fontsize=12)
-    plt.text(1+2*offset+0.5, -offset, '%' + '$Cl^{-}$', 
-            ha='center', va='center', fontsize=12)
-    plt.text(0.25-offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Mg^{2+}$',  
-             ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.75+2*offset+offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(0.75+offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Na^+$' + '+%' + '$K^+$',  
-              ha='center', va='center', rotation=-60, fontsize=12)
-    plt.text(1+2*offset+0.25-offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$HCO_3^-$' + '+%' + '$CO_3^{2-}$',  
-              ha='center', va='center', rotation=60, fontsize=12)
+    # Creat the legend
+    numeric = (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64'))
+    _legend(ax, cf, numeric)
     
-    plt.text(0.5+offset+0.5*offset+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$SO_4^{2-}$' + '+%' + '$Cl^-$',  
-              ha='center', va='center', rotation=60, fontsize=12)
-    plt.text(1.5+offset-0.25+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), '%' + '$Ca^{2+}$' + '+%' + '$Mg^{2+}$', 
-              ha='center', va='center', rotation=-60, fontsize=12)
+    # Save the figure
+    return rendering.savefig(fig, figname, figformat, 
+                             "Trilinear Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig)
+
+
+@rendering.styled(STYLE)
+def plot_stream(chunks, 
+                unit='mg/L', 
+                figname='triangle Piper diagram', 
+                figformat='jpg',
+                buffer=None,
+                return_fig=False):
+    """Plot the Piper diagram of a dataset read chunk by chunk.
     
-    # Fill the water types domain
-    ## the left traingle
-    plt.fill([0.25, 0.5, 0.75, 0.25], 
-             [h/2, 0, h/2, h/2], color = (0.8, 0.8, 0.8), zorder=0)
-    ## the right traingle
-    plt.fill([1+2*offset+0.25, 1+2*offset+0.5, 1+2*offset+0.75, 1+2*offset+0.25], 
-             [h/2, 0, h/2, h/2], color = (0.8, 0.8, 0.8), zorder=0)
-    ## the diamond
-    plt.fill([0.5+offset+0.25, 0.5+offset+0.25+0.5, 0.5+offset+0.25+0.25, 0.5+offset+0.25],
-             [h+offset*np.tan(np.pi/3) - 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3) - 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3), h+offset*np.tan(np.pi/3) - 0.5*np.sin(np.pi/3)], 
-             color = (0.8, 0.8, 0.8), zorder=0)
-    plt.fill([0.5+offset+0.25, 0.5+offset+0.25+0.25, 0.5+offset+0.25+0.5, 0.5+offset+0.25],
-             [h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3), h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3)], 
-             color = (0.8, 0.8, 0.8), zorder=0)
+    Only one chunk of data is held in memory at a time, see 
+    `wqchartpy.readers.read_chunks`. The samples of each chunk are drawn 
+    as soon as the chunk is read, and numeric colors share one color 
+    scale across all the chunks.
     
-    # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
+    Parameters
+    ----------
+    chunks : iterable of class:`pandas.DataFrame`
+        Chunks of geochemical data, e.g. from `readers.read_chunks`.
+    unit : class:`string` or class:`dict`
+        The unit used in the chunks, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
+    figname : class:`string`
+        A path or file name when saving the figure.
+    figformat : class:`string`
+        The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
+    """
+    # Determine if the provided unit is allowed
+    units.check(unit)
     
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
+    # Plot the background
+    # -------------------------------------------------------------------------
+    fig, ax = _figure()
     
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
+    # Plot the scatters chunk by chunk
+    cf = None
+    numeric = False
+    vmin, vmax = np.inf, -np.inf
+    Labels = []
+    quarantine, total = [], 0
+    for df in chunks:
+        if not {'Ca', 'Mg', 'Na', 'K', 
+                'HCO3', 'CO3', 'Cl', 'SO4'}.issubset(df.columns):
+            raise RuntimeError("""
+        Trilinear Piper diagram requires geochemical parameters:
+        Ca, Mg, Na, K, HCO3, CO3, Cl, and SO4.
+        Confirm that these parameters are provided in the input file.""")
+        mask, report = validation.validate(df, 'triangle_piper')
+        quarantine.append(report)
+        total += len(df)
+        df, _ = validation.take(df, mask)
+        if len(df) == 0:
+            continue
         
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
+        chunk_cf = _scatter(ax, df, piper_background.coords(ion_matrix(df, unit)), Labels=Labels)
+        if cf is None:
+            cf = chunk_cf
+        if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
+            numeric = True
+            vmin = min(vmin, np.min(df['Color'].values))
+            vmax = max(vmax, np.max(df['Color'].values))
     
-    else:
+    if quarantine:
+        validation.warn(pd.concat(quarantine), total)
+    if cf is None:
         raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
+        None of the samples is valid, see wqchartpy.validation.validate.""")
     
-    # Calculate the percentages
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:8], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
-
-    # Convert into cartesian coordinates
-    cat_x = 0.5 * (2 * cat[:, 2] + cat[:, 1])
-    cat_y = h * cat[:, 1]
-    an_x = 1 + 2 * offset + 0.5 * (2 * an[:, 2] + an[:, 1])
-    an_y = h * an[:, 1]
-    d_x = an_y / (4 * h) + 0.5 * an_x - cat_y / (4 * h) + 0.5 * cat_x
-    d_y = 0.5 * an_y + h * an_x + 0.5 * cat_y - h * cat_x
-
-    # Plot the scatters
-    Labels = []
-    for i in range(len(df)):
-        if (df.at[i, 'Label'] in Labels or df.at[i, 'Label'] == ''):
-            TmpLabel = ''
-        else:
-            TmpLabel = df.at[i, 'Label']
-            Labels.append(TmpLabel)
-         
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                cf = plt.scatter(cat_x[i], cat_y[i], 
-                                marker=df.at[i, 'Marker'],
-                                s=df.at[i, 'Size'], 
-                                c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                                alpha=df.at[i, 'Alpha'],
-                                #label=TmpLabel, 
-                                edgecolors='black')
-                plt.scatter(an_x[i], an_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(d_x[i], d_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                
-            else:
-                plt.scatter(cat_x[i], cat_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(an_x[i], an_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(d_x[i], d_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                
-        except(ValueError):
-            pass
-            
+    if numeric:
+        # Share the color scale of all the chunks
+        for collection in ax.collections:
+            if collection.get_array() is not None:
+                collection.set_clim(vmin, vmax)
+        
     # Creat the legend
-    if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
-        cb = plt.colorbar(cf, extend='both', spacing='uniform',
-                          orientation='vertical', fraction=0.025, pad=0.05)
-        cb.ax.set_ylabel('$TDS$' + ' ' + '$(mg/L)$', rotation=90, labelpad=-75, fontsize=14)
-    
-    plt.legend(bbox_to_anchor=(0.15, 0.875), markerscale=1, fontsize=12,
-               frameon=False, 
-               labelspacing=0.25, handletextpad=0.25)
-    
-    # Display the info
-    cwd = os.getcwd()
-    print("Trilinear Piper plot created. Saving it to %s \n" %cwd)
+    _legend(ax, cf, numeric)
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=300)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Trilinear Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig)
 
 if __name__ == '__main__':
     # Example data
@@ -4,31 +4,62 @@ Created on Wed Sep 15 14:34:07 2021
 
 @author: Jing
 """
-import os
 import numpy as np
 import pandas as pd
-import matplotlib.pyplot as plt
-import matplotlib as mpl
 
-from .ions import ions_WEIGHT, ions_CHARGE
+from .chemistry import ion_matrix
+from . import validation
+from . import units
+from . import rendering
+from . import piper_background
+from . import coordinates
+
+# The style of the diagram, applied while it is drawn, see
+# `rendering.style`
+STYLE = {
+    'font.style': 'normal',
+    'font.family': 'Times New Roman',
+    'font.size': 10,
+    'axes.labelsize': 10,
+    'axes.labelweight': 'bold',
+    'axes.titlesize': 12,
+    'xtick.labelsize': 10,
+    'ytick.labelsize': 10,
+    'legend.fontsize': 12,
+    'figure.titlesize': 12,
+    }
 
 # Define the plotting function
+@rendering.styled(STYLE)
 def plot(df, 
          unit='mg/L', 
          figname='triangle Piper diagram', 
-         figformat='jpg'):
+         figformat='jpg',
+         ions=None,
+         buffer=None,
+         return_fig=False):
     """Plot the Piper diagram.
     
     Parameters
     ----------
     df : class:`pandas.DataFrame`
         Geochemical data to draw Gibbs diagram.
-    unit : class:`string`
-        The unit used in df. Currently only mg/L and meq/L are supported. 
+    unit : class:`string` or class:`dict`
+        The unit used in df, e.g. 'mg/L', 'meq/L', 'mmol/L' or 'µg/L',
+        or the unit of each ion, see `wqchartpy.units`.
     figname : class:`string`
         A path or file name when saving the figure.
     figformat : class:`string`
         The figure format to be saved, e.g. 'png', 'pdf', 'svg'
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        Ion matrix previously converted from df, e.g. to share the 
+        conversion between several diagrams. Converted from df if None.
+    buffer : file-like object
+        If given, the figure is encoded into this writable binary buffer, 
+        e.g. class:`io.BytesIO`, instead of being saved to disk.
+    return_fig : class:`bool`
+        If True, return the figure. It is not saved to disk unless a 
+        buffer is given.
         
         
     References
@@ -54,183 +85,15 @@ def plot(df,
         Confirm that these parameters are provided in the input file.""")
         
     # Determine if the provided unit is allowed
-    ALLOWED_UNITS = ['mg/L', 'meq/L']
-    if unit not in ALLOWED_UNITS:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit manually if needed.""")
-        
-    # Global plot settings
-    # -------------------------------------------------------------------------
-    # Change default settings for figures
-    plt.style.use('default')
-    plt.rcParams['font.style'] = 'normal'
-    plt.rcParams["font.family"] = 'Times New Roman'
-    plt.rcParams['font.size'] = 10
-    plt.rcParams['axes.labelsize'] = 10
-    plt.rcParams['axes.labelweight'] = 'bold'
-    plt.rcParams['axes.titlesize'] = 12
-    plt.rcParams['xtick.labelsize'] = 10
-    plt.rcParams['ytick.labelsize'] = 10
-    plt.rcParams['legend.fontsize'] = 12
-    plt.rcParams['figure.titlesize'] = 12   
+    units.check(unit)
     
     # Plot background settings
     # -------------------------------------------------------------------------
-    # Define the offset between the diamond and traingle
-    offset = 0.10                         
-    offsety = offset * np.tan(np.pi / 3.0)
-    h = 0.5 * np.tan(np.pi / 3.0)
-    
-    # Calculate the traingles' location 
-    ltriangle_x = np.array([0, 0.5, 1, 0])
-    ltriangle_y = np.array([0, h, 0, 0])
-    rtriangle_x = ltriangle_x + 2 * offset + 1
-    rtriangle_y = ltriangle_y
-    
-    # Calculate the diamond's location 
-    diamond_x = np.array([0.5, 1, 1.5, 1, 0.5]) + offset
-    diamond_y = h * (np.array([1, 2, 1, 0, 1])) + (offset * np.tan(np.pi / 3))
-    
-    # Plot the traingles and diamond
-    fig = plt.figure(figsize=(10, 10), dpi=100)
+    # Plot the traingles, diamond, grid lines and labels
+    fig = rendering.figure(figsize=(10, 10), dpi=100)
     ax = fig.add_subplot(111, aspect='equal', frameon=False, 
                          xticks=[], yticks=[])
-    ax.plot(ltriangle_x, ltriangle_y, '-k', lw=1.0)
-    ax.plot(rtriangle_x, rtriangle_y, '-k', lw=1.0)
-    ax.plot(diamond_x, diamond_y, '-k', lw=1.0)
-    
-    # Plot the lines with interval of 20%
-    interval = 0.25
-    ticklabels = ['0', '25', '50', '75','100']
-    ticklength = 0.03
-    x_50 = 0.5
-    for i, x in enumerate(np.linspace(0, 1, int(1/interval+1))):
-        # the left triangle
-        ax.plot([x_50, x_50 - x_50 / 2.0], 
-                [0, x_50 / 2.0 * np.tan(np.pi / 3)], 
-                'k--', lw=0.05)        
-
-        ## the bottom ticks
-        if i in [0, 1, 2, 3, 4]: 
-            ax.text(x, 0-0.03, ticklabels[-i-1], 
-                    ha='center', va='center')
-        ax.plot([x_50, (1-x_50)/2.0+x_50], 
-                  [0, (1-x_50)/2.0*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        ## the right ticks
-        if i in [0, 1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=-60)
-        ax.plot([x_50/2, 1-x_50/2], 
-                [x_50/2*np.tan(np.pi/3), x_50/2*np.tan(np.pi/3)], 
-                'k--', lw=0.05)
-        ## the left ticks
-        if i in [0, 1, 2, 3, 4]:
-            ax.text(x/2 - 0.026, x/2*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[i], ha='center', va='center', rotation=60)
-        # the right traingle
-        ax.plot([x_50+1+2*offset, x_50-x_50/2.0+1+2*offset], 
-                [0, x_50/2.0*np.tan(np.pi/3)], 
-                'k--', lw=0.05)
-        ## the bottom ticks
-        if i in [0, 1, 2, 3, 4]:
-            ax.text(x+1+2*offset, 0-0.03, 
-                    ticklabels[i], ha='center', va='center')
-        ax.plot([x_50+1+2*offset, (1-x_50)/2.0+x_50+1+2*offset],
-                  [0, (1-x_50)/2.0*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        ## the right ticks
-        if i in [0, 1, 2, 3, 4]:
-            ax.text((1-x)/2.0+x+1+2*offset  + 0.026, (1-x)/2.0*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=-60)
-        ax.plot([x_50/2+1+2*offset, 1-x_50/2+1+2*offset], 
-                [x_50/2*np.tan(np.pi/3), x_50/2*np.tan(np.pi/3)], 
-                'k--', lw=0.05)
-        ## the left ticks
-        if i in [0, 1, 2, 3, 4]:
-            ax.text(x/2+1+2*offset - 0.026, x/2*np.tan(np.pi/3) + 0.015, 
-                    ticklabels[-i-1], ha='center', va='center', rotation=60)
-        
-        # the diamond
-        ax.plot([0.5+offset+0.5/(1/interval)*x_50/interval, 1+offset+0.5/(1/interval)*x_50/interval], 
-                  [h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3), offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        ## the upper left and lower right
-        if i in [0, 1, 2, 3, 4]: 
-            ax.text(0.5+offset+0.5/(1/interval)*x/interval  - 0.026, h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, offset*np.tan(np.pi/3)+0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=60)
-        ax.plot([0.5+offset+0.5/(1/interval)*x_50/interval, 1+offset+0.5/(1/interval)*x_50/interval], 
-                  [h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x_50/interval*np.tan(np.pi/3), 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x_50/interval*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        
-        # the diamond
-        ax.plot([0.5+offset+0.5/(1/interval)*x_50/interval, 1+offset+0.5/(1/interval)*x_50/interval], 
-                  [h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3), offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-
-        ax.plot([0.5+offset+0.5/(1/interval)*x_50/interval, 1+offset+0.5/(1/interval)*x_50/interval], 
-                  [h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3), h+offset*np.tan(np.pi/3)+0.5/(1/interval)*x_50/interval*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        
-        ax.plot([0.5+offset+0.5/(1/interval)*x_50/interval, 1+offset+0.5/(1/interval)*x_50/interval], 
-                  [h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x_50/interval*np.tan(np.pi/3), h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x_50/interval*np.tan(np.pi/3)], 
-                  'k--', lw=0.05)
-        
-        ## the lower left and upper right
-        if i in [1, 2, 3, 4]:  
-            ax.text(0.49+offset+0.5/(1/interval)*x/interval- 0.026, h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) - 0.015, ticklabels[i], 
-                    ha='center', va='center', rotation=-60)
-            ax.text(1+offset+0.5/(1/interval)*x/interval + 0.026, 2*h+offset*np.tan(np.pi/3)-0.5/(1/interval)*x/interval*np.tan(np.pi/3) + 0.015, ticklabels[-i-1], 
-                    ha='center', va='center', rotation=-60)
-    
-    # Labels and title
-    plt.text(0.525, -offset, 'calcium', 
-             ha='center', va='center', fontsize=10)
-    plt.text(1.015+2*offset+0.5, -offset, 'chloride', 
-            ha='center', va='center', fontsize=10)
-    plt.text(0.27-offset*np.cos(np.pi/30), 0.295*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'magnesium',  
-             ha='center', va='center', rotation=60, fontsize=10)
-    plt.text(1.765+2*offset+offset*np.cos(np.pi/30), 0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'sulfate',  
-              ha='center', va='center', rotation=-60, fontsize=10)
-    plt.text(0.725+offset*np.cos(np.pi/30), 0.275*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'sodium' + ' + ' + 'potassium',  
-              ha='center', va='center', rotation=-60, fontsize=10)
-    plt.text(1+2*offset+0.3-offset*np.cos(np.pi/30), 0.30*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'bicarbonate' + ' + ' + 'carbonate',  
-              ha='center', va='center', rotation=60, fontsize=10)
-    
-    plt.text(0.515+offset+0.5*offset+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.28*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'sulfate' + ' + ' + 'chloride',  
-              ha='center', va='center', rotation=60, fontsize=10)
-    plt.text(1.5+offset-0.25+offset*np.cos(np.pi/30), h+offset*np.tan(np.pi/3)+0.25*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'calcium' + ' + ' + 'magnesium', 
-              ha='center', va='center', rotation=-60, fontsize=10)
-    
-    # Plot Percent Labels
-    plt.text(0.325+offset*np.cos(np.pi/30), 0.575*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'PERCENT',  
-              color = 'black', ha='center', va='center', rotation=60, fontsize=12, alpha=0.95)
-    plt.text(1.675+offset*np.cos(np.pi/30), 0.575*np.tan(np.pi/3)+offset*np.sin(np.pi/30), 'PERCENT',  
-              color = 'black', ha='center', va='center', rotation=-60, fontsize=12, alpha=0.95)
-    plt.text(1.011+offset*np.cos(np.pi/30), -0.15, 'PERCENT',  
-              color = 'black', ha='center', va='center', rotation=0, fontsize=12, alpha=0.95)
-    
-    # Plot Hydrogeochemical Facies Types
-    plt.text(0.235, 0.10, '$Ca^{2+}$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(0.755, 0.10, '$Na^+$, $K^+$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(0.5, 0.25, 'Mixed', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(0.5, 0.55, '$Mg^{2+}$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    
-    label_offset = 1.2
-    plt.text(label_offset + 0.235, 0.10, '$HCO_3^-$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(label_offset + 0.755, 0.10, '$Cl^-$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(label_offset + 0.5, 0.25, 'Mixed', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(label_offset + 0.5, 0.55, '$SO_4^{2-}$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    
-    plt.text(-0.6 + label_offset + 0.235, -0.3 + label_offset + 0.10, '$Ca^{2+}$, $Mg^{2+}$\n$HCO_3^-$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(-0.6 + label_offset + 0.755, -0.3 + label_offset + 0.10, '$Na^+$, $K^{+}$\n$Cl^-$, $SO_4^{2-}$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(-0.6 + label_offset + 0.5, -0.15 + label_offset + 0.25, 'Mixed', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(-0.6 + label_offset + 0.5, -0.70 + label_offset + 0.25, 'Mixed', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(-0.6 + label_offset + 0.5, -1.05 + label_offset + 0.25, '$Na^+$, $K^{+}$\n$HCO_3^-$', fontsize=8, ha='center', color='grey', alpha=0.35)
-    plt.text(-0.6 + label_offset + 0.5, -0.2 + label_offset + 0.55, '$Ca^{2+}$, $Mg^{2+}$\n$Cl^-$, $SO_4^{2-}$', fontsize=8, ha='center', color='grey', alpha=0.35)
+    piper_background.draw(ax, style='modified')
     
     # # Fill the water types domain
     # # the left traingle
@@ -247,58 +110,14 @@ def plot(df,
     #           [h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3), h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3), h+offset*np.tan(np.pi/3) + 0.5*np.sin(np.pi/3)], 
     #           color = (0.8, 0.8, 0.8), zorder=0, alpha=0.15)
     
+    # Quarantine the invalid samples up front
+    df, ions = validation.clean(df, ions, 'triangle_piper_mod')
+
     # Convert unit if needed
-    if unit == 'mg/L':
-        gmol = np.array([ions_WEIGHT['Ca'], 
-                         ions_WEIGHT['Mg'], 
-                         ions_WEIGHT['Na'], 
-                         ions_WEIGHT['K'], 
-                         ions_WEIGHT['HCO3'],
-                         ions_WEIGHT['CO3'], 
-                         ions_WEIGHT['Cl'], 
-                         ions_WEIGHT['SO4']])
-    
-        eqmol = np.array([ions_CHARGE['Ca'], 
-                          ions_CHARGE['Mg'], 
-                          ions_CHARGE['Na'], 
-                          ions_CHARGE['K'], 
-                          ions_CHARGE['HCO3'], 
-                          ions_CHARGE['CO3'], 
-                          ions_CHARGE['Cl'], 
-                          ions_CHARGE['SO4']])
-    
-        tmpdf = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']]
-        dat = tmpdf.values
-        
-        meqL = (dat / abs(gmol)) * abs(eqmol)
-        
-    elif unit == 'meq/L':
-        meqL = df[['Ca', 'Mg', 'Na', 'K', 'HCO3', 'CO3', 'Cl', 'SO4']].values
+    ions = ion_matrix(df, unit, ions)
     
-    else:
-        raise RuntimeError("""
-        Currently only mg/L and meq/L are supported.
-        Convert the unit if needed.""")
-    
-    # Calculate the percentages
-    sumcat = np.sum(meqL[:, 0:4], axis=1)
-    suman = np.sum(meqL[:, 4:8], axis=1)
-    cat = np.zeros((dat.shape[0], 3))
-    an = np.zeros((dat.shape[0], 3))
-    cat[:, 0] = meqL[:, 0] / sumcat                  # Ca
-    cat[:, 1] = meqL[:, 1] / sumcat                  # Mg
-    cat[:, 2] = (meqL[:, 2] + meqL[:, 3]) / sumcat   # Na+K
-    an[:, 0] = (meqL[:, 4] + meqL[:, 5]) / suman     # HCO3 + CO3
-    an[:, 2] = meqL[:, 6] / suman                    # Cl
-    an[:, 1] = meqL[:, 7] / suman                    # SO4
-
     # Convert into cartesian coordinates
-    cat_x = 0.5 * (2 * cat[:, 2] + cat[:, 1])
-    cat_y = h * cat[:, 1]
-    an_x = 1 + 2 * offset + 0.5 * (2 * an[:, 2] + an[:, 1])
-    an_y = h * an[:, 1]
-    d_x = an_y / (4 * h) + 0.5 * an_x - cat_y / (4 * h) + 0.5 * cat_x
-    d_y = 0.5 * an_y + h * an_x + 0.5 * cat_y - h * cat_x
+    cat_x, cat_y, an_x, an_y, d_x, d_y = coordinates.piper(ions=ions).values()
 
     # Plot the scatters
     Labels = []
@@ -309,81 +128,74 @@ def plot(df,
             TmpLabel = df.at[i, 'Label']
             Labels.append(TmpLabel)
          
-        try:
-            if (df['Color'].dtype is np.dtype('float')) or \
-                (df['Color'].dtype is np.dtype('int64')):
-                vmin = np.min(df['Color'].values)
-                vmax = np.max(df['Color'].values)
-                cf = plt.scatter(cat_x[i], cat_y[i], 
-                                marker=df.at[i, 'Marker'],
-                                s=df.at[i, 'Size'], 
-                                c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                                alpha=df.at[i, 'Alpha'],
-                                #label=TmpLabel, 
-                                edgecolors='black')
-                plt.scatter(an_x[i], an_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(d_x[i], d_y[i], 
+        if (df['Color'].dtype is np.dtype('float')) or \
+            (df['Color'].dtype is np.dtype('int64')):
+            vmin = np.min(df['Color'].values)
+            vmax = np.max(df['Color'].values)
+            cf = ax.scatter(cat_x[i], cat_y[i], 
                             marker=df.at[i, 'Marker'],
                             s=df.at[i, 'Size'], 
                             c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
                             alpha=df.at[i, 'Alpha'],
                             #label=TmpLabel, 
                             edgecolors='black')
-                
-            else:
-                plt.scatter(cat_x[i], cat_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(an_x[i], an_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            label=TmpLabel, 
-                            edgecolors='black')
-                plt.scatter(d_x[i], d_y[i], 
-                            marker=df.at[i, 'Marker'],
-                            s=df.at[i, 'Size'], 
-                            c=df.at[i, 'Color'], 
-                            alpha=df.at[i, 'Alpha'],
-                            #label=TmpLabel, 
-                            edgecolors='black')
-                
-        except(ValueError):
-            pass
+            ax.scatter(an_x[i], an_y[i], 
+                       marker=df.at[i, 'Marker'],
+                       s=df.at[i, 'Size'], 
+                       c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                       alpha=df.at[i, 'Alpha'],
+                       label=TmpLabel, 
+                       edgecolors='black')
+            ax.scatter(d_x[i], d_y[i], 
+                       marker=df.at[i, 'Marker'],
+                       s=df.at[i, 'Size'], 
+                       c=df.at[i, 'Color'], vmin=vmin, vmax=vmax,
+                       alpha=df.at[i, 'Alpha'],
+                       #label=TmpLabel, 
+                       edgecolors='black')
+
+        else:
+            ax.scatter(cat_x[i], cat_y[i], 
+                       marker=df.at[i, 'Marker'],
+                       s=df.at[i, 'Size'], 
+                       c=df.at[i, 'Color'], 
+                       alpha=df.at[i, 'Alpha'],
+                       #label=TmpLabel, 
+                       edgecolors='black')
+            ax.scatter(an_x[i], an_y[i], 
+                       marker=df.at[i, 'Marker'],
+                       s=df.at[i, 'Size'], 
+                       c=df.at[i, 'Color'], 
+                       alpha=df.at[i, 'Alpha'],
+                       label=TmpLabel, 
+                       edgecolors='black')
+            ax.scatter(d_x[i], d_y[i], 
+                       marker=df.at[i, 'Marker'],
+                       s=df.at[i, 'Size'], 
+                       c=df.at[i, 'Color'], 
+                       alpha=df.at[i, 'Alpha'],
+                       #label=TmpLabel, 
+                       edgecolors='black')
+
             
     # Creat the legend
     if (df['Color'].dtype is np.dtype('float')) or (df['Color'].dtype is np.dtype('int64')):
-        cb = plt.colorbar(cf, extend='both', spacing='uniform',
+        cb = fig.colorbar(cf, extend='both', spacing='uniform',
                           orientation='vertical', fraction=0.025, pad=0.05)
         cb.ax.set_ylabel('$TDS$' + ' ' + '$(mg/L)$', rotation=90, labelpad=-75, fontsize=14)
     
-    plt.legend(bbox_to_anchor=(1.05, 1.035), markerscale=1, fontsize=10,
-               frameon=True, edgecolor = 'black', title='Legend', 
-               labelspacing=0.25, handletextpad=0.25)
+    ax.legend(bbox_to_anchor=(1.05, 1.035), markerscale=1, fontsize=10,
+              frameon=True, edgecolor = 'black', title='Legend', 
+              labelspacing=0.25, handletextpad=0.25)
     
-    # Display the info
-    cwd = os.getcwd()
-    print("Trilinear Piper plot created. Saving it to %s \n" %cwd)
     
     # Tighten up the figure
-    plt.tight_layout()
+    fig.tight_layout()
     
     # Save the figure
-    plt.savefig(figname + '.' + figformat, format=figformat, 
-                bbox_inches='tight', dpi=400)
-    
-    return
+    return rendering.savefig(fig, figname, figformat, 
+                             "Trilinear Piper plot created.", 
+                             buffer=buffer, return_fig=return_fig, dpi=400)
 
 if __name__ == '__main__':
     # Example data
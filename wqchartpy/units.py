@@ -0,0 +1,191 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Thu Nov 18 10:05:21 2021
+
+@author: Jing
+"""
+import re
+
+import numpy as np
+import pandas as pd
+
+from .ions import ions_WEIGHT, ions_CHARGE
+
+# The supported units and their scale to mg/L, mmol/L and meq/L
+_MASS = {'mg/L': 1, 'ppm': 1, 'g/L': 1e3,
+         'µg/L': 1e-3, 'ug/L': 1e-3, 'ppb': 1e-3}
+_MOLAR = {'mmol/L': 1, 'mol/L': 1e3, 'µmol/L': 1e-3, 'umol/L': 1e-3}
+_EQUIVALENT = {'meq/L': 1, 'eq/L': 1e3, 'µeq/L': 1e-3, 'ueq/L': 1e-3}
+UNITS = list(_MASS) + list(_MOLAR) + list(_EQUIVALENT)
+
+# A unit given as a column suffix, e.g. 'Ca (mg/L)' or 'Ca [mmol/L]'
+_SUFFIX = re.compile(r'^\s*(.+?)\s*[\(\[]\s*([^\)\]]+?)\s*[\)\]]\s*$')
+
+
+def _normalize(unit):
+    """Accept the micro sign and the Greek mu, and 'l' for 'L'."""
+    unit = str(unit).strip().replace('μ', 'µ')
+    if unit.endswith('/l'):
+        unit = unit[:-2] + '/L'
+    return unit
+
+
+def check(unit):
+    """Raise a RuntimeError if a unit, or a dictionary of units, is not
+    supported.
+
+    Parameters
+    ----------
+    unit : class:`string` or class:`dict`
+        A unit in `UNITS`, or the unit of each ion, e.g.
+        {'Ca': 'mg/L', 'HCO3': 'mmol/L'}.
+    """
+    given = unit.values() if isinstance(unit, dict) else [unit]
+    unknown = [u for u in given if _normalize(u) not in UNITS]
+    if unknown:
+        raise RuntimeError("""
+        Unsupported units: %s.
+        Use one of %s.""" % (', '.join(map(str, unknown)), ', '.join(UNITS)))
+
+
+def factor(unit, ion):
+    """The factor converting a concentration of an ion into meq/L.
+
+    Parameters
+    ----------
+    unit : class:`string`
+        A unit in `UNITS`.
+    ion : class:`string`
+        The name of the ion, see `wqchartpy.ions`.
+    """
+    unit = _normalize(unit)
+    if unit in _EQUIVALENT:
+        return _EQUIVALENT[unit]
+    charge = abs(ions_CHARGE[ion])
+    if unit in _MOLAR:
+        return _MOLAR[unit] * charge
+    if unit in _MASS:
+        return _MASS[unit] * charge / ions_WEIGHT[ion]
+    check(unit)
+
+
+def factors(unit, ions):
+    """The factors converting the concentrations of ions into meq/L.
+
+    Parameters
+    ----------
+    unit : class:`string` or class:`dict`
+        The unit of all the ions, or the unit of each ion. Ions missing
+        from the dictionary are in mg/L.
+    ions : class:`list`
+        Names of the ions.
+
+    Returns
+    -------
+    A class:`numpy.ndarray` of one factor per ion, to be broadcast over
+    the rows of a concentration matrix.
+    """
+    check(unit)
+    if isinstance(unit, dict):
+        return np.array([factor(unit.get(ion, 'mg/L'), ion) for ion in ions])
+    return np.array([factor(unit, ion) for ion in ions])
+
+
+def convert(values, ions, unit, to='meq/L'):
+    """Convert a matrix of concentrations in one broadcast operation.
+
+    Parameters
+    ----------
+    values : class:`numpy.ndarray`
+        Concentrations, one row per sample and one column per ion.
+    ions : class:`list`
+        Names of the ions of the columns.
+    unit : class:`string` or class:`dict`
+        The unit of the values, or the unit of each ion.
+    to : class:`string` or class:`dict`
+        The unit of the result, or the unit of each ion.
+    """
+    return np.asarray(values, dtype=float) * \
+        (factors(unit, ions) / factors(to, ions))
+
+
+def tds_factor(unit):
+    """The factor converting TDS into mg/L, the unit used by the diagrams.
+
+    Parameters
+    ----------
+    unit : class:`string`
+        A mass unit in `UNITS`, e.g. mg/L, ppm or µg/L.
+    """
+    unit = _normalize(unit)
+    if unit not in _MASS:
+        raise RuntimeError("""
+        TDS must be given in a mass unit, e.g. mg/L, ppm or µg/L.""")
+    return _MASS[unit]
+
+
+def _tds(df, unit):
+    """Convert the TDS column to mg/L, the unit used by the diagrams."""
+    factor = tds_factor(unit)
+    if factor != 1:
+        df['TDS'] = pd.to_numeric(df['TDS'], errors='coerce') * factor
+
+
+def from_suffixes(df):
+    """Read the units given as column suffixes, e.g. 'Ca (mg/L)'.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data with the units in the column names.
+
+    Returns
+    -------
+    The DataFrame with the suffixes removed from the column names, and
+    the dictionary of the unit of each ion, to be passed as the unit of
+    the diagrams. TDS is converted to mg/L.
+    """
+    names, units = {}, {}
+    for column in df.columns:
+        match = _SUFFIX.match(str(column))
+        if match and _normalize(match.group(2)) in UNITS:
+            names[column] = match.group(1)
+            units[match.group(1)] = _normalize(match.group(2))
+    df = df.rename(columns=names)
+    if 'TDS' in units:
+        _tds(df, units.pop('TDS'))
+    units = {ion: u for ion, u in units.items() if ion in ions_WEIGHT}
+    check(units)
+    return df, units
+
+
+def from_units_row(df):
+    """Read the units given in the first row of a dataset.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data whose first row holds the unit of each column,
+        blank for the columns without units.
+
+    Returns
+    -------
+    The DataFrame without the units row and with numeric measurements,
+    and the dictionary of the unit of each ion, to be passed as the unit
+    of the diagrams. TDS is converted to mg/L.
+    """
+    row = df.iloc[0]
+    units = {column: _normalize(row[column]) for column in df.columns
+             if isinstance(row[column], str) and row[column].strip()}
+    df = df.iloc[1:].reset_index(drop=True)
+    for column in units:
+        if column in ions_WEIGHT or column == 'TDS':
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    for column in ['pH', 'Size', 'Alpha']:
+        if column in df.columns:
+            df[column] = pd.to_numeric(df[column], errors='coerce')
+    if 'TDS' in units:
+        _tds(df, units['TDS'])
+    units = {ion: u for ion, u in units.items() if ion in ions_WEIGHT}
+    check(units)
+    return df, units
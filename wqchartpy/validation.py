@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+"""
+Created on Wed Nov 17 09:41:52 2021
+
+@author: Jing
+"""
+import os
+import sys
+import warnings
+
+import numpy as np
+import pandas as pd
+import matplotlib.colors as mcolors
+from matplotlib.markers import MarkerStyle
+
+from .chemistry import IONS, CATIONS, ANIONS
+from .readers import REQUIRED, DRAWN
+
+# The directory of the package. The warnings point at the first caller
+# outside of it
+_PACKAGE = os.path.dirname(os.path.abspath(__file__)) + os.sep
+
+
+def _valid_marker(marker):
+    try:
+        MarkerStyle(marker)
+    except (ValueError, TypeError):
+        return False
+    return True
+
+
+def _valid_color(color):
+    if isinstance(color, (int, float, np.number)) and \
+            not isinstance(color, bool):
+        return bool(np.isfinite(color))
+    return mcolors.is_color_like(color)
+
+
+def _valid_values(series, func):
+    """Apply func once per distinct value of a column."""
+    codes, uniques = pd.factorize(series, use_na_sentinel=False)
+    valid = np.array([func(value) for value in uniques], dtype=bool)
+    return valid[codes]
+
+
+def validate(df, diagram=None, ions=None):
+    """Check every sample of a dataset at once.
+
+    The samples are checked for missing, non-numeric and negative
+    measurements, zero cation or anion sums, pH outside 0-14, and
+    invalid Marker, Color, Size and Alpha values. Each check is computed
+    for all the samples in a single vectorized pass, and the style
+    columns are checked once per distinct value. Only the style columns
+    drawn by the diagram are checked, see `wqchartpy.readers.DRAWN`.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    diagram : class:`string`
+        Name of the diagram, see `wqchartpy.readers.REQUIRED`, to only
+        check the measurements and the style columns it uses. The eight
+        major ions and all the style columns are checked if None.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        A previously converted ion matrix of df, or None. The ions are
+        then checked in the matrix, e.g. after its missing concentrations
+        have been filled, see `IonMatrix.fill_missing`.
+
+    Returns
+    -------
+    A boolean array of the valid samples, and the quarantine report: a
+    class:`pandas.DataFrame` of the invalid samples, indexed as df, with
+    the Sample names if available and the reasons for quarantine.
+    """
+    if diagram is None:
+        columns = CATIONS + ANIONS
+        styles = ['Marker', 'Color', 'Size', 'Alpha']
+    elif diagram in REQUIRED:
+        columns = REQUIRED[diagram]
+        styles = DRAWN[diagram]
+    else:
+        raise RuntimeError("""
+        Unknown diagram: %s.""" % diagram)
+    if ions is not None and len(ions) != len(df):
+        raise RuntimeError("""
+        The ion matrix and the DataFrame have different numbers of samples.""")
+    columns = [c for c in columns if c in df.columns or
+               (ions is not None and c in IONS)]
+
+    checks = {}
+    values = {}
+    for column in columns:
+        if ions is not None and column in IONS:
+            value = ions[column]
+            checks['missing ' + column] = np.isnan(value)
+            with np.errstate(invalid='ignore'):
+                checks['negative ' + column] = value < 0
+            values[column] = value
+            continue
+        raw = df[column]
+        value = pd.to_numeric(raw, errors='coerce').values.astype(float)
+        missing = raw.isna().values
+        checks['missing ' + column] = missing
+        checks['non-numeric ' + column] = np.isnan(value) & ~missing
+        with np.errstate(invalid='ignore'):
+            checks['negative ' + column] = value < 0
+        values[column] = value
+
+    # Zero sums give undefined cation or anion fractions
+    for name, group in [('cation', CATIONS), ('anion', ANIONS)]:
+        group = [ion for ion in group if ion in values]
+        if group:
+            total = np.nansum([values[ion] for ion in group], axis=0)
+            checks['zero %s sum' % name] = total == 0
+
+    if 'pH' in values:
+        with np.errstate(invalid='ignore'):
+            checks['pH out of range'] = (values['pH'] < 0) | \
+                (values['pH'] > 14)
+
+    # The style of the samples, if drawn by the diagram
+    styles = [c for c in styles if c in df.columns]
+    if 'Marker' in styles:
+        checks['invalid Marker'] = ~_valid_values(df['Marker'], _valid_marker)
+    if 'Color' in styles:
+        checks['invalid Color'] = ~_valid_values(df['Color'], _valid_color)
+    for column, low, high in [('Size', 0, np.inf), ('Alpha', 0, 1)]:
+        if column in styles:
+            value = pd.to_numeric(df[column], errors='coerce').values
+            with np.errstate(invalid='ignore'):
+                checks['invalid ' + column] = ~((value >= low) &
+                                                (value <= high))
+
+    failed = pd.DataFrame(checks, index=df.index)
+    mask = ~failed.values.any(axis=1) if checks else \
+        np.ones(len(df), dtype=bool)
+
+    failed = failed[~mask]
+    report = pd.DataFrame(index=failed.index)
+    if 'Sample' in df.columns:
+        report['Sample'] = df['Sample'][~mask]
+    report['Reason'] = ['; '.join(failed.columns[row]) for row in
+                        failed.values]
+    return mask, report
+
+
+def _stacklevel():
+    """The stack level of the first caller outside of the package, for a
+    warning issued by the function calling this one."""
+    level, frame = 2, sys._getframe(2)
+    while frame is not None and \
+            os.path.abspath(frame.f_code.co_filename).startswith(_PACKAGE):
+        level += 1
+        frame = frame.f_back
+    return level
+
+
+def warn(report, total):
+    """Warn about the quarantined samples, see `validate`.
+
+    The warning points at the first caller outside of WQChartPy, e.g. the
+    line calling plot(), whether the diagram is drawn directly, within a
+    `wqchartpy.rendering.RenderSession` or by `wqchartpy.report`.
+
+    Parameters
+    ----------
+    report : class:`pandas.DataFrame`
+        The quarantine report.
+    total : class:`int`
+        The number of samples checked.
+    """
+    if len(report):
+        reasons = report['Reason'].str.split('; ').explode().value_counts()
+        message = ('%d of %d samples quarantined (%s). Call '
+                   'wqchartpy.validation.validate for the report.'
+                   % (len(report), total, ', '.join(
+                       '%s: %d' % item for item in reasons.items())))
+        if sys.version_info >= (3, 12):
+            warnings.warn(message, stacklevel=2,
+                          skip_file_prefixes=(_PACKAGE,))
+        else:
+            warnings.warn(message, stacklevel=_stacklevel())
+
+
+def take(df, mask, ions=None):
+    """Keep the samples of a dataset selected by a mask.
+
+    The measurements of the returned DataFrame are numeric and its rows
+    are numbered from 0.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    mask : class:`numpy.ndarray`
+        Boolean array of the samples to keep, see `validate`.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        A previously converted ion matrix of df, or None.
+
+    Returns
+    -------
+    The selected samples of df and of ions.
+    """
+    if not mask.all():
+        if ions is not None:
+            ions = ions.take(mask)
+        df = df[mask]
+
+    df = df.reset_index(drop=True)
+    measured = [c for c in CATIONS + ANIONS + ['TDS', 'pH']
+                if c in df.columns and not
+                pd.api.types.is_numeric_dtype(df[c])]
+    if measured:
+        df = df.assign(**{c: pd.to_numeric(df[c], errors='coerce')
+                          for c in measured})
+    return df, ions
+
+
+def clean(df, ions=None, diagram=None, return_mask=False):
+    """Keep the valid samples of a dataset, see `validate` and `take`.
+
+    A warning summarizes the quarantined samples.
+
+    Parameters
+    ----------
+    df : class:`pandas.DataFrame`
+        Geochemical data.
+    ions : class:`wqchartpy.chemistry.IonMatrix`
+        A previously converted ion matrix of df, or None.
+    diagram : class:`string`
+        Name of the diagram.
+    return_mask : class:`bool`
+        If True, also return the boolean array of the valid samples, e.g.
+        to map results back to the rows of df.
+
+    Returns
+    -------
+    The valid samples of df and of ions, and the mask if return_mask is
+    True.
+    """
+    mask, report = validate(df, diagram, ions)
+    if not mask.any():
+        raise RuntimeError("""
+        None of the samples is valid, see wqchartpy.validation.validate.""")
+    warn(report, len(df))
+    df, ions = take(df, mask, ions)
+    return (df, ions, mask) if return_mask else (df, ions)